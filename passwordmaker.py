@@ -49,348 +49,213 @@ It can be used both on the command-line and with a GUI based on TKinter.
 
 
 import argparse
-import datetime
+from collections import deque
+import json
 import sys
 
-try:
-    import tkinter as tk
-    from tkinter import simpledialog, messagebox
-except ImportError:
-    tk = None
-
 import attr
 
-from pwmlib import ALGORITHMS, LEET_OPTIONS
-from pwmlib import generatepasswordfrom, PwmSettingsList, PwmSettings
-
-
-class TextWidget(tk.Entry, object):
-    """Text entry widget
+from pwmlib import PwmSettingsList, PwmSettings, ColumnarPwmSettingsList
+from pwmlib import generate_many_parallel, settings_from_overrides
+from pwmlib import enable_stats
 
-    Interfaces: get, set
-
-    """
 
-    def set(self, value):
-        """Sets current text"""
+STREAM_FORMATS = ("jsonl", "csv")
 
-        self.delete(0, "end")
-        self.insert(0, value)
 
+def get_cli_url(url, username, modifier):
+    """Returns URL setting as built by the command line
 
-class PasswordWidget(TextWidget):
-    """Password entry widget
-
-    Interfaces: get, set
+    The command line has always appended username and modifier to the URL,
+    so that they enter the hashed data twice. All command line modes do the
+    same, so that the same options yield the same password.
 
     """
 
-    def __init__(self, parent, *args, **kwargs):
-        kwargs.update({'show': "*"})
-
-        super(PasswordWidget, self).__init__(parent, *args, **kwargs)
+    return url + username + modifier
 
 
-class IntWidget(tk.Spinbox, object):
-    """Spinbox widget for Integers
+def load_profile(name, directory="."):
+    """Returns PwmSettings of profile name, reads only its setting file
 
-    Interfaces: get, set
+    If there is no setting file for the profile "default" then default
+    settings are returned. Other missing profiles raise a ValueError.
 
     """
 
-    def __init__(self, parent, *args, **kwargs):
-        kwargs.update({'from_': 1, "to": 128})
-        super(IntWidget, self).__init__(parent, *args, **kwargs)
+    settings_list = PwmSettingsList()
+    settings_list.load(directory, names=[name])
 
-    def get(self):
-        return int(super(IntWidget, self).get())
+    if name not in settings_list.pwm_names:
+        raise ValueError("Unknown profile: {}".format(name))
 
-    def set(self, value):
-        """Sets current text"""
+    settings_list.current = name
+    return settings_list.get_pwm_settings()
 
-        self.delete(0, "end")
-        self.insert(0, value)
 
+def get_profile_for_url(url, client=False, socket_path=None, directory="."):
+    """Returns name of the profile for url, None if there is none
 
-class AlgorithmWidget(tk.OptionMenu, object):
-    """OptionMenu widget for Algorithms
-
-    Interfaces: get, set
+    If client is True then the daemon at socket_path is asked. Otherwise,
+    the profiles in directory are indexed.
 
     """
 
-    def __init__(self, parent):
-        self.alg = tk.StringVar(parent)
-        super(AlgorithmWidget, self).__init__(parent, self.alg, "md5",
-                                              *ALGORITHMS[1:])
-
-    def get(self):
-        """Returns the current algorithm as string"""
-
-        return self.alg.get()
-
-    def set(self, value):
-        """Sets current algorithm"""
-
-        assert value in ALGORITHMS
-        self.alg.set(value)
-
-
-class UseLeetWidget(tk.OptionMenu, object):
-    """OptionMenu widget for l33t speech usage
-
-    Interfaces: get, set
-
-    """
+    if client:
+        from pwmserver import PwmClient
 
-    def __init__(self, parent):
-        self.leet_usage = tk.StringVar(parent)
-        super(UseLeetWidget, self).__init__(parent, self.leet_usage, "none",
-                                            *LEET_OPTIONS[1:])
+        with PwmClient(socket_path) as pwm_client:
+            return pwm_client.for_url(url)
 
-    def get(self):
-        """Returns the current algorithm as string"""
+    from pwmindex import UrlIndex
 
-        return self.leet_usage.get()
+    settings_list = ColumnarPwmSettingsList()
+    settings_list.load(directory)
+    return UrlIndex.from_settings_list(settings_list).lookup(url)
 
-    def set(self, value):
-        """Sets current algorithm"""
 
-        assert value in LEET_OPTIONS
-        self.leet_usage.set(value)
+def normalize_rows(rows):
+    """Yields rows with the URL value reduced to its registrable domain"""
 
+    from pwmurl import normalize_url
 
-class Application(tk.Frame):
-    """Main application window class"""
-
-    type2widget = {
-        "str": TextWidget,
-        "pwd": PasswordWidget,
-        "int": IntWidget,
-        "alg": AlgorithmWidget,
-        "l3t": UseLeetWidget,
-    }
-
-    timeout = datetime.timedelta(minutes=5)
-
-    def __init__(self, root=None):
-        self.root = root
-        tk.Frame.__init__(self, root)
-        self.background = root.cget("background")
-
-        self.last_event_time = datetime.datetime.now()
-
-        self.settings_list = PwmSettingsList()
-        self.settings = self.settings_list.get_pwm_settings()
-
-        self.create_widgets()
-        self.layout()
-
-        self.load()
-
-        self.autoclose()
-
-    def create_widgets(self):
-        """Creates all widgets in main window"""
-
-        self.bind_all("<Button>", self.on_event)
-        self.bind_all("<Key>", self.on_event)
-
-        # Entry widgets
-
-        self.labels = []
-        self.entry_widgets = []
-
-        for setting in attr.fields(PwmSettings):
-            self.labels.append(tk.Label(self, justify="left",
-                                        text=setting.metadata["guitext"]))
-
-            widget = self.type2widget[setting.type](self)
-            widget.set(self.settings[setting.name])
-            self.entry_widgets.append(widget)
-
-        # Buttons
-
-        self.generate_button = tk.Button(self, text="Generate",
-                                         command=self.generate)
-        self.load_button = tk.Button(self, text="Load", command=self.load)
-        self.save_button = tk.Button(self, text="Save", command=self.save)
-        self.passwd_label = tk.Label(self, justify="left", text="Password")
-        self.listbox_label = tk.Label(self, justify="left", text="Settings")
-        self.listbox = tk.Listbox(self)
-        self.listbox.bind('<<ListboxSelect>>', self.on_listbox)
-        self.listbox.insert("end", "default")
-        self.listbox.select_set(0)
-        self.new_setting_button = tk.Button(self, text="+",
-                                            command=self.new_setting)
-        self.delete_setting_button = tk.Button(self, text="-",
-                                               command=self.del_setting)
-
-        self.passwd_text = tk.Entry(self, fg="blue")
-
-    def layout(self):
-        """Places widgets on the grid"""
-
-        self.grid(sticky="nsew")
-        self.top = self.root.winfo_toplevel()
-        self.top.rowconfigure(0, weight=1)
-        self.top.columnconfigure(0, weight=1)
-        self.columnconfigure(0, weight=0)
-        self.columnconfigure(1, weight=1)
-        self.columnconfigure(2, weight=1)
-
-        for i, label in enumerate(self.labels):
-            label.grid(row=i, column=0, sticky="w", padx=5, pady=2)
-
-        for i, entry_widget in enumerate(self.entry_widgets):
-            entry_widget.grid(row=i, column=1, columnspan=2, sticky="we")
-
-        self.rowconfigure(i+1, weight=1)
-
-        self.generate_button.grid(row=i+1, column=1, columnspan=2, pady=5,
-                                  sticky="nsew")
-        self.load_button.grid(row=i+2, column=1, columnspan=1, pady=5,
-                              sticky="we")
-        self.save_button.grid(row=i+2, column=2, columnspan=1, pady=5,
-                              sticky="we")
-        self.listbox_label.grid(row=i+3, column=0, sticky="nw", padx=5, pady=2)
-        self.listbox.grid(row=i+3, rowspan=3, column=1, columnspan=2,
-                          sticky="nsew")
-        self.new_setting_button.grid(row=i+4, column=0, sticky="n", padx=5,
-                                     pady=2)
-        self.delete_setting_button.grid(row=i+5, column=0, sticky="n",
-                                        padx=5, pady=2)
-        self.passwd_label.grid(row=i+6, column=0, sticky="w", padx=5, pady=2)
-        self.passwd_text.grid(row=i+6, column=1, columnspan=2, sticky="nsew")
-
-    def update_settings(self):
-        """Updates self.settings from entry widget values"""
-
-        attr_fields = attr.fields(PwmSettings)
-        for setting, widget in zip(attr_fields, self.entry_widgets):
-            self.settings.__setattr__(setting.name, widget.get())
+    for row in rows:
+        url = row.get("URL")
+        # Other types are left for the settings validation to reject
+        if url and isinstance(url, (str, type(u""))):
+            row = dict(row, URL=normalize_url(url))
+        yield row
 
-    def update_widgets(self):
-        """Updates widgets from current self.settings"""
 
-        self.settings = self.settings_list.get_pwm_settings()
+def stream(stream_format, master_password, jobs=1,
+           infile=sys.stdin, outfile=sys.stdout, profile=None,
+           normalize_urls=False):
+    """Generates passwords for settings override rows from infile
 
-        for setting, widget in zip(attr.fields(PwmSettings),
-                                   self.entry_widgets):
-            widget.set(self.settings[setting.name])
+    Rows are either JSON objects, one per line, or CSV rows with a header
+    line. Keys are PwmSettings attribute names. Empty CSV cells are ignored.
+    One result is written to outfile per row in the same format as soon as
+    it is ready. Defaults are taken from profile or, if it is None, from the
+    current profile. If normalize_urls is True then URLs are reduced to
+    their registrable domain first. As on the command line, username and
+    modifier are appended to the URL, so that rows yield the same passwords
+    as the equivalent command line options.
 
-    def update_listbox(self):
-        """Updates listbox from self.settings_list"""
+    Invalid rows yield an error record instead of a password, i.e.
+    {"error": "..."} or a CSV row with an empty password and the message,
+    and later rows are processed. Returns the number of invalid rows.
 
-        self.listbox.delete(0, "end")
-        for pwm_name in self.settings_list.pwm_names:
-            self.listbox.insert("end", pwm_name)
-            self.listbox.select_set(0)
-
-    def save(self):
-        """Saves settings to json file"""
-
-        self.update_settings()
-        self.settings_list.save()
-
-    def load(self):
-        """Loads settings from json file"""
-
-        self.settings_list.load()
-
-        self.update_listbox()
-        self.update_widgets()
-
-    def on_listbox(self, event):
-        """Listbox event handler"""
-
-        self.update_settings()
+    """
 
-        widget = event.widget
-        if not widget.curselection():
-            # Empty cell
-            return
-        index = int(widget.curselection()[0])
-        value = widget.get(index)
+    if profile is None:
+        settings_list = PwmSettingsList()
+        settings_list.load()
+        settings = settings_list.get_pwm_settings()
+    else:
+        settings = load_profile(profile)
 
-        self.settings_list.current = value
-        self.update_widgets()
+    defaults = attr.evolve(settings, MasterPass=master_password)
 
-    def new_setting(self):
-        """Adds pwm setting to self.settings_list"""
+    if stream_format == "jsonl":
+        lines = (line for line in infile if line.strip())
+        parse = json.loads
 
-        name = None
-        while name is None or not name or name in self.settings_list.pwm_names:
-            name = simpledialog.askstring("Create new settings set", "Name")
-            if name is None:
-                return
+        def write(password):
+            """Writes password as JSON object line"""
 
-        self.settings_list.pwm_names.append(name)
-        self.settings_list.pwms.append(PwmSettings())
+            outfile.write(json.dumps({"password": password}) + "\n")
 
-        self.update_listbox()
+        def write_error(msg):
+            """Writes error message as JSON object line"""
 
-    def del_setting(self):
-        """deletes setting from listbox and fromk settings_list"""
+            outfile.write(json.dumps({"error": msg}) + "\n")
 
-        index = int(self.listbox.curselection()[0])
-        value = self.listbox.get(index)
-        if value == "default":
-            return
+    elif stream_format == "csv":
+        import csv
 
-        # Check if the setting is intentionally being deleted
-        msgbox = messagebox.askyesno
-        if not msgbox("Delete setting",
-                      "Do you want to permanently delete the setting?"):
-            return
+        lines = csv.DictReader(infile)
+        writer = csv.writer(outfile, lineterminator="\n")
 
-        pwm_idx = self.settings_list.pwm_names.index(value)
-        self.settings_list.pwm_names.pop(pwm_idx)
-        self.settings_list.pwms.pop(pwm_idx)
-        if self.settings_list.current == value:
-            self.settings_list.current = "default"
+        def parse(row):
+            """Returns row without empty cells"""
 
-        self.listbox.delete(index)
-        self.listbox.select_set(0)
+            return dict((key, value) for key, value in row.items()
+                        if value != "")
 
-    def generate(self):
-        """Generates and prints password and copies it to the clipboard"""
+        def write(password):
+            """Writes password as CSV row"""
 
-        self.update_settings()
-        self.generate_button.flash()
+            writer.writerow([password])
 
-        pwd = generatepasswordfrom(self.settings)
+        def write_error(msg):
+            """Writes CSV row with empty password and error message"""
 
-        current_passwd = self.passwd_text.get()
-        if current_passwd:
-            self.passwd_text.delete(0, len(current_passwd))
-        self.passwd_text.insert(0, pwd[:2]+"*"*(len(pwd)-2))
-        self.clipboard_clear()
-        self.clipboard_append(pwd)
+            writer.writerow(["", msg])
 
-    def on_event(self, event):
-        """Mouse click and key event handler"""
+    else:
+        raise ValueError("Unknown stream format: {}".format(stream_format))
+
+    # Errors of rows before the next password, None marks a password
+    results = deque()
+    n_errors = [0]
+
+    def gen_settings():
+        """Generator of settings of the valid rows, queues results"""
+
+        for row_no, line in enumerate(lines, 1):
+            try:
+                row = parse(line)
+                if not isinstance(row, dict):
+                    raise TypeError("Row is no JSON object")
+                if normalize_urls:
+                    row = next(normalize_rows([row]))
+                settings = next(settings_from_overrides([row], defaults))
+                if len(settings.CharacterSet) < 2:
+                    msg = "The charset {} contains less than 2 characters."
+                    raise ValueError(msg.format(settings.CharacterSet))
+            except (ValueError, TypeError) as err:
+                results.append("Row {}: {}".format(row_no, err))
+                n_errors[0] += 1
+                continue
+
+            results.append(None)
+            yield attr.evolve(settings, URL=get_cli_url(
+                settings.URL, settings.Username, settings.Modifier))
+
+    def write_errors():
+        """Writes queued errors up to the next password"""
+
+        while results and results[0] is not None:
+            write_error(results.popleft())
+
+    # Small chunks keep the delay low if rows arrive slowly
+    for password in generate_many_parallel(gen_settings(), jobs=jobs,
+                                           chunk_size=16):
+        write_errors()
+        results.popleft()
+        write(password)
+        outfile.flush()
+
+    write_errors()
+    outfile.flush()
+
+    return n_errors[0]
 
-        self.last_event_time = datetime.datetime.now()
 
-    def autoclose(self):
-        """Close application if nothing has changed for 2 min"""
+def gui():
+    """Run application in GUI
 
-        now = datetime.datetime.now()
-        if now - self.last_event_time < self.timeout:
-            self.after(self.timeout.seconds * 1000, self.autoclose)
-        else:
-            self.clipboard_clear()
-            self.quit()
+    The GUI modules are only imported here so that the command line does
+    not depend on tkinter.
 
+    """
 
-def gui():
-    """Run application in GUI"""
+    try:
+        import pwmgui
+    except ImportError as err:
+        sys.exit("The GUI is unavailable: {}".format(err))
 
-    root = tk.Tk()
-    app = Application(root=root)
-    app.master.title("PasswordMaker")
-    app.mainloop()
+    pwmgui.gui()
 
 
 def cmd():
@@ -406,38 +271,198 @@ def cmd():
             cmd1 = setting.metadata["cmd1"]
             cmd2 = setting.metadata["cmd2"]
             dest = setting.name
-            default = setting.default
             __help = setting.metadata["help"]
-            parser.add_argument(cmd1, cmd2, dest=dest, default=default,
-                                help=__help)
+            if setting.name == "URL":
+                # Multiple URLs yield one password each
+                parser.add_argument(cmd1, cmd2, dest=dest, default=None,
+                                    action="append", help=__help)
+            else:
+                # Defaults are set after parsing, so that options that are
+                # given explicitly can be told apart, e.g. for --client
+                parser.add_argument(cmd1, cmd2, dest=dest,
+                                    default=argparse.SUPPRESS, help=__help)
+
+        parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=1,
+                            help="Number of worker processes for multiple "
+                                 "URLs (default 1)")
+        parser.add_argument("--stream", dest="stream", default=None,
+                            choices=STREAM_FORMATS,
+                            help="Read settings overrides from stdin, one "
+                                 "row per password, and write passwords to "
+                                 "stdout. Defaults are taken from the "
+                                 "default profile.")
+        parser.add_argument("--serve", dest="serve", action="store_true",
+                            help="Run as daemon that serves passwords for "
+                                 "all profiles over a Unix socket")
+        parser.add_argument("--watch", dest="watch", action="store_true",
+                            help="With --serve, reload setting files that "
+                                 "change while serving")
+        parser.add_argument("--client", dest="client", action="store_true",
+                            help="Get passwords from a running daemon")
+        parser.add_argument("--socket", dest="socket", default=None,
+                            help="Socket path for --serve and --client")
+        parser.add_argument("--for-url", dest="for_url", default=None,
+                            metavar="URL",
+                            help="Print the name of the profile whose URL "
+                                 "pattern matches URL best. With --client, "
+                                 "the daemon is asked.")
+        parser.add_argument("--normalize-url", dest="normalize_url",
+                            action="store_true",
+                            help="Reduce URLs to their registrable domain, "
+                                 "e.g. https://mail.example.co.uk/login to "
+                                 "example.co.uk, before generating passwords")
+        parser.add_argument("--stats", dest="stats", action="store_true",
+                            help="Print call counts and times of hashing, "
+                                 "encoding, leet and profile I/O to stderr "
+                                 "on exit. Worker processes of -j are not "
+                                 "included.")
+        parser.add_argument("--profile", dest="profile", default=None,
+                            help="Load only this profile and use its values "
+                                 "as defaults of the options above. For "
+                                 "--client, the profile name on the server "
+                                 "(default: default).")
         return parser
 
-    def update_settings(options, settings):
+    def set_profile_settings(options, profile, explicit_settings):
+        """Sets settings that are not given to the PwmSettings profile"""
+
+        for setting in attr.fields(PwmSettings):
+            if (setting.name not in ("URL", "MasterPass") and
+                    setting.name not in explicit_settings):
+                val = getattr(profile, setting.name)
+                # update_settings converts LeetLvl from the command line scale
+                if setting.name == "LeetLvl":
+                    val += 1
+                setattr(options, setting.name, val)
+
+    def get_explicit_settings(options):
+        """Returns names of the settings that are given on the command line
+
+        URL is not included.
+
+        """
+
+        return [setting.name for setting in attr.fields(PwmSettings)
+                if setting.name != "URL" and hasattr(options, setting.name)]
+
+    def set_missing_settings(options):
+        """Sets settings that are not given to their PwmSettings defaults"""
+
+        for setting in attr.fields(PwmSettings):
+            if not hasattr(options, setting.name):
+                setattr(options, setting.name, setting.default)
+
+    def get_setting_value(options, name):
+        """Returns value of setting name in options as used by PwmSettings"""
+
+        val = getattr(options, name)
+        if name in ("LeetLvl", "Length"):
+            val = int(val)
+        if name == "LeetLvl":
+            val -= 1
+        return val
+
+    def update_settings(options, settings, url):
         """Updates self.settings from entry widget values"""
 
         for setting in attr.fields(PwmSettings):
-            val = getattr(options, setting.name)
             if setting.name == "URL":
-                val += options.Username + options.Modifier
-            if setting.name in ("LeetLvl", "Length"):
-                val = int(val)
-            if setting.name == "LeetLvl":
-                val -= 1
+                val = get_cli_url(url, options.Username, options.Modifier)
+            else:
+                val = get_setting_value(options, setting.name)
             settings.__setattr__(setting.name, val)
 
     parser = get_parser()
     args = parser.parse_args()
-
-    args = parser.parse_args()
+    explicit_settings = get_explicit_settings(args)
+    set_missing_settings(args)
+
+    if args.stats:
+        import atexit
+
+        stats = enable_stats()
+        atexit.register(lambda: sys.stderr.write(stats.format() + "\n"))
+
+    if args.for_url is not None:
+        profile_name = get_profile_for_url(args.for_url, args.client,
+                                           args.socket)
+        if profile_name is None:
+            sys.exit("No profile for URL: {}".format(args.for_url))
+        print(profile_name)
+        return
+
+    if args.normalize_url and args.URL is not None:
+        from pwmurl import normalize_url
+
+        args.URL = [normalize_url(url) for url in args.URL]
+
+    if args.client:
+        from pwmserver import PwmClient
+
+        if "MasterPass" in explicit_settings:
+            parser.error("--client uses the master password of the daemon")
+
+        # Username and modifier are sent separately
+        overrides = dict((name, get_setting_value(args, name))
+                         for name in explicit_settings
+                         if name not in ("Username", "Modifier"))
+        username = args.Username if "Username" in explicit_settings else None
+        modifier = args.Modifier if "Modifier" in explicit_settings else None
+
+        with PwmClient(args.socket) as client:
+            for url in args.URL or [""]:
+                try:
+                    print(client.generate(
+                        url, profile=args.profile or "default",
+                        username=username, modifier=modifier, cli_url=True,
+                        settings=overrides))
+                except ValueError as err:
+                    sys.exit(str(err))
+        return
+
+    if args.profile is not None and not args.serve:
+        try:
+            profile = load_profile(args.profile)
+        except ValueError as err:
+            sys.exit(str(err))
+
+        set_profile_settings(args, profile, explicit_settings)
+        if args.URL is None:
+            args.URL = [profile.URL]
+        elif args.normalize_url:
+            from pwmurl import normalize_url
+
+            args.URL = [normalize_url(url) for url in args.URL]
 
     if args.MasterPass == "":
         import getpass
         args.MasterPass = getpass.getpass("Master password: ")
 
-    settings = PwmSettings()
-    update_settings(args, settings)
+    if args.serve:
+        from pwmserver import serve
 
-    print(generatepasswordfrom(settings))
+        try:
+            serve(args.MasterPass, args.socket, watch=args.watch)
+        except IOError as err:
+            sys.exit(str(err))
+        return
+
+    if args.stream is not None:
+        n_errors = stream(args.stream, args.MasterPass, jobs=args.jobs,
+                          profile=args.profile,
+                          normalize_urls=args.normalize_url)
+        if n_errors:
+            sys.exit("{} invalid rows".format(n_errors))
+        return
+
+    settings_list = []
+    for url in args.URL or [""]:
+        settings = PwmSettings()
+        update_settings(args, settings, url)
+        settings_list.append(settings)
+
+    for password in generate_many_parallel(settings_list, jobs=args.jobs):
+        print(password)
 
 
 def main():
@@ -445,6 +470,10 @@ def main():
 
     if len(sys.argv) == 1:
         gui()
+    elif sys.argv[1] == "profile":
+        import pwmprofile
+
+        pwmprofile.main(sys.argv[2:])
     else:
         cmd()
 
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+
+PasswordMaker - Python asyncio interface
+========================================
+
+Create and manage passwords.
+
+
+Copyright (C):
+
+    2018      Martin Manns
+              <mmanns@gmx.net>
+
+    This file is part of PasswordMaker.
+
+    PasswordMaker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Coroutines that generate passwords without blocking the event loop.
+This module requires Python 3.7+.
+
+Work is offloaded to an executor, which is the default thread pool of the
+event loop unless a concurrent.futures executor is passed. For CPU bound
+bulk jobs, a ProcessPoolExecutor is recommended.
+
+In order to keep interactive requests responsive while bulk jobs run, pass
+the same asyncio.Semaphore to all agenerate_many calls and choose its value
+lower than the number of executor workers. agenerate calls that do not use
+this semaphore then always find a free worker.
+
+"""
+
+import asyncio
+from collections import deque
+import threading
+
+from pwmlib import generatepasswordfrom, generate_chunk, iter_chunks
+
+
+def _release_threadsafe(loop, semaphore):
+    """Releases semaphore from any thread unless loop is closed"""
+
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        pass  # Loop is closed
+
+
+def _run_in_default_executor(loop, semaphore, func, *args):
+    """Returns future of func(*args) in the loop's default thread pool
+
+    The job releases semaphore when it ends. A job that is cancelled before
+    it has started is skipped, and semaphore is released on cancellation.
+
+    """
+
+    lock = threading.Lock()
+    state = {"started": False, "skipped": False}
+
+    def job():
+        """Runs func unless the future has been cancelled before"""
+
+        with lock:
+            if state["skipped"]:
+                return None
+            state["started"] = True
+
+        try:
+            return func(*args)
+        finally:
+            _release_threadsafe(loop, semaphore)
+
+    def on_done(future):
+        """Releases semaphore if the job has been cancelled in the queue"""
+
+        if not future.cancelled():
+            return
+
+        with lock:
+            if state["started"]:
+                return
+            state["skipped"] = True
+
+        semaphore.release()
+
+    future = loop.run_in_executor(None, job)
+    future.add_done_callback(on_done)
+    return future
+
+
+async def _submit(loop, executor, semaphore, func, *args):
+    """Returns future of func(*args) in executor
+
+    If semaphore is given, it is acquired before submission and released
+    when the executor job ends. Cancelling the future does not release
+    semaphore while the job is still running.
+
+    """
+
+    if semaphore is None:
+        return loop.run_in_executor(executor, func, *args)
+
+    await semaphore.acquire()
+    try:
+        if executor is None:
+            return _run_in_default_executor(loop, semaphore, func, *args)
+
+        job = executor.submit(func, *args)
+    except BaseException:
+        semaphore.release()
+        raise
+
+    job.add_done_callback(lambda _: _release_threadsafe(loop, semaphore))
+    return asyncio.wrap_future(job, loop=loop)
+
+
+async def agenerate(settings, executor=None, semaphore=None):
+    """Returns password for settings, computed in executor
+
+    Parameters
+    ----------
+
+    * settings: PwmSettings
+    \tSettings instance
+    * executor: concurrent.futures.Executor (default: None)
+    \tExecutor for password generation, None for the loop's default
+    * semaphore: asyncio.Semaphore (default: None)
+    \tLimits the number of concurrent computations, None for no limit
+
+    """
+
+    loop = asyncio.get_running_loop()
+    future = await _submit(loop, executor, semaphore, generatepasswordfrom,
+                           settings)
+    return await future
+
+
+async def agenerate_many(settings_iterable, executor=None, semaphore=None,
+                         max_in_flight=2, chunk_size=64):
+    """Asynchronous generator of passwords, one for each PwmSettings
+
+    Settings are sent to executor in chunks. Results are yielded in the
+    order of settings_iterable. If the generator is closed or cancelled,
+    pending chunks are cancelled.
+
+    Parameters
+    ----------
+
+    * settings_iterable: Iterable of PwmSettings
+    \tSettings instances
+    * executor: concurrent.futures.Executor (default: None)
+    \tExecutor for password generation, None for the loop's default
+    * semaphore: asyncio.Semaphore (default: None)
+    \tLimits the number of chunks in flight, may be shared between calls
+    * max_in_flight: Integer (default: 2)
+    \tMaximum number of chunks in flight for this call
+    * chunk_size: Integer (default: 64)
+    \tNumber of settings that are computed in one executor job
+
+    """
+
+    if max_in_flight < 1:
+        msg = "The number of chunks in flight {} is less than 1."
+        raise ValueError(msg.format(max_in_flight))
+
+    loop = asyncio.get_running_loop()
+    pending = deque()
+
+    try:
+        for chunk in iter_chunks(settings_iterable, chunk_size):
+            pending.append(await _submit(loop, executor, semaphore,
+                                         generate_chunk, chunk))
+            if len(pending) >= max_in_flight:
+                for password in await pending.popleft():
+                    yield password
+
+        while pending:
+            for password in await pending.popleft():
+                yield password
+
+    finally:
+        for future in pending:
+            future.cancel()
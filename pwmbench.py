@@ -0,0 +1,526 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+
+PasswordMaker - Python micro-benchmarks
+=======================================
+
+Create and manage passwords.
+
+
+Copyright (C):
+
+    2018      Martin Manns
+              <mmanns@gmx.net>
+
+    This file is part of PasswordMaker.
+
+    PasswordMaker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Times the hot paths of pwmlib and reports operations per second.
+
+Usage:
+
+    python pwmbench.py [--output results.json] [--baseline baseline.json]
+
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+from math import sqrt
+
+from pwmlib import ALGORITHMS, FULL_CHARSET, LEET_OPTIONS
+from pwmlib import generatepassword, leet, PwmHashUtils
+from pwmlib import PwmSettings, PwmSettingsList, ColumnarPwmSettingsList
+from pwmstore import PwmSettingsStore
+from pwmurl import get_host, normalize_url
+
+BENCH_FORMAT_VERSION = 1
+
+LENGTHS = (8, 32, 128)
+
+CHARSETS = {
+    "2": "01",
+    "16": "0123456789abcdef",
+    "62": FULL_CHARSET[:62],
+    "94": FULL_CHARSET,
+}
+
+LEET_MESSAGE = "The quick, brown fox jumps over the lazy dog"
+
+N_PROFILES = 200
+
+N_MEMORY_PROFILES = 10000
+
+N_URLS = 100
+
+# Maximum cumulative import seconds of modules in a fresh interpreter
+IMPORT_BUDGETS = {
+    "pwmlib": 0.15,
+    "passwordmaker": 0.25,
+}
+
+# Modules that must not be imported on the command line path
+CLI_FORBIDDEN_MODULES = ("tkinter", "multiprocessing")
+
+
+def measure(func, repeat=5, min_time=0.1):
+    """Returns timing statistics of func in operations per second
+
+    The number of calls per repetition is calibrated so that each repetition
+    takes at least min_time seconds.
+
+    """
+
+    timer = timeit.Timer(func)
+
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 2
+
+    ops = [number / elapsed]
+    for _ in range(repeat - 1):
+        ops.append(number / timer.timeit(number))
+
+    mean = sum(ops) / len(ops)
+    variance = sum((op - mean) ** 2 for op in ops) / len(ops)
+
+    return {
+        "ops_per_sec": mean,
+        "stdev": sqrt(variance),
+        "min": min(ops),
+        "max": max(ops),
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def gen_generatepassword_benchmarks():
+    """Generator of (name, func) for generatepassword"""
+
+    for algorithm in ALGORITHMS:
+        for length in LENGTHS:
+            for charset_name, charset in sorted(CHARSETS.items()):
+                for use_leet in LEET_OPTIONS:
+                    name = "generatepassword/{}/len{}/cs{}/leet-{}".format(
+                        algorithm, length, charset_name, use_leet)
+
+                    def func(algorithm=algorithm, length=length,
+                             charset=charset, use_leet=use_leet):
+                        """Benchmarked function"""
+
+                        generatepassword(algorithm, "asdf",
+                                         "passwordmaker.org", length,
+                                         charset, use_leet=use_leet,
+                                         leet_level=5)
+
+                    yield name, func
+
+
+def gen_rstr2any_benchmarks():
+    """Generator of (name, func) for PwmHashUtils.rstr2any"""
+
+    for digest_name in ("md5", "sha1", "sha256"):
+        digest = hashlib.new(digest_name, b"passwordmaker.org").digest()
+        for charset_name, charset in sorted(CHARSETS.items()):
+            hash_utils = PwmHashUtils("md5", charset)
+            name = "rstr2any/{}/cs{}".format(digest_name, charset_name)
+
+            def func(rstr2any=hash_utils.rstr2any, digest=digest):
+                """Benchmarked function"""
+
+                rstr2any(digest)
+
+            yield name, func
+
+
+def gen_leet_benchmarks():
+    """Generator of (name, func) for leet"""
+
+    for leet_level in (1, 5, 9):
+        name = "leet/level{}".format(leet_level)
+
+        def func(leet_level=leet_level):
+            """Benchmarked function"""
+
+            leet(leet_level, LEET_MESSAGE)
+
+        yield name, func
+
+
+def gen_url_benchmarks():
+    """Generator of (name, func) for URL normalization
+
+    The cold benchmark clears the memoization before each run.
+
+    """
+
+    urls = ["https://user@mail.site{}.example.co.uk:8443/login".format(i)
+            for i in range(N_URLS)]
+
+    def cold_func():
+        """Benchmarked function"""
+
+        get_host.cache_clear()
+        normalize_url.cache_clear()
+        for url in urls:
+            normalize_url(url)
+
+    def memo_func():
+        """Benchmarked function"""
+
+        for url in urls:
+            normalize_url(url)
+
+    yield "url/normalize{}/cold".format(N_URLS), cold_func
+    yield "url/normalize{}/memo".format(N_URLS), memo_func
+
+
+def gen_load_benchmarks(directory):
+    """Generator of (name, func) for PwmSettingsList.load
+
+    N_PROFILES setting files are created in directory.
+
+    """
+
+    for i in range(N_PROFILES):
+        settings = PwmSettings(URL="site{}.org".format(i))
+        settings.save(os.path.join(directory, "pwm.site{}.setting".format(i)))
+
+    def func():
+        """Benchmarked function"""
+
+        PwmSettingsList().load(directory)
+
+    yield "PwmSettingsList.load/{}".format(N_PROFILES), func
+
+    def load_all_func():
+        """Benchmarked function"""
+
+        settings_list = PwmSettingsList()
+        settings_list.load(directory)
+        list(settings_list.pwms)
+
+    yield "PwmSettingsList.load-all/{}".format(N_PROFILES), load_all_func
+
+    settings_list = PwmSettingsList()
+    settings_list.load(directory)
+
+    def save_func():
+        """Benchmarked function"""
+
+        settings_list.pwms[0].Length += 1
+        settings_list.save(directory)
+
+    yield "PwmSettingsList.save-one/{}".format(N_PROFILES), save_func
+
+    reload_list = PwmSettingsList()
+    reload_list.load(directory)
+    list(reload_list.pwms)
+
+    def reload_func():
+        """Benchmarked function"""
+
+        reload_list.reload(directory)
+        list(reload_list.pwms)
+
+    yield "PwmSettingsList.reload-all/{}".format(N_PROFILES), reload_func
+
+    store = PwmSettingsStore(os.path.join(directory, "pwm.sqlite"))
+    store.import_directory(directory)
+
+    yield ("PwmSettingsStore.load_settings_list/{}".format(N_PROFILES),
+           store.load_settings_list)
+
+    def get_func():
+        """Benchmarked function"""
+
+        store.get("site{}".format(N_PROFILES // 2))
+
+    yield "PwmSettingsStore.get/{}".format(N_PROFILES), get_func
+
+
+def measure_memory(n_profiles=N_MEMORY_PROFILES, name_filter=None):
+    """Returns dict of bytes per profile for profile representations
+
+    Profiles are created from distinct JSON documents as if they were
+    loaded from setting files. Memory that is held by the resulting objects
+    is measured with tracemalloc.
+
+    """
+
+    import tracemalloc
+
+    texts = [json.dumps(PwmSettings(URL="site{}.example.org".format(i),
+                                    Username="user{}".format(i)).get_dict())
+             for i in range(n_profiles)]
+    names = ["site{}".format(i) for i in range(n_profiles)]
+
+    representations = [
+        ("memory/dict", lambda: [json.loads(text) for text in texts]),
+        ("memory/PwmSettings",
+         lambda: PwmSettings.from_dicts(json.loads(text) for text in texts)),
+        ("memory/ColumnarPwmSettingsList",
+         lambda: ColumnarPwmSettingsList.from_dicts(
+             names, (json.loads(text) for text in texts))),
+    ]
+
+    results = {}
+    for name, func in representations:
+        if name_filter is not None and name_filter not in name:
+            continue
+
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            profiles = func()
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del profiles
+
+        results[name] = {
+            "bytes_per_profile": float(after - before) / n_profiles,
+            "profiles": n_profiles,
+        }
+
+    return results
+
+
+def measure_import(module, repeat=5):
+    """Returns import statistics of module in fresh interpreters
+
+    The import time is the cumulative time reported by python -X importtime.
+    Statistics are given in imports per second as for the other benchmarks.
+    The key "modules" holds all modules that are imported with module.
+
+    """
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    args = [sys.executable, "-X", "importtime", "-c", "import " + module]
+
+    ops = []
+    modules = set()
+    for _ in range(repeat):
+        proc = subprocess.Popen(args, cwd=directory, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        _, stderr = proc.communicate()
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            name = name.strip()
+            modules.add(name)
+            if name == module:
+                ops.append(1e6 / int(cumulative))
+
+    mean = sum(ops) / len(ops)
+    variance = sum((op - mean) ** 2 for op in ops) / len(ops)
+
+    return {
+        "ops_per_sec": mean,
+        "stdev": sqrt(variance),
+        "min": min(ops),
+        "max": max(ops),
+        "repeat": repeat,
+        "number": 1,
+        "modules": sorted(modules),
+    }
+
+
+def check_import_budgets(results):
+    """Returns list of import budget violations in results"""
+
+    violations = []
+    for module, budget in sorted(IMPORT_BUDGETS.items()):
+        try:
+            result = results["results"]["import/" + module]
+        except KeyError:
+            continue
+
+        seconds = 1.0 / result["max"]
+        if seconds > budget:
+            msg = "Import of {} takes {:.3f} s, budget is {:.3f} s"
+            violations.append(msg.format(module, seconds, budget))
+
+        if module == "passwordmaker":
+            for forbidden in CLI_FORBIDDEN_MODULES:
+                if forbidden in result["modules"]:
+                    msg = "Import of {} imports {}"
+                    violations.append(msg.format(module, forbidden))
+
+    return violations
+
+
+def run(name_filter=None, repeat=5, min_time=0.1, verbose=True):
+    """Runs all benchmarks whose name contains name_filter
+
+    Returns a dict that can be stored as JSON.
+
+    """
+
+    directory = tempfile.mkdtemp(prefix="pwmbench")
+
+    benchmarks = []
+    benchmarks.extend(gen_generatepassword_benchmarks())
+    benchmarks.extend(gen_rstr2any_benchmarks())
+    benchmarks.extend(gen_leet_benchmarks())
+    benchmarks.extend(gen_url_benchmarks())
+    benchmarks.extend(gen_load_benchmarks(directory))
+
+    results = {}
+    try:
+        for module in sorted(IMPORT_BUDGETS):
+            name = "import/" + module
+            if name_filter is not None and name_filter not in name:
+                continue
+            results[name] = measure_import(module, repeat=repeat)
+            if verbose:
+                print(format_result(name, results[name]))
+
+        for name, func in benchmarks:
+            if name_filter is not None and name_filter not in name:
+                continue
+            results[name] = measure(func, repeat=repeat, min_time=min_time)
+            if verbose:
+                print(format_result(name, results[name]))
+    finally:
+        shutil.rmtree(directory)
+
+    memory = measure_memory(name_filter=name_filter)
+    if verbose:
+        for name in sorted(memory):
+            print(format_memory_result(name, memory[name]))
+
+    return {
+        "version": BENCH_FORMAT_VERSION,
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "results": results,
+        "memory": memory,
+    }
+
+
+def format_result(name, result):
+    """Returns one line report of a benchmark result"""
+
+    rel_stdev = 100.0 * result["stdev"] / result["ops_per_sec"]
+    return "{:<56} {:>12.1f} ops/s +- {:5.1f}%".format(
+        name, result["ops_per_sec"], rel_stdev)
+
+
+def format_memory_result(name, result):
+    """Returns one line report of a memory benchmark result"""
+
+    return "{:<56} {:>12.1f} bytes/profile".format(
+        name, result["bytes_per_profile"])
+
+
+def compare(results, baseline, tolerance=0.1):
+    """Prints comparison with baseline and returns names of regressions
+
+    A benchmark regresses if it is slower than the baseline by more than
+    the fraction tolerance.
+
+    """
+
+    regressions = []
+    for name in sorted(results["results"]):
+        if name not in baseline["results"]:
+            continue
+        ops = results["results"][name]["ops_per_sec"]
+        base_ops = baseline["results"][name]["ops_per_sec"]
+        ratio = ops / base_ops
+        flag = ""
+        if ratio < 1.0 - tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("{:<56} {:>7.2f}x{}".format(name, ratio, flag))
+
+    # Memory regresses if a profile takes more bytes than in the baseline
+    memory = results.get("memory", {})
+    base_memory = baseline.get("memory", {})
+    for name in sorted(memory):
+        if name not in base_memory:
+            continue
+        ratio = base_memory[name]["bytes_per_profile"] / \
+            memory[name]["bytes_per_profile"]
+        flag = ""
+        if ratio < 1.0 - tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("{:<56} {:>7.2f}x{}".format(name, ratio, flag))
+
+    return regressions
+
+
+def main():
+    """Command line entry point"""
+
+    parser = argparse.ArgumentParser(description="PasswordMaker benchmarks")
+    parser.add_argument("-o", "--output", dest="output", default=None,
+                        help="Save results as JSON to this file")
+    parser.add_argument("-b", "--baseline", dest="baseline", default=None,
+                        help="Compare results with this JSON file")
+    parser.add_argument("-f", "--filter", dest="name_filter", default=None,
+                        help="Only run benchmarks containing this string")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=5,
+                        help="Repetitions per benchmark (default 5)")
+    parser.add_argument("-t", "--min-time", dest="min_time", type=float,
+                        default=0.1,
+                        help="Minimum seconds per repetition (default 0.1)")
+    parser.add_argument("--tolerance", dest="tolerance", type=float,
+                        default=0.1,
+                        help="Allowed slowdown against baseline (default 0.1)")
+    args = parser.parse_args()
+
+    results = run(name_filter=args.name_filter, repeat=args.repeat,
+                  min_time=args.min_time)
+
+    if args.output is not None:
+        with open(args.output, "w") as outfile:
+            json.dump(results, outfile, sort_keys=True, indent=4)
+
+    failed = False
+
+    for violation in check_import_budgets(results):
+        print(violation)
+        failed = True
+
+    if args.baseline is not None:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+        if compare(results, baseline, tolerance=args.tolerance):
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+
+PasswordMaker - Python hash backends
+====================================
+
+Create and manage passwords.
+
+
+Copyright (C):
+
+    2018      Martin Manns
+              <mmanns@gmx.net>
+
+    This file is part of PasswordMaker.
+
+    PasswordMaker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Registry of hash function backends.
+
+Each hash name ("md4", "md5", "sha1", "sha256", "rmd160") may be provided by
+several backends:
+
+* hashlib: OpenSSL via hashlib, including hashlib.new("md4") and
+  hashlib.new("ripemd160") if OpenSSL provides them
+* pycryptodome: Crypto.Hash from pycryptodome or pycrypto
+* legacy: The md5 and sha modules of Python < 2.5
+* python: Pure Python implementations of MD4 and RIPEMD-160
+
+Backends are only imported when a hash is first requested. If several
+backends are available, they are checked against test vectors and timed.
+The fastest correct backend per hash is stored in a small JSON file so that
+later processes skip the benchmark.
+
+"""
+
+import json
+import os
+import struct
+import sys
+import threading
+import timeit
+
+import attr
+
+HASH_NAMES = ("md4", "md5", "sha1", "sha256", "rmd160")
+
+# Test vectors (message, hex digest) per hash name
+_TEST_MESSAGE = b"1234567890" * 8
+
+HASH_TEST_VECTORS = {
+    "md4": [(b"abc", "a448017aaf21d8525fc10ae87aa6729d"),
+            (_TEST_MESSAGE, "e33b4ddc9c38f2199c3e7b164fcc0536")],
+    "md5": [(b"abc", "900150983cd24fb0d6963f7d28e17f72"),
+            (_TEST_MESSAGE, "57edf4a22be3c955ac49da2e2107b67a")],
+    "sha1": [(b"abc", "a9993e364706816aba3e25717850c26c9cd0d89d"),
+             (_TEST_MESSAGE, "50abf5706a150990a08b2c5ea40fa0e585554732")],
+    "sha256": [(b"abc", "ba7816bf8f01cfea414140de5dae2223"
+                        "b00361a396177a9cb410ff61f20015ad"),
+               (_TEST_MESSAGE, "f371bc4a311f2b009eef952dd83ca80e"
+                               "2b60026c8e935592d0f9c308453c813e")],
+    "rmd160": [(b"abc", "8eb208f7e05d987a9b044a8e98c6b087f15a0bfc"),
+               (_TEST_MESSAGE, "9b752e45573d4b39f4dbd3323cab82bf63326bfb")],
+}
+
+_MASK = 0xffffffff
+
+
+def _rotl(value, shift):
+    """Returns 32-bit value rotated left by shift bits"""
+
+    value &= _MASK
+    return ((value << shift) | (value >> (32 - shift))) & _MASK
+
+
+class _PurePythonHash(object):
+    """Base class of pure Python Merkle-Damgard hashes with 64 byte blocks
+
+    The message is buffered and hashed when the digest is requested.
+    Subclasses provide initial_state, length_format and compress.
+
+    """
+
+    block_size = 64
+    digest_size = None
+    initial_state = ()
+    length_format = "<Q"
+    state_format = "<5I"
+
+    def __init__(self, data=b""):
+        self._data = bytes(data)
+
+    def update(self, data):
+        """Appends data to the message"""
+
+        self._data += bytes(data)
+
+    def copy(self):
+        """Returns copy of the hash object"""
+
+        return type(self)(self._data)
+
+    def digest(self):
+        """Returns digest of the message"""
+
+        data = self._data
+        padding = b"\x80" + b"\x00" * ((55 - len(data)) % 64)
+        data += padding + struct.pack(self.length_format, len(data) * 8)
+
+        state = list(self.initial_state)
+        for offset in range(0, len(data), 64):
+            block = struct.unpack("<16I", data[offset:offset + 64])
+            state = self.compress(state, block)
+
+        return struct.pack(self.state_format, *state)
+
+    def hexdigest(self):
+        """Returns digest of the message as hex string"""
+
+        return "".join("{:02x}".format(byte)
+                       for byte in bytearray(self.digest()))
+
+    @staticmethod
+    def compress(state, block):
+        """Returns new state after processing block"""
+
+        raise NotImplementedError
+
+
+class MD4(_PurePythonHash):
+    """Pure Python MD4 (RFC 1320)"""
+
+    digest_size = 16
+    initial_state = (0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476)
+    state_format = "<4I"
+
+    _rounds = (
+        (lambda x, y, z: (x & y) | (~x & z), 0,
+         range(16), (3, 7, 11, 19)),
+        (lambda x, y, z: (x & y) | (x & z) | (y & z), 0x5a827999,
+         (0, 4, 8, 12, 1, 5, 9, 13, 2, 6, 10, 14, 3, 7, 11, 15),
+         (3, 5, 9, 13)),
+        (lambda x, y, z: x ^ y ^ z, 0x6ed9eba1,
+         (0, 8, 4, 12, 2, 10, 6, 14, 1, 9, 5, 13, 3, 11, 7, 15),
+         (3, 9, 11, 15)),
+    )
+
+    @staticmethod
+    def compress(state, block):
+        a, b, c, d = state
+        for func, constant, order, shifts in MD4._rounds:
+            for i, k in enumerate(order):
+                a = _rotl(a + func(b, c, d) + block[k] + constant,
+                          shifts[i % 4])
+                a, b, c, d = d, a, b, c
+
+        return [(x + y) & _MASK for x, y in zip(state, (a, b, c, d))]
+
+
+class RIPEMD160(_PurePythonHash):
+    """Pure Python RIPEMD-160"""
+
+    digest_size = 20
+    initial_state = (0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476,
+                     0xc3d2e1f0)
+
+    _r_left = (
+        0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15,
+        7, 4, 13, 1, 10, 6, 15, 3, 12, 0, 9, 5, 2, 14, 11, 8,
+        3, 10, 14, 4, 9, 15, 8, 1, 2, 7, 0, 6, 13, 11, 5, 12,
+        1, 9, 11, 10, 0, 8, 12, 4, 13, 3, 7, 15, 14, 5, 6, 2,
+        4, 0, 5, 9, 7, 12, 2, 10, 14, 1, 3, 8, 11, 6, 15, 13)
+    _r_right = (
+        5, 14, 7, 0, 9, 2, 11, 4, 13, 6, 15, 8, 1, 10, 3, 12,
+        6, 11, 3, 7, 0, 13, 5, 10, 14, 15, 8, 12, 4, 9, 1, 2,
+        15, 5, 1, 3, 7, 14, 6, 9, 11, 8, 12, 2, 10, 0, 4, 13,
+        8, 6, 4, 1, 3, 11, 15, 0, 5, 12, 2, 13, 9, 7, 10, 14,
+        12, 15, 10, 4, 1, 5, 8, 7, 6, 2, 13, 14, 0, 3, 9, 11)
+    _s_left = (
+        11, 14, 15, 12, 5, 8, 7, 9, 11, 13, 14, 15, 6, 7, 9, 8,
+        7, 6, 8, 13, 11, 9, 7, 15, 7, 12, 15, 9, 11, 7, 13, 12,
+        11, 13, 6, 7, 14, 9, 13, 15, 14, 8, 13, 6, 5, 12, 7, 5,
+        11, 12, 14, 15, 14, 15, 9, 8, 9, 14, 5, 6, 8, 6, 5, 12,
+        9, 15, 5, 11, 6, 8, 13, 12, 5, 12, 13, 14, 11, 8, 5, 6)
+    _s_right = (
+        8, 9, 9, 11, 13, 15, 15, 5, 7, 7, 8, 11, 14, 14, 12, 6,
+        9, 13, 15, 7, 12, 8, 9, 11, 7, 7, 12, 7, 6, 15, 13, 11,
+        9, 7, 15, 11, 8, 6, 6, 14, 12, 13, 5, 14, 13, 13, 7, 5,
+        15, 5, 8, 11, 14, 14, 6, 14, 6, 9, 12, 9, 12, 5, 15, 8,
+        8, 5, 12, 9, 12, 5, 14, 6, 8, 13, 6, 5, 15, 13, 11, 11)
+    _k_left = (0x00000000, 0x5a827999, 0x6ed9eba1, 0x8f1bbcdc, 0xa953fd4e)
+    _k_right = (0x50a28be6, 0x5c4dd124, 0x6d703ef3, 0x7a6d76e9, 0x00000000)
+
+    _funcs = (
+        lambda x, y, z: x ^ y ^ z,
+        lambda x, y, z: (x & y) | (~x & z),
+        lambda x, y, z: (x | ~y) ^ z,
+        lambda x, y, z: (x & z) | (y & ~z),
+        lambda x, y, z: x ^ (y | ~z),
+    )
+
+    @staticmethod
+    def compress(state, block):
+        cls = RIPEMD160
+        al, bl, cl, dl, el = state
+        ar, br, cr, dr, er = state
+
+        for j in range(80):
+            rnd = j // 16
+
+            t = _rotl(al + cls._funcs[rnd](bl, cl, dl) +
+                      block[cls._r_left[j]] + cls._k_left[rnd],
+                      cls._s_left[j]) + el
+            al, el, dl, cl, bl = el, dl, _rotl(cl, 10), bl, t & _MASK
+
+            t = _rotl(ar + cls._funcs[4 - rnd](br, cr, dr) +
+                      block[cls._r_right[j]] + cls._k_right[rnd],
+                      cls._s_right[j]) + er
+            ar, er, dr, cr, br = er, dr, _rotl(cr, 10), br, t & _MASK
+
+        h0, h1, h2, h3, h4 = state
+        return [(h1 + cl + dr) & _MASK, (h2 + dl + er) & _MASK,
+                (h3 + el + ar) & _MASK, (h4 + al + br) & _MASK,
+                (h0 + bl + cr) & _MASK]
+
+
+# Backend loaders return a hash constructor or raise ImportError or
+# ValueError if the hash is unavailable.
+
+def _load_hashlib(hash_name):
+    """Returns hashlib constructor for hash_name"""
+
+    import hashlib
+
+    openssl_name = {"rmd160": "ripemd160"}.get(hash_name, hash_name)
+
+    try:
+        return getattr(hashlib, openssl_name)
+    except AttributeError:
+        pass
+
+    # Raises ValueError if OpenSSL does not provide the hash
+    hashlib.new(openssl_name)
+
+    def constructor(data=b""):
+        """Returns hashlib hash object"""
+
+        return hashlib.new(openssl_name, data)
+
+    return constructor
+
+
+def _load_pycryptodome(hash_name):
+    """Returns Crypto.Hash constructor for hash_name"""
+
+    if hash_name == "rmd160":
+        try:
+            from Crypto.Hash import RIPEMD160 as module
+        except ImportError:
+            from Crypto.Hash import RIPEMD as module
+    else:
+        module_name = hash_name.upper()
+        module = __import__("Crypto.Hash." + module_name,
+                            fromlist=[module_name])
+
+    return module.new
+
+
+def _load_legacy(hash_name):
+    """Returns constructor from the md5 and sha modules of Python < 2.5"""
+
+    if hash_name == "md5":
+        import md5
+        return md5.new
+    if hash_name == "sha1":
+        import sha
+        return sha.new
+
+    raise ImportError("No legacy module for {}".format(hash_name))
+
+
+def _load_python(hash_name):
+    """Returns pure Python constructor for hash_name"""
+
+    try:
+        return {"md4": MD4, "rmd160": RIPEMD160}[hash_name]
+    except KeyError:
+        raise ImportError("No pure Python {}".format(hash_name))
+
+
+# Backends in order of preference if no benchmark result is available
+HASH_BACKENDS = (
+    ("hashlib", _load_hashlib),
+    ("pycryptodome", _load_pycryptodome),
+    ("legacy", _load_legacy),
+    ("python", _load_python),
+)
+
+
+def check_constructor(hash_name, constructor):
+    """Returns True if constructor passes the test vectors of hash_name"""
+
+    try:
+        for message, hexdigest in HASH_TEST_VECTORS[hash_name]:
+            hash_obj = constructor(message[:1])
+            hash_obj.update(message[1:])
+            if hash_obj.copy().hexdigest() != hexdigest:
+                return False
+    except Exception:  # A broken backend must not break the registry
+        return False
+
+    return True
+
+
+def time_constructor(constructor, number=200):
+    """Returns seconds for number digests of a short message"""
+
+    message = b"passwordmaker.org" * 4
+    return timeit.timeit(lambda: constructor(message).digest(),
+                         number=number)
+
+
+def get_default_cache_path():
+    """Returns path of the backend cache file
+
+    The environment variable PWM_HASH_BACKEND_CACHE overrides the path. If
+    it is empty then no cache file is used.
+
+    """
+
+    try:
+        return os.environ["PWM_HASH_BACKEND_CACHE"] or None
+    except KeyError:
+        pass
+
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir, "passwordmaker", "hash_backends.json")
+
+
+@attr.s
+class HashBackendRegistry(object):
+    """Lazily selects the fastest correct backend for each hash
+
+    Parameters
+    ----------
+
+    * cache_path: String (default: get_default_cache_path())
+    \tJSON file for benchmark results, None for no file
+    * backends: Tuple of (name, loader) (default: HASH_BACKENDS)
+    \tCandidate backends in order of preference
+
+    """
+
+    cache_path = attr.ib(default=attr.Factory(get_default_cache_path))
+    backends = attr.ib(default=HASH_BACKENDS, repr=False)
+
+    def __attrs_post_init__(self):
+        self._lock = threading.Lock()
+        self._constructors = {}
+        self._selected = {}
+        self._cache = None
+
+    @property
+    def selected_backends(self):
+        """Dict of hash names and names of their selected backends"""
+
+        return dict(self._selected)
+
+    def _load_cache(self):
+        """Returns cached backend names for this Python version"""
+
+        if self._cache is None:
+            self._cache = {}
+            if self.cache_path is not None:
+                try:
+                    with open(self.cache_path) as infile:
+                        cache = json.load(infile)
+                    if cache.get("python") == sys.version:
+                        self._cache = cache.get("backends", {})
+                except (IOError, OSError, ValueError):
+                    pass
+
+        return self._cache
+
+    def _save_cache(self):
+        """Saves selected backend names, errors are ignored"""
+
+        if self.cache_path is None:
+            return
+
+        # Imported here because pwmlib imports this module
+        from pwmlib import _write_atomic
+
+        cache = {"python": sys.version, "backends": self._load_cache()}
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir and not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            # A unique temporary file so that concurrent processes that
+            # save the cache do not write into the same file
+            _write_atomic(self.cache_path,
+                          json.dumps(cache, sort_keys=True, indent=4))
+        except (IOError, OSError):
+            pass
+
+    def _load_backend(self, backend_name, hash_name):
+        """Returns correct constructor from backend or None"""
+
+        loader = dict(self.backends)[backend_name]
+        try:
+            constructor = loader(hash_name)
+        except (ImportError, ValueError, AttributeError):
+            return None
+
+        if check_constructor(hash_name, constructor):
+            return constructor
+
+    def _select(self, hash_name):
+        """Returns (backend name, constructor) of the fastest backend"""
+
+        cached_name = self._load_cache().get(hash_name)
+        if cached_name in dict(self.backends):
+            constructor = self._load_backend(cached_name, hash_name)
+            if constructor is not None:
+                return cached_name, constructor
+
+        candidates = []
+        for backend_name, _ in self.backends:
+            constructor = self._load_backend(backend_name, hash_name)
+            if constructor is not None:
+                candidates.append((backend_name, constructor))
+
+        if not candidates:
+            raise ValueError("No backend for hash {}".format(hash_name))
+
+        if len(candidates) > 1:
+            candidates.sort(key=lambda candidate:
+                            time_constructor(candidate[1]))
+
+        self._load_cache()[hash_name] = candidates[0][0]
+        self._save_cache()
+
+        return candidates[0]
+
+    def get_constructor(self, hash_name):
+        """Returns hash constructor for hash_name"""
+
+        try:
+            return self._constructors[hash_name]
+        except KeyError:
+            pass
+
+        if hash_name not in HASH_NAMES:
+            raise ValueError("Unknown hash: {}".format(hash_name))
+
+        with self._lock:
+            if hash_name not in self._constructors:
+                backend_name, constructor = self._select(hash_name)
+                self._selected[hash_name] = backend_name
+                self._constructors[hash_name] = constructor
+
+        return self._constructors[hash_name]
+
+
+HASH_BACKEND_REGISTRY = HashBackendRegistry()
+
+
+def get_hash_constructor(hash_name):
+    """Returns hash constructor for hash_name from HASH_BACKEND_REGISTRY"""
+
+    return HASH_BACKEND_REGISTRY.get_constructor(hash_name)
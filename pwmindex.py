@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+
+PasswordMaker - Python URL index
+================================
+
+Create and manage passwords.
+
+
+Copyright (C):
+
+    2018      Martin Manns
+              <mmanns@gmx.net>
+
+    This file is part of PasswordMaker.
+
+    PasswordMaker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Index that finds the profile for a URL.
+
+The URL attribute of each profile is a pattern. Patterns are hosts, which
+match the host itself and all its subdomains, e.g. "example.org" matches
+"example.org" and "mail.example.org". A "*" label matches any one label,
+e.g. "*.example.org" matches "mail.example.org" and "a.mail.example.org"
+but not "example.org". Schemes, ports and paths are ignored and
+internationalized hosts are compared as punycode.
+
+Patterns are stored in a trie of reversed host labels, so that a lookup
+costs O(labels) instead of O(profiles). Among all matching patterns, the
+one with most labels wins. For equal numbers of labels, the one with fewer
+wildcards wins, then the profile that has been added first.
+
+"""
+
+import attr
+
+from pwmurl import get_host, is_ip_address
+
+WILDCARD = "*"
+
+
+def get_labels(url):
+    """Returns list of host labels of url in reversed order
+
+    IP addresses are returned as one label because their parts are no
+    domains.
+
+    """
+
+    host = get_host(url)
+    if not host:
+        return []
+
+    if is_ip_address(host):
+        return [host]
+
+    return host.split(".")[::-1]
+
+
+class _TrieNode(object):
+    """Node of the reversed label trie"""
+
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []  # (insertion number, profile name)
+
+
+@attr.s
+class UrlIndex(object):
+    """Maps URLs to profile names
+
+    Use from_settings_list for building an index of all profiles.
+
+    """
+
+    def __attrs_post_init__(self):
+        self._root = _TrieNode()
+        self._size = 0
+        self._n_added = 0
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def from_settings_list(cls, settings_list):
+        """Returns UrlIndex of the URL patterns of all profiles
+
+        Profiles without URL are ignored.
+
+        """
+
+        index = cls()
+        for name, pwm in zip(settings_list.pwm_names, settings_list.pwms):
+            if pwm.URL:
+                index.add(pwm.URL, name)
+
+        return index
+
+    def add(self, pattern, name):
+        """Adds profile name for URL pattern
+
+        Patterns without host are ignored.
+
+        """
+
+        labels = get_labels(pattern)
+        if not labels:
+            return
+
+        node = self._root
+        for label in labels:
+            try:
+                node = node.children[label]
+            except KeyError:
+                child = _TrieNode()
+                node.children[label] = child
+                node = child
+
+        node.entries.append((self._n_added, name))
+        self._n_added += 1
+        self._size += 1
+
+    def remove(self, pattern, name):
+        """Removes profile name for URL pattern, raises KeyError if missing"""
+
+        labels = get_labels(pattern)
+
+        path = [self._root]
+        for label in labels:
+            try:
+                path.append(path[-1].children[label])
+            except KeyError:
+                raise KeyError((pattern, name))
+
+        entries = path[-1].entries
+        for i, (_, entry_name) in enumerate(entries):
+            if entry_name == name:
+                del entries[i]
+                break
+        else:
+            raise KeyError((pattern, name))
+        self._size -= 1
+
+        # Prune empty nodes
+        for label, parent, node in reversed(list(zip(labels, path, path[1:]))):
+            if node.entries or node.children:
+                break
+            del parent.children[label]
+
+    def lookup_all(self, url):
+        """Returns list of profile names for url, best match first"""
+
+        labels = get_labels(url)
+        n_labels = len(labels)
+
+        matches = []
+        stack = [(self._root, 0, 0)]
+        while stack:
+            node, depth, n_wildcards = stack.pop()
+
+            for n_added, name in node.entries:
+                matches.append((depth, -n_wildcards, -n_added, name))
+
+            if depth < n_labels:
+                child = node.children.get(labels[depth])
+                if child is not None:
+                    stack.append((child, depth + 1, n_wildcards))
+
+                child = node.children.get(WILDCARD)
+                if child is not None:
+                    stack.append((child, depth + 1, n_wildcards + 1))
+
+        matches.sort(reverse=True)
+        return [match[-1] for match in matches]
+
+    def lookup(self, url):
+        """Returns name of the best profile for url, None if there is none"""
+
+        matches = self.lookup_all(url)
+        if matches:
+            return matches[0]
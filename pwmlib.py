@@ -42,75 +42,246 @@ Copyright (C):
     along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
 
 This version should work with Python > 2.3 including Python 3.x.
-The pycrypto module enables additional algorithms.
+All algorithms are available. OpenSSL or pycryptodome speed up md4 and rmd160.
 
 It can be used both on the command-line and with a GUI based on TKinter.
 
 """
 
 import os
-import sys
+import binascii
+import copy
+import functools
+import hashlib
 import hmac
 import json
+import tempfile
+import threading
+import time
+from array import array
+from collections import deque, OrderedDict
 from math import ceil, log
 
 import attr
 
+from pwmhash import get_hash_constructor
+
+try:
+    _monotonic = time.monotonic
+except AttributeError:  # Python 2.x
+    _monotonic = time.time
+
 try:
-    # Do we have pycrypto ? <http://www.amk.ca/python/code/crypto>
-    from Crypto.Hash import MD4, SHA256, RIPEMD
-    HAS_CRYPTO = True
-except ImportError:
-    HAS_CRYPTO = False
+    _perf_counter_ns = time.perf_counter_ns
+except AttributeError:  # Python 2.x and Python < 3.7
+    def _perf_counter_ns():
+        """Returns monotonic time in nanoseconds"""
 
-HAS_HASHLIB = float(sys.version[:3]) >= 2.5
+        return int(_monotonic() * 1e9)
 
-if HAS_HASHLIB:
-    import hashlib
-else:
-    try:
-        import sha
-        import md5
-    except ImportError:
-        raise ImportError("No crypto library found")
+try:
+    _replace = os.replace
+except AttributeError:  # Python 2.x
+    _replace = os.rename
+
+try:
+    from collections.abc import MutableSequence
+except ImportError:  # Python 2.x
+    from collections import MutableSequence
+
+try:
+    _text_type = unicode
+except NameError:  # Python 3.x
+    _text_type = str
+
+try:
+    from sys import intern as _intern
+except ImportError:  # Python 2.x
+    _intern = intern
 
 FULL_CHARSET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz" + \
                "0123456789`~!@#$%^&*()_-+={}|[]\\:\";\'<>?,./"
 
-# ALGORITHMS tells, which algorithms are available on the current platform.
-# This depends on the Python version, i.e. if hashlib is available and on
-# the availablity of pycrypto.
+# Hash functions are provided by the backend registry in pwmhash, which
+# includes pure Python fallbacks. Therefore, all algorithms are available on
+# every platform. Backends are selected when a hash is first used.
+
+ALGORITHMS = ("md5", "hmac-md5", "sha1", "hmac-sha1", "sha256", "hmac-sha256",
+              "md4", "hmac-md4", "rmd160", "hmac-rmd160")
 
-ALGORITHM_2_HASH_FUNC = {
-    "md5": "any_md5",
-    "hmac-md5": "any_hmac_md5",
-    "sha1": "any_sha1",
-    "hmac-sha1": "any_hmac_sha1",
-}
+ALGORITHM_2_HASH_FUNC = dict((algorithm, "any_" + algorithm.replace("-", "_"))
+                             for algorithm in ALGORITHMS)
 
-HASHLIB_ALGORITHM_2_HASH_FUNC = {
-    "sha256": "any_sha256",
-    "hmac-sha256": "any_hmac_sha1",
-}
+LEET_OPTIONS = ("none", "before", "after", "both")
 
-CRYPTO_ALGORITHM_2_HASH_FUNC = {
-    "md4": "any_md4",
-    "hmac-md4": "any_hmac_md4",
-    "sha256": "any_sha256",
-    "hmac-sha256": "any_hmac_sha256",
-    "rmd160": "any_rmd160",
-    "hmac-rmd160": "any_hmac_rmd160",
-}
 
-if HAS_HASHLIB:
-    ALGORITHM_2_HASH_FUNC.update(HASHLIB_ALGORITHM_2_HASH_FUNC)
+def _bytes2int(inp):
+    """Returns raw string inp as big-endian integer"""
 
-if HAS_CRYPTO:
-    ALGORITHM_2_HASH_FUNC.update(CRYPTO_ALGORITHM_2_HASH_FUNC)
+    try:
+        return int.from_bytes(inp, "big")
+    except AttributeError:  # Python 2.x
+        return int(binascii.hexlify(inp), 16)
 
-ALGORITHMS = tuple(ALGORITHM_2_HASH_FUNC.keys())
 
-LEET_OPTIONS = ("none", "before", "after", "both")
+@attr.s
+class PwmStats(object):
+    """Call counts and cumulative nanoseconds per stage
+
+    Stages are "setup" (hash state creation), "generate" (whole password),
+    "hash" (one hash round), "rstr2any" (encoding of one hash), "leet",
+    "profile-read" and "profile-write". Leet after hashing is mostly done
+    while encoding and then counts as "rstr2any". The number of hash
+    rounds of each password is counted in rounds.
+
+    Use enable_stats for recording. Hash states are instrumented when they
+    are created, so that instances that have been created while recording
+    was disabled cost nothing extra.
+
+    Parameters
+    ----------
+
+    * hooks: List of functions (default: [])
+    \tCalled with stage and nanoseconds for each recorded call
+
+    """
+
+    hooks = attr.ib(default=attr.Factory(list))
+
+    def __attrs_post_init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clears all counters"""
+
+        with self._lock:
+            self.calls = {}
+            self.nanoseconds = {}
+            self.rounds = {}
+
+    def record(self, stage, nanoseconds):
+        """Records one call of stage that took nanoseconds"""
+
+        with self._lock:
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+            self.nanoseconds[stage] = \
+                self.nanoseconds.get(stage, 0) + nanoseconds
+
+        for hook in self.hooks:
+            hook(stage, nanoseconds)
+
+    def record_rounds(self, rounds):
+        """Records a password that took rounds hash rounds"""
+
+        with self._lock:
+            self.rounds[rounds] = self.rounds.get(rounds, 0) + 1
+
+    def wrap(self, stage, func):
+        """Returns function that calls func and records it as stage"""
+
+        record = self.record
+
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            """Calls func and records the time"""
+
+            start = _perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, _perf_counter_ns() - start)
+
+        return timed_func
+
+    def get_dict(self):
+        """Returns dict with calls and nanoseconds per stage and rounds"""
+
+        with self._lock:
+            stages = dict((stage, {"calls": self.calls[stage],
+                                   "nanoseconds": self.nanoseconds[stage]})
+                          for stage in self.calls)
+            return {"stages": stages, "rounds": dict(self.rounds)}
+
+    def format(self):
+        """Returns table of the recorded stages as string"""
+
+        stats_dict = self.get_dict()
+        lines = ["{:<16}{:>10}{:>14}{:>12}".format("stage", "calls",
+                                                   "total ms", "mean us")]
+        for stage in sorted(stats_dict["stages"]):
+            calls = stats_dict["stages"][stage]["calls"]
+            nanoseconds = stats_dict["stages"][stage]["nanoseconds"]
+            lines.append("{:<16}{:>10}{:>14.3f}{:>12.3f}".format(
+                stage, calls, nanoseconds / 1e6, nanoseconds / 1e3 / calls))
+
+        rounds = stats_dict["rounds"]
+        if rounds:
+            n_passwords = sum(rounds.values())
+            mean = sum(r * n for r, n in rounds.items()) / float(n_passwords)
+            histogram = ", ".join("{}: {}".format(r, rounds[r])
+                                  for r in sorted(rounds))
+            lines.append("hash rounds per password: mean {:.2f} ({})".format(
+                mean, histogram))
+
+        return "\n".join(lines)
+
+
+_stats = None
+
+
+def enable_stats(stats=None):
+    """Starts recording into stats, returns the PwmStats instance
+
+    If stats is None then a new PwmStats instance is used.
+
+    """
+
+    global _stats
+
+    if stats is None:
+        stats = PwmStats()
+    _stats = stats
+    return stats
+
+
+def disable_stats():
+    """Stops recording, instrumented hash states keep recording"""
+
+    global _stats
+
+    _stats = None
+
+
+def get_stats():
+    """Returns PwmStats that is recorded into, None if disabled"""
+
+    return _stats
+
+
+def _timed(stage):
+    """Decorator that records calls of a function if stats are enabled"""
+
+    def decorator(func):
+        """Returns wrapper of func"""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            """Calls func, records the time if stats are enabled"""
+
+            stats = _stats
+            if stats is None:
+                return func(*args, **kwargs)
+
+            start = _perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.record(stage, _perf_counter_ns() - start)
+
+        return wrapper
+
+    return decorator
 
 
 @attr.s
@@ -121,17 +292,17 @@ class PwmHashUtils(object):
     ----------
 
     * algorithm: String
-    \tOne valid algorithm out of "md5", "hmac-md5", "sha1", "hmac-sha1"
-    \tIf hashlib is present also out of "sha256", "hmac-sha256"
-    \tIf pycrypto is present also out of "md4", "hmac-md4", "sha256",
-    \t"hmac-sha256", "rmd160", "hmac-rmd160"
-    * encoding: String
+    \tOne valid algorithm out of ALGORITHMS
+    * encoding: String or tuple of strings
     \tCharacters that may appear in the generated password
+    * verify: Bool (default: False)
+    \tCheck each encoding against the reference long division algorithm
 
     """
 
     algorithm = attr.ib()
     encoding = attr.ib()
+    verify = attr.ib(default=False)
 
     @algorithm.validator
     def _check_algorithm(self, _, value):
@@ -140,6 +311,13 @@ class PwmHashUtils(object):
             valid_algs = ", ".join(ALGORITHMS)
             raise ValueError(msg.format(value, valid_algs))
 
+    # Maximum number of keyed HMAC states that are kept per instance.
+    # The least recently used state is dropped first.
+    max_hmac_states = 128
+
+    def __attrs_post_init__(self):
+        self._hmac_states = OrderedDict()
+
     @property
     def hash_func_wrapper(self):
         """Returns hash_function wrapper that may be used for self.algorithm"""
@@ -147,12 +325,129 @@ class PwmHashUtils(object):
         hash_func_name = ALGORITHM_2_HASH_FUNC[self.algorithm]
         return getattr(self, hash_func_name)
 
+    @property
+    def digest_func(self):
+        """Returns digest function for self.algorithm
+
+        The returned function takes the arguments key and data and returns
+        the raw digest. For non-hmac algorithms, key and data are
+        concatenated.
+
+        """
+
+        if self.algorithm.startswith("hmac-"):
+            hashfunc = get_hash_constructor(self.algorithm[5:])
+            hmac_digest = self.hmac_digest
+
+            def digest(key, data):
+                """Returns HMAC digest of data"""
+
+                return hmac_digest(key, data, hashfunc)
+        else:
+            hashfunc = get_hash_constructor(self.algorithm)
+
+            def digest(key, data):
+                """Returns digest of key and data"""
+
+                return hashfunc(key + data).digest()
+
+        return digest
+
     def rstr2any(self, inp, trim=True):
         """Convert a raw string to encoded string
 
         Set trim to false for keeping leading zeros.
         The generated string only contains characters from self.charset.
 
+        The raw string is read as one big-endian integer, which is then
+        converted to base len(self.encoding). If self.verify is True then
+        the result is checked against rstr2any_longdivision.
+
+        """
+
+        encoding = self.encoding
+        divisor = len(encoding)
+
+        if not inp:
+            output = ""
+
+        else:
+            dividend = _bytes2int(inp)
+
+            chars = []
+            if trim:
+                while True:
+                    dividend, remainder = divmod(dividend, divisor)
+                    chars.append(encoding[remainder])
+                    if not dividend:
+                        break
+            else:
+                for _ in range(self._get_full_length(inp)):
+                    dividend, remainder = divmod(dividend, divisor)
+                    chars.append(encoding[remainder])
+
+            chars.reverse()
+            output = "".join(chars)
+
+        if self.verify:
+            reference = self.rstr2any_longdivision(inp, trim)
+            if output != reference:
+                msg = "rstr2any mismatch for {!r}: {!r} != {!r}"
+                raise RuntimeError(msg.format(inp, output, reference))
+
+        return output
+
+    def rstr2any_many(self, digests, trim=True):
+        """Convert many raw strings of equal length to encoded strings
+
+        digests is either a (N, digest length) uint8 numpy array or a
+        sequence of raw strings. If numpy is available then all digests are
+        converted at once with the long division vectorized over the batch.
+        Otherwise, rstr2any is called for each digest. Returns a list of
+        strings that are identical to the rstr2any results.
+
+        """
+
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+        if numpy is None or not len(digests):
+            return [self.rstr2any(digest, trim) for digest in digests]
+
+        if not isinstance(digests, numpy.ndarray):
+            digest_lengths = set(len(digest) for digest in digests)
+            if len(digest_lengths) != 1:
+                raise ValueError("Digests differ in length.")
+            digests = numpy.frombuffer(b"".join(digests), dtype=numpy.uint8)
+            digests = digests.reshape(-1, digest_lengths.pop())
+
+        output = _rstr2any_numpy(numpy, digests, self.encoding,
+                                 self._get_full_length(digests[0]), trim)
+
+        if self.verify:
+            for digest, encoded in zip(digests, output):
+                reference = self.rstr2any(digest.tobytes(), trim)
+                if encoded != reference:
+                    msg = "rstr2any_many mismatch for {!r}: {!r} != {!r}"
+                    raise RuntimeError(msg.format(digest.tobytes(), encoded,
+                                                  reference))
+
+        return output
+
+    def _get_full_length(self, inp):
+        """Returns number of characters of an untrimmed encoding of inp"""
+
+        return int(ceil(float(len(inp) * 8) /
+                        (log(len(self.encoding)) / log(2))))
+
+    def rstr2any_longdivision(self, inp, trim=True):
+        """Convert a raw string to encoded string via 16 bit long division
+
+        This is the original, slow algorithm of PasswordMaker. It is kept
+        as reference for rstr2any.
+
         """
 
         encoding = self.encoding
@@ -197,11 +492,9 @@ class PwmHashUtils(object):
                 remainders.append(remainder)
 
         else:
-            full_length = ceil(float(len(inp) * 8) /
-                               (log(len(encoding)) / log(2)))
-            for j in range(len(full_length)):
+            for _ in range(self._get_full_length(inp)):
                 dividend, remainder = get_quotient_remainder(dividend)
-                remainders[j] = remainder
+                remainders.append(remainder)
 
         # Convert the remainders to the output string
         output = ""
@@ -210,84 +503,399 @@ class PwmHashUtils(object):
 
         return output
 
+    def hmac_digest(self, key, inp, hashfunc):
+        """Returns HMAC digest of inp
+
+        The HMAC state after processing the padded key is computed once per
+        key and copied for each message. Since keys are derived from the
+        master password, they are shared by all passwords of a user. At most
+        max_hmac_states states are kept, the least recently used one is
+        dropped first.
+
+        """
+
+        hmac_states = self._hmac_states
+        try:
+            keyed_hmac = hmac_states[key]
+        except KeyError:
+            if len(hmac_states) >= self.max_hmac_states:
+                hmac_states.popitem(last=False)
+            keyed_hmac = hmac.new(key, digestmod=hashfunc)
+            hmac_states[key] = keyed_hmac
+        else:
+            try:
+                hmac_states.move_to_end(key)
+            except KeyError:
+                pass  # Dropped by another thread
+            except AttributeError:  # Python 2.x
+                hmac_states[key] = hmac_states.pop(key, keyed_hmac)
+
+        message_hmac = keyed_hmac.copy()
+        message_hmac.update(inp)
+        return message_hmac.digest()
+
     def any_md5(self, inp, trim=True):
         """MD5 function wrapper"""
 
-        if HAS_HASHLIB:
-            __hash = hashlib.md5(inp).digest()
-        else:
-            __hash = md5.new(inp).digest()
+        __hash = get_hash_constructor("md5")(inp).digest()
         return self.rstr2any(__hash, trim)
 
     def any_hmac_md5(self, key, inp, trim=True):
         """MD5 HMAC function wrapper"""
 
-        if HAS_HASHLIB:
-            hashfunc = hashlib.md5
-        else:
-            hashfunc = md5
-        return self.rstr2any(hmac.new(key, inp, hashfunc).digest(), trim)
+        hashfunc = get_hash_constructor("md5")
+        return self.rstr2any(self.hmac_digest(key, inp, hashfunc), trim)
 
     def any_sha1(self, inp, trim=True):
         """SHA1 function wrapper"""
 
-        if HAS_HASHLIB:
-            __hash = hashlib.sha1(inp).digest()
-        else:
-            __hash = sha.new(inp).digest()
+        __hash = get_hash_constructor("sha1")(inp).digest()
         return self.rstr2any(__hash, trim)
 
     def any_hmac_sha1(self, key, inp, trim=True):
         """SHA1 HMAC function wrapper"""
 
-        if HAS_HASHLIB:
-            hashfunc = hashlib.sha1
-        else:
-            hashfunc = sha
-        return self.rstr2any(hmac.new(key, inp, hashfunc).digest(), trim)
+        hashfunc = get_hash_constructor("sha1")
+        return self.rstr2any(self.hmac_digest(key, inp, hashfunc), trim)
 
     def any_sha256(self, inp, trim=True):
         """SHA256 function wrapper"""
 
-        if HAS_HASHLIB:
-            __hash = hashlib.sha256(inp).digest()
-        else:
-            __hash = SHA256.new(inp).digest()
+        __hash = get_hash_constructor("sha256")(inp).digest()
         return self.rstr2any(__hash, trim)
 
     def any_hmac_sha256(self, key, inp, trim=True):
         """SHA256 HMAC function wrapper"""
 
-        if HAS_HASHLIB:
-            hashfunc = hashlib.sha256
-        else:
-            hashfunc = SHA256
-        return self.rstr2any(hmac.new(key, inp, hashfunc).digest(), trim)
+        hashfunc = get_hash_constructor("sha256")
+        return self.rstr2any(self.hmac_digest(key, inp, hashfunc), trim)
 
     def any_md4(self, inp, trim=True):
         """MD4 function wrapper"""
 
-        return self.rstr2any(MD4.new(inp).digest(), trim)
+        __hash = get_hash_constructor("md4")(inp).digest()
+        return self.rstr2any(__hash, trim)
 
     def any_hmac_md4(self, key, inp, trim=True):
         """MD4 HMAC function wrapper"""
 
-        return self.rstr2any(hmac.new(key, inp, MD4).digest(), trim)
+        hashfunc = get_hash_constructor("md4")
+        return self.rstr2any(self.hmac_digest(key, inp, hashfunc), trim)
 
     def any_rmd160(self, inp, trim=True):
         """RMD160 function wrapper"""
 
-        return self.rstr2any(RIPEMD.new(inp).digest(), trim)
+        __hash = get_hash_constructor("rmd160")(inp).digest()
+        return self.rstr2any(__hash, trim)
 
     def any_hmac_rmd160(self, key, inp, trim=True):
         """RMD160 HMAC function wrapper"""
 
-        return self.rstr2any(hmac.new(key, inp, RIPEMD).digest(), trim)
+        hashfunc = get_hash_constructor("rmd160")
+        return self.rstr2any(self.hmac_digest(key, inp, hashfunc), trim)
+
+
+def _rstr2any_numpy(numpy, digests, encoding, n_digits, trim):
+    """Returns list of encoded strings for a (N, L) uint8 array of digests
+
+    This is the vectorized counterpart of PwmHashUtils.rstr2any. Digests
+    are split into 32-bit big-endian words, and the long division runs over
+    all digests at once. Each division step uses the largest power of
+    len(encoding) below 2 ** 32 as divisor, so that it yields several
+    digits. n_digits is the number of digits of an untrimmed encoding.
+
+    """
+
+    digests = numpy.asarray(digests, dtype=numpy.uint8)
+    n_digests, digest_length = digests.shape
+
+    if not digest_length:
+        return [""] * n_digests
+
+    padding_length = -digest_length % 4
+    if padding_length:
+        padding = numpy.zeros((n_digests, padding_length), dtype=numpy.uint8)
+        digests = numpy.hstack((padding, digests))
+
+    words = numpy.ascontiguousarray(digests).view(">u4").astype(numpy.uint64)
+    n_words = words.shape[1]
+
+    base = len(encoding)
+    digits_per_step = 1
+    while base ** (digits_per_step + 1) <= 1 << 32:
+        digits_per_step += 1
+    n_steps = -(-n_digits // digits_per_step)
+
+    step_divisor = numpy.uint64(base ** digits_per_step)
+    shift = numpy.uint64(32)
+
+    # step_remainders holds the most significant remainder in column 0
+    step_remainders = numpy.zeros((n_digests, n_steps), dtype=numpy.uint64)
+
+    first_word = 0
+    for j in range(n_steps - 1, -1, -1):
+        # Leading words that are zero for all digests are skipped
+        while first_word < n_words and not words[:, first_word].any():
+            first_word += 1
+        if first_word == n_words:
+            break
+
+        remainder = numpy.zeros(n_digests, dtype=numpy.uint64)
+        for k in range(first_word, n_words):
+            current = (remainder << shift) | words[:, k]
+            quotient = current // step_divisor
+            remainder = current - quotient * step_divisor
+            words[:, k] = quotient
+        step_remainders[:, j] = remainder
+
+    # Split the remainders of each step into digits_per_step digits
+    digits = numpy.empty((n_digests, n_steps, digits_per_step),
+                         dtype=numpy.intp)
+    base = numpy.uint64(base)
+    for i in range(digits_per_step - 1, -1, -1):
+        digits[:, :, i] = step_remainders % base
+        step_remainders //= base
+    digits = digits.reshape(n_digests, -1)[:, -n_digits:]
+
+    if trim:
+        nonzero = digits != 0
+        first_digits = numpy.where(nonzero.any(axis=1),
+                                   nonzero.argmax(axis=1), n_digits - 1)
+    else:
+        first_digits = numpy.zeros(n_digests, dtype=numpy.intp)
+
+    single_chars = all(len(char) == 1 and char != "\0" for char in encoding)
+
+    if single_chars:
+        codes = numpy.array([ord(char) for char in encoding],
+                            dtype=numpy.uint32)
+        chars = numpy.ascontiguousarray(codes[digits])
+        strings = chars.view(numpy.dtype(("U", n_digits))).ravel().tolist()
+        return [string[first_digit:] for string, first_digit
+                in zip(strings, first_digits.tolist())]
+
+    return ["".join([encoding[digit] for digit in row[first_digit:]])
+            for row, first_digit in zip(digits.tolist(),
+                                        first_digits.tolist())]
+
+
+@attr.s
+class PwmHashState(object):
+    """Hash setup that is shared by all passwords with the same master key
+
+    The algorithm is resolved, the charset is checked and the key is
+    encoded once so that many passwords can be generated cheaply.
+
+    Parameters
+    ----------
+
+    * hash_algorithm: String
+    \tHash algorithm from ALGORITHMS
+    * key: String
+    \tPassword key, normally maps from master password(!)
+    * charset: String
+    \tCharacters that may appear in the generated password
+    * use_leet: String (default: "none")
+    \tUse leet speech. May be from ["none", "before", "after", "both"]
+    * leet_level: Integer (default: 0)
+    \tl33t level may be from [1-9]. Other values disable leet
+
+    """
+
+    hash_algorithm = attr.ib()
+    key = attr.ib(repr=False)
+    charset = attr.ib()
+    use_leet = attr.ib(default="none")
+    leet_level = attr.ib(default=0)
+
+    def __attrs_post_init__(self):
+        stats = _stats
+        if stats is not None:
+            start = _perf_counter_ns()
+            self._leet = stats.wrap("leet", leet)
+        else:
+            self._leet = leet
+
+        # If the charset's length < 2 the hash algorithms will run
+        # indefinitely.
+
+        if len(self.charset) < 2:
+            msg = "The charset {} contains less than 2 characters."
+            raise ValueError(msg.format(self.charset))
+
+        self.leet_before = self.use_leet in ("before", "both")
+        self.leet_after = self.use_leet in ("after", "both")
+
+        # Apply l33t after the algorithm while encoding if possible
+        encoding = self.charset
+        if self.leet_after:
+            leet_chars = leet_encoding(self.leet_level, self.charset)
+            if leet_chars is not None:
+                encoding = leet_chars
+                self.leet_after = False
+
+        hash_utils = PwmHashUtils(self.hash_algorithm, encoding)
+        self.digest_func = hash_utils.digest_func
+        self.rstr2any = hash_utils.rstr2any
+
+        # Apply l33t before the algorithm?
+        key = self.key
+        if self.leet_before:
+            key = self._leet(self.leet_level, key)
+
+        # Ensure encoding to avoid Python3 issues
+        self._round_keys = [key.encode("utf-8")]
+        self._round_keys_lock = threading.Lock()
+
+        if stats is not None:
+            self._instrument(stats)
+            stats.record("setup", _perf_counter_ns() - start)
+
+    def _instrument(self, stats):
+        """Records hashing, encoding and generate calls in stats
+
+        The uninstrumented methods are replaced by timed wrappers, so that
+        generate itself contains no instrumentation.
+
+        """
+
+        rounds = threading.local()
+
+        digest_func = stats.wrap("hash", self.digest_func)
+
+        def counting_digest_func(key, data):
+            """Hashes and counts the round"""
+
+            rounds.count += 1
+            return digest_func(key, data)
+
+        self.digest_func = counting_digest_func
+        self.rstr2any = stats.wrap("rstr2any", self.rstr2any)
+
+        generate = self.generate
+
+        @functools.wraps(generate)
+        def timed_generate(*args, **kwargs):
+            """Generates password, records the time and hash rounds"""
+
+            rounds.count = 0
+            start = _perf_counter_ns()
+            password = generate(*args, **kwargs)
+            stats.record("generate", _perf_counter_ns() - start)
+            stats.record_rounds(rounds.count)
+            return password
+
+        self.generate = timed_generate
+
+    def get_round_key(self, i):
+        """Returns the key for hash round i
+
+        Round keys are computed on first use and kept for later passwords.
+        The instance may be shared between threads.
+
+        """
+
+        round_keys = self._round_keys
+        with self._round_keys_lock:
+            while len(round_keys) <= i:
+                round_no = str(len(round_keys)).encode("utf-8")
+                round_keys.append(round_keys[0] + b"\n" + round_no)
+        return round_keys[i]
+
+    def generate(self, data, password_length, prefix="", suffix=""):
+        """Generates PasswordMaker password for data
+
+        Parameters
+        ----------
+
+        * data: String
+        \tBase data string, normally concatenates url, username and modifier
+        * password_length: Integer
+        \tLength of the generated password, must be in range(2, 129)
+        * prefix: String (default: "")
+        \tPassword prefix
+        * suffix: String (default: "")
+        \tPassword suffix
+
+        """
+
+        digest_func = self.digest_func
+        rstr2any = self.rstr2any
+        round_keys = self._round_keys
+
+        if self.leet_before:
+            data = self._leet(self.leet_level, data)
+
+        data = data.encode("utf-8")
+
+        password = ''
+
+        for i in range(1000):
+            try:
+                key = round_keys[i]
+            except IndexError:
+                key = self.get_round_key(i)
+
+            password += rstr2any(digest_func(key, data))
+
+            if len(password) >= password_length:
+                break
+
+        # Apply l33t after the algorithm?
+        if self.leet_after:
+            password = self._leet(self.leet_level, password)
+
+        if prefix:
+            password = prefix + password
+        if suffix:
+            password = password[:password_length-len(suffix)] + suffix
+
+        return password[:password_length]
 
 
 @attr.s
+class PasswordGenerator(object):
+    """Password generator that is compiled once from PwmSettings
+
+    All settings except URL, Username and Modifier are resolved when the
+    generator is created. Later changes to settings are not reflected.
+
+    Parameters
+    ----------
+
+    * settings: PwmSettings
+    \tSettings instance
+
+    """
+
+    settings = attr.ib(repr=False)
+
+    def __attrs_post_init__(self):
+        settings = self.settings
+
+        hash_state = PwmHashState(settings.Algorithm, settings.MasterPass,
+                                  settings.CharacterSet, settings.UseLeet,
+                                  settings.LeetLvl)
+        self._generate = hash_state.generate
+        self._password_length = settings.Length
+        self._prefix = settings.Prefix
+        self._suffix = settings.Suffix
+
+    def __call__(self, url="", username="", modifier=""):
+        """Returns password for url, username and modifier"""
+
+        return self._generate(url + username + modifier,
+                              self._password_length, self._prefix,
+                              self._suffix)
+
+
+@attr.s(slots=True)
 class PwmSettings(object):
-    """Setting class holding all parameters for hash generation"""
+    """Setting class holding all parameters for hash generation
+
+    Instances have no __dict__ so that large profile collections stay small.
+
+    """
 
     int_val = attr.validators.instance_of(int)
     str_val = attr.validators.instance_of(str)
@@ -366,102 +974,866 @@ class PwmSettings(object):
     def load(self, filepath='pwm.settings'):
         """Loads setting from a json file"""
 
-        with open(filepath) as infile:
-            file_dict = json.load(infile)
+        self.load_dict(_read_json(filepath))
 
-        passwd_filter = self._get_attr_filters()
-        attr_fields = attr.asdict(self, filter=passwd_filter)
+    def load_dict(self, file_dict):
+        """Loads setting from a dict as read from a json file
 
-        try:
-            for attr_key in attr_fields:
-                if attr_key in file_dict:
-                    self.__setattr__(attr_key, file_dict[attr_key])
-                    try:
-                        attr.validate(self)
-                    except TypeError:
-                        # Python 2 fix
-                        value = file_dict[attr_key].encode("utf-8")
-                        self.__setattr__(attr_key, value)
-                        attr.validate(self)
-
-        except TypeError as err:
-            # If attrs are of the wrong type then roll back
-            for attr_key in attr_fields:
-                self.__setattr__(attr_key, attr_fields[attr_key])
-            raise TypeError(err)
+        All values are checked in one pass before any attribute is set.
+        A value of the wrong type raises a TypeError, an invalid algorithm
+        or leet option raises a ValueError. In both cases, the settings
+        remain unchanged.
 
-    def save(self, filepath='pwm.settings'):
-        """Saves setting to a json file"""
+        """
 
-        passwd_filter = self._get_attr_filters()
-        attr_dict = attr.asdict(self, filter=passwd_filter)
+        for name, value in _check_settings_dict(file_dict):
+            self.__setattr__(name, value)
 
-        with open(filepath, 'w') as outfile:
-            json.dump(attr_dict, outfile, sort_keys=True, indent=4)
+    @classmethod
+    def from_dicts(cls, file_dicts):
+        """Returns list of PwmSettings from an iterable of dicts
 
+        Each dict is loaded as in load_dict into a copy of the default
+        settings. Missing values keep their defaults.
 
-@attr.s
-class PwmSettingsList(object):
-    """Stores a list of PwmSettings"""
+        """
 
-    current = attr.ib(default="default")
-    pwm_names = attr.ib(default=["default"])
-    pwms = attr.ib(default=[PwmSettings()])
+        default_pwm = cls()
 
-    def get_pwm_settings(self):
-        """Returns current PwmSettings"""
+        pwms = []
+        for file_dict in file_dicts:
+            pwm = copy.copy(default_pwm)
+            pwm.load_dict(file_dict)
+            pwms.append(pwm)
 
-        pwm_idx = self.pwm_names.index(self.current)
-        return self.pwms[pwm_idx]
+        return pwms
 
-    def load(self, directory="."):
-        """Loads all PWM_setting files from current directory"""
+    def compile(self):
+        """Returns PasswordGenerator for the current settings"""
 
-        filenames = [f for f in os.listdir(directory)
-                     if f.endswith(".setting")]
-        filenames.sort()
-        pwm_names = [f[4:-8] for f in filenames]
+        return PasswordGenerator(self)
 
-        self.pwm_names = []
-        self.pwms = []
-        for pwm_name, filename in zip(pwm_names, filenames):
-            pwm = PwmSettings()
-            pwm.load(filename)
+    def save(self, filepath='pwm.settings'):
+        """Saves setting to a json file
 
-            if pwm_name == "default":
-                self.pwm_names.insert(0, pwm_name)
-                self.pwms.insert(0, pwm)
-            else:
-                self.pwm_names.append(pwm_name)
-                self.pwms.append(pwm)
+        The file is replaced atomically so that readers never see partially
+        written JSON.
 
-        if not pwm_names:
-            self.pwm_names.append("default")
-            self.pwms.append(PwmSettings())
+        """
 
-        if "default" in pwm_names:
+        _write_atomic(filepath, json.dumps(self.get_dict(), sort_keys=True,
+                                           indent=4))
+
+    def get_dict(self):
+        """Returns dict of the settings without master password"""
+
+        passwd_filter = self._get_attr_filters()
+        return attr.asdict(self, filter=passwd_filter)
+
+
+# Names of the PwmSettings attributes that are saved to files
+_SAVED_SETTING_NAMES = tuple(field.name for field in attr.fields(PwmSettings)
+                             if field.name != "MasterPass")
+
+
+def _compile_settings_schema():
+    """Returns tuple of (name, type, options, shared) for saved attributes
+
+    Either type is a type that the value must be an instance of or options
+    is a tuple that must contain the value. The other one is None. If shared
+    is True then equal values are stored as one object.
+
+    """
+
+    field_checks = {
+        "str": (str, None),
+        "int": (int, None),
+        "alg": (None, ALGORITHMS),
+        "l3t": (None, LEET_OPTIONS),
+    }
+
+    fields = attr.fields_dict(PwmSettings)
+    return tuple((name,) + field_checks[fields[name].type] +
+                 (name in _SHARED_SETTING_NAMES,)
+                 for name in _SAVED_SETTING_NAMES)
+
+
+# Attributes whose values repeat across many profiles
+_SHARED_SETTING_NAMES = ("Algorithm", "CharacterSet", "UseLeet")
+
+_SETTINGS_SCHEMA = _compile_settings_schema()
+
+
+def _check_settings_dict(file_dict):
+    """Returns list of (name, value) of the valid settings in file_dict
+
+    Keys that are no saved PwmSettings attributes are ignored. Values of
+    shared attributes are interned.
+
+    """
+
+    values = []
+    for name, value_type, options, shared in _SETTINGS_SCHEMA:
+        try:
+            value = file_dict[name]
+        except KeyError:
+            continue
+
+        if value_type is not None and not isinstance(value, value_type):
+            if isinstance(value, _text_type):
+                # Python 2 fix
+                value = value.encode("utf-8")
+            if not isinstance(value, value_type):
+                msg = "'{}' must be {!r} (got {!r} that is a {!r})."
+                raise TypeError(msg.format(name, value_type, value,
+                                           value.__class__))
+
+        if options is not None:
+            try:
+                value = options[options.index(value)]
+            except ValueError:
+                msg = "'{}' must be in {!r} (got {!r})"
+                raise ValueError(msg.format(name, options, value))
+        elif shared and isinstance(value, str):
+            value = _intern(value)
+
+        values.append((name, value))
+
+    return values
+
+
+@_timed("profile-read")
+def _read_json(filepath):
+    """Returns object from a json file"""
+
+    with open(filepath) as infile:
+        return json.load(infile)
+
+
+@_timed("profile-write")
+def _write_atomic(filepath, text):
+    """Writes text to filepath via a temporary file that is renamed"""
+
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".pwm",
+                                    suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as outfile:
+            outfile.write(text)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        _replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _get_fingerprint(filepath):
+    """Returns (mtime, size, inode) of filepath, None if it is missing"""
+
+    try:
+        stat_result = os.stat(filepath)
+    except OSError:
+        return None
+
+    mtime = getattr(stat_result, "st_mtime_ns", stat_result.st_mtime)
+    return mtime, stat_result.st_size, stat_result.st_ino
+
+
+def _list_setting_names(directory, names=None):
+    """Returns names of the profiles with setting files in directory
+
+    Parameters
+    ----------
+
+    * directory: String
+    \tDirectory with pwm.<name>.setting files
+    * names: Iterable of strings (default: None)
+    \tNames of the profiles to look for, None for all profiles.
+    \tMissing profiles are ignored.
+
+    """
+
+    if names is None:
+        filenames = [f for f in os.listdir(directory)
+                     if f.endswith(".setting")]
+    else:
+        filenames = [f for f in ("pwm." + name + ".setting"
+                                 for name in names)
+                     if os.path.isfile(os.path.join(directory, f))]
+
+    return [f[4:-8] for f in filenames]
+
+
+@attr.s
+class _PwmSettingsFile(object):
+    """Placeholder for a PwmSettings that has not been loaded yet"""
+
+    name = attr.ib()
+    filepath = attr.ib()
+
+
+class _LazyPwmList(MutableSequence):
+    """List of PwmSettings that are loaded from their files on first access
+
+    Parameters
+    ----------
+
+    * items: Iterable of PwmSettings or _PwmSettingsFile
+    \tInitial list items
+    * on_load: Function (default: None)
+    \tCalled with profile name, PwmSettings and the fingerprint of the
+    \tfile when a file has been loaded
+
+    """
+
+    def __init__(self, items=(), on_load=None):
+        self._items = list(items)
+        self._on_load = on_load
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, self._items)
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    def _load(self, idx):
+        """Returns item idx, loads it if it is a _PwmSettingsFile"""
+
+        item = self._items[idx]
+        if not isinstance(item, _PwmSettingsFile):
+            return item
+
+        # Taken first so that a concurrent change is detected on reload
+        fingerprint = _get_fingerprint(item.filepath)
+
+        pwm = PwmSettings()
+        pwm.load(item.filepath)
+        self._items[idx] = pwm
+
+        if self._on_load is not None:
+            self._on_load(item.name, pwm, fingerprint)
+
+        return pwm
+
+    def is_loaded(self, idx):
+        """Returns False if item idx has not been loaded yet"""
+
+        return not isinstance(self._items[idx], _PwmSettingsFile)
+
+    def get_unloaded(self, idx):
+        """Returns item idx without loading it"""
+
+        return self._items[idx]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._load(i) for i in range(*idx.indices(len(self)))]
+        return self._load(idx)
+
+    def __setitem__(self, idx, value):
+        self._items[idx] = value
+
+    def __delitem__(self, idx):
+        del self._items[idx]
+
+    def __len__(self):
+        return len(self._items)
+
+    def insert(self, idx, value):
+        self._items.insert(idx, value)
+
+
+@attr.s
+class PwmSettingsList(object):
+    """Stores a list of PwmSettings
+
+    Profiles are loaded lazily, i.e. load only collects the profile names
+    and each setting file is parsed and validated on first access of its
+    PwmSettings. Errors in a setting file are raised on that access.
+
+    The saved state of each profile is recorded on load and save, so that
+    save only writes profiles that have been added or modified and only
+    removes files of deleted profiles. The modification time, size and
+    inode of each setting file are recorded when it is parsed or saved, so
+    that reload only parses files that have been added or changed on disk.
+
+    """
+
+    current = attr.ib(default="default")
+    pwm_names = attr.ib(default=attr.Factory(lambda: ["default"]))
+    pwms = attr.ib(default=attr.Factory(lambda: [PwmSettings()]))
+
+    def __attrs_post_init__(self):
+        self._saved_directory = None
+        self._saved_states = {}
+        self._fingerprints = {}
+
+    def get_pwm_settings(self):
+        """Returns current PwmSettings"""
+
+        pwm_idx = self.pwm_names.index(self.current)
+        return self.pwms[pwm_idx]
+
+    @staticmethod
+    def _get_filepath(directory, pwm_name):
+        """Returns path of the setting file of pwm_name in directory"""
+
+        return os.path.join(directory, "pwm." + pwm_name + ".setting")
+
+    @staticmethod
+    def _get_state(pwm):
+        """Returns tuple of the values of pwm that are saved"""
+
+        return tuple(getattr(pwm, name) for name in _SAVED_SETTING_NAMES)
+
+    def _is_loaded(self, pwm_idx):
+        """Returns False if profile pwm_idx has not been loaded yet"""
+
+        try:
+            return self.pwms.is_loaded(pwm_idx)
+        except AttributeError:
+            return True
+
+    def _set_saved(self, directory):
+        """Records the current profiles as saved in directory
+
+        The state of profiles that have not been loaded yet is None until
+        they are loaded.
+
+        """
+
+        self._saved_directory = os.path.abspath(directory)
+        self._saved_states = {}
+        for pwm_idx, name in enumerate(self.pwm_names):
+            if self._is_loaded(pwm_idx):
+                self._saved_states[name] = self._get_state(self.pwms[pwm_idx])
+            else:
+                self._saved_states[name] = None
+
+    def _get_unloaded(self, pwm_idx):
+        """Returns profile pwm_idx without loading it"""
+
+        try:
+            return self.pwms.get_unloaded(pwm_idx)
+        except AttributeError:
+            return self.pwms[pwm_idx]
+
+    def _is_placeholder(self, name):
+        """Returns True if name is the unedited placeholder "default"
+
+        The placeholder is added if a directory has no profiles.
+
+        """
+
+        return name == "default" and name not in self._saved_states and \
+            self._get_state(self.pwms[self.pwm_names.index(name)]) == \
+            self._get_state(PwmSettings())
+
+    def _set_files(self, directory, pwm_names, pwms):
+        """Sets profiles to those of pwm_names in directory
+
+        Profiles are sorted by file name, the profile "default" comes first.
+        Profiles in the dict pwms are taken from there, the others are
+        loaded lazily.
+
+        """
+
+        filenames = sorted("pwm." + name + ".setting" for name in pwm_names)
+
+        self.pwm_names = []
+        self.pwms = _LazyPwmList(on_load=self._on_load)
+        for filename in filenames:
+            pwm_name = filename[4:-8]
+            try:
+                pwm = pwms[pwm_name]
+            except KeyError:
+                pwm = _PwmSettingsFile(pwm_name,
+                                       os.path.join(directory, filename))
+
+            if pwm_name == "default":
+                self.pwm_names.insert(0, pwm_name)
+                self.pwms.insert(0, pwm)
+            else:
+                self.pwm_names.append(pwm_name)
+                self.pwms.append(pwm)
+
+        self._set_saved(directory)
+
+        if not pwm_names:
+            self.pwm_names.append("default")
+            self.pwms.append(PwmSettings())
+
+    def _on_load(self, name, pwm, fingerprint):
+        """Records the saved state of a profile that has just been loaded"""
+
+        if name in self._saved_states and self._saved_states[name] is None:
+            self._saved_states[name] = self._get_state(pwm)
+            self._fingerprints[name] = fingerprint
+
+    def get_changes(self):
+        """Returns names of changed and of deleted profiles
+
+        Changed profiles have been added or modified since the last load or
+        save. Master passwords are ignored because they are not saved.
+
+        """
+
+        changed = []
+        for pwm_idx, name in enumerate(self.pwm_names):
+            if not self._is_loaded(pwm_idx) and name in self._saved_states:
+                continue  # Unloaded profiles are unchanged
+
+            pwm = self.pwms[pwm_idx]
+            if self._saved_states.get(name) != self._get_state(pwm):
+                changed.append(name)
+
+        pwm_names = set(self.pwm_names)
+        deleted = sorted(name for name in self._saved_states
+                         if name not in pwm_names)
+
+        return changed, deleted
+
+    def get_local_changes(self):
+        """Returns names of changed and of deleted profiles that are unsaved
+
+        As get_changes, but the unedited placeholder "default" of a new list
+        or of a directory without profiles is left out. These are the
+        changes that reload keeps and that are lost without saving.
+
+        """
+
+        changed, deleted = self.get_changes()
+        changed = [name for name in changed if not self._is_placeholder(name)]
+        return changed, deleted
+
+    def load(self, directory=".", names=None):
+        """Collects PWM_setting files from directory
+
+        Parameters
+        ----------
+
+        * directory: String (default: ".")
+        \tDirectory with pwm.<name>.setting files
+        * names: Iterable of strings (default: None)
+        \tNames of the profiles to collect, None for all profiles.
+        \tMissing profiles are ignored.
+
+        """
+
+        pwm_names = _list_setting_names(directory, names)
+
+        self._fingerprints = {}
+        self._set_files(directory, pwm_names, {})
+
+        if "default" in pwm_names:
             self.current = "default"
         else:
             self.current = self.pwm_names[0]
 
+    def reload(self, directory=None, keep_changes=True):
+        """Updates profiles from directory, parses only changed files
+
+        Without unsaved changes, the profiles are the same as after
+        load(directory). Loaded profiles whose setting files have the same
+        modification time, size and inode as when they were parsed or saved
+        and that have not been modified since are kept, so that their files
+        are not parsed again. Profiles that have not been loaded yet are
+        kept as they are, too, because they are parsed from the current
+        file on first access. The current profile is kept if it still
+        exists.
+
+        Parameters
+        ----------
+
+        * directory: String (default: None)
+        \tDirectory with pwm.<name>.setting files, None for the directory
+        \tof the last load or save or, if there is none, "."
+        * keep_changes: Bool (default: True)
+        \tIf True, profiles with unsaved changes, see get_changes, are
+        \tkept as they are and remain changed. If False, they are
+        \treplaced by the files. Changes are only kept when the directory
+        \tof the last load or save is reloaded.
+
+        Returns lists of the names of added, changed and removed profiles.
+
+        """
+
+        if directory is None:
+            directory = self._saved_directory or "."
+
+        old_indices = dict((name, i) for i, name in enumerate(self.pwm_names))
+        pwm_names = _list_setting_names(directory)
+
+        same_directory = self._saved_directory == os.path.abspath(directory)
+        local_changes = set()
+        local_deletions = set()
+        if same_directory:
+            modified, deleted = self.get_changes()
+            if keep_changes:
+                local_changes = set(name for name in modified
+                                    if not self._is_placeholder(name))
+                local_deletions = set(deleted)
+                # Locally added profiles have no files
+                pwm_names = [name for name in pwm_names
+                             if name not in local_deletions]
+                pwm_names.extend(name for name in local_changes
+                                 if name not in pwm_names)
+            modified = set(modified)
+
+        saved_states = self._saved_states
+        added = []
+        changed = []
+        kept = {}
+        fingerprints = {}
+        for name in sorted(pwm_names):
+            if name in local_changes:
+                kept[name] = self.pwms[old_indices[name]]
+                continue
+
+            try:
+                pwm_idx = old_indices[name]
+            except KeyError:
+                added.append(name)
+                continue
+
+            if not same_directory or name in modified:
+                changed.append(name)
+            elif not self._is_loaded(pwm_idx):
+                kept[name] = self._get_unloaded(pwm_idx)
+            else:
+                fingerprint = self._fingerprints.get(name)
+                filepath = self._get_filepath(directory, name)
+                if fingerprint is not None and \
+                   fingerprint == _get_fingerprint(filepath):
+                    kept[name] = self.pwms[pwm_idx]
+                    fingerprints[name] = fingerprint
+                else:
+                    changed.append(name)
+
+        current = self.current
+        self._fingerprints = fingerprints
+        self._set_files(directory, pwm_names, kept)
+
+        # Kept changes remain unsaved
+        for name in local_changes:
+            if name in saved_states:
+                self._saved_states[name] = saved_states[name]
+            else:
+                del self._saved_states[name]
+        for name in local_deletions:
+            self._saved_states[name] = saved_states[name]
+
+        new_names = set(self.pwm_names)
+        removed = sorted(name for name in old_indices
+                         if name not in new_names)
+
+        if current in new_names:
+            self.current = current
+        elif "default" in new_names:
+            self.current = "default"
+        else:
+            self.current = self.pwm_names[0]
+
+        return added, changed, removed
+
     def save(self, directory="."):
-        """Saves all PWM_setting files from current directory"""
+        """Saves PWM_setting files to directory
 
-        for name, pwm in zip(self.pwm_names, self.pwms):
-            pwm.save(filepath="pwm."+name+".setting")
+        If the profiles have been loaded from or saved to directory before
+        then only changed profiles are written and only files of deleted
+        profiles are removed. Otherwise, all profiles are written and all
+        other setting files in directory are removed.
+
+        """
+
+        if self._saved_directory == os.path.abspath(directory):
+            changed, deleted = self.get_changes()
+        else:
+            self._fingerprints = {}
+            changed = self.pwm_names
+            filenames = [f for f in os.listdir(directory)
+                         if f.endswith(".setting")]
+            deleted = [f[4:-8] for f in filenames
+                       if f[4:-8] not in self.pwm_names]
+
+        pwm_indices = dict((name, i) for i, name in enumerate(self.pwm_names))
+        for pwm_name in changed:
+            pwm = self.pwms[pwm_indices[pwm_name]]
+            filepath = self._get_filepath(directory, pwm_name)
+            pwm.save(filepath)
+            self._fingerprints[pwm_name] = _get_fingerprint(filepath)
+
+        for pwm_name in deleted:
+            filepath = self._get_filepath(directory, pwm_name)
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            self._fingerprints.pop(pwm_name, None)
+
+        self._set_saved(directory)
+
+
+class _ColumnarPwms(MutableSequence):
+    """List of PwmSettings that are stored in one column per attribute
+
+    Integers are stored in arrays. Values with options, e.g. algorithms,
+    are stored as indices into the options. Values of the other shared
+    attributes, e.g. charsets, are stored as indices into one value table
+    per attribute. Other strings are stored in lists. Master passwords are
+    not stored.
+
+    Items are created on access. Changes to an item are only stored if the
+    item is assigned back.
+
+    """
+
+    def __init__(self, pwms=()):
+        # Tables of (values, value ids) for shared attributes without options
+        self._tables = []
+
+        self._columns = []
+        for name, value_type, options, shared in _SETTINGS_SCHEMA:
+            table = None
+            if options is not None:
+                column = array("B")
+            elif shared:
+                column = array("I")
+                table = [], {}
+            elif value_type is int:
+                column = array("l")
+            else:
+                column = []
+            self._columns.append(column)
+            self._tables.append(table)
+
+        self._default_values = self._get_values(PwmSettings())
+
+        self.extend(pwms)
+
+    @staticmethod
+    def _get_values(pwm):
+        """Returns list of the values of pwm that are stored"""
+
+        return [getattr(pwm, name) for name in _SAVED_SETTING_NAMES]
+
+    def _encode(self, values):
+        """Returns list of column values for a sequence of setting values"""
+
+        encoded = []
+        for value, table, (_, _, options, _) in zip(values, self._tables,
+                                                    _SETTINGS_SCHEMA):
+            if options is not None:
+                value = options.index(value)
+            elif table is not None:
+                table_values, value_ids = table
+                try:
+                    value = value_ids[value]
+                except KeyError:
+                    value_id = len(table_values)
+                    if isinstance(value, str):
+                        value = _intern(value)
+                    table_values.append(value)
+                    value_ids[value] = value_id
+                    value = value_id
+            encoded.append(value)
+
+        return encoded
+
+    def _decode(self, idx):
+        """Returns dict of setting values of item idx"""
+
+        values = {}
+        for column, table, (name, _, options, _) in zip(
+                self._columns, self._tables, _SETTINGS_SCHEMA):
+            value = column[idx]
+            if options is not None:
+                value = options[value]
+            elif table is not None:
+                value = table[0][value]
+            values[name] = value
+
+        return values
+
+    def append_dict(self, file_dict):
+        """Appends settings from a dict as read from a json file
+
+        No PwmSettings instance is created. The dict is checked as in
+        PwmSettings.load_dict.
+
+        """
+
+        values = dict(zip(_SAVED_SETTING_NAMES, self._default_values))
+        values.update(_check_settings_dict(file_dict))
+
+        encoded = self._encode([values[name] for name in _SAVED_SETTING_NAMES])
+        for column, value in zip(self._columns, encoded):
+            column.append(value)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        return PwmSettings(**self._decode(idx))
+
+    def __setitem__(self, idx, pwm):
+        if isinstance(idx, slice):
+            raise TypeError("Slice assignment is not supported")
+
+        encoded = self._encode(self._get_values(pwm))
+        for column, value in zip(self._columns, encoded):
+            column[idx] = value
+
+    def __delitem__(self, idx):
+        for column in self._columns:
+            del column[idx]
+
+    def __len__(self):
+        return len(self._columns[0])
+
+    def insert(self, idx, pwm):
+        encoded = self._encode(self._get_values(pwm))
+        for column, value in zip(self._columns, encoded):
+            column.insert(idx, value)
+
+
+@attr.s
+class ColumnarPwmSettingsList(object):
+    """Compact variant of PwmSettingsList for large read-mostly collections
+
+    Profiles are stored column-wise, which takes a fraction of the memory
+    of one PwmSettings instance per profile. pwms[i] returns a new
+    PwmSettings instance. Changes to it must be assigned back with
+    pwms[i] = pwm. Therefore, use PwmSettingsList for editing, e.g. in the
+    GUI. PwmServer accepts both variants.
+
+    """
+
+    current = attr.ib(default="default")
+    pwm_names = attr.ib(default=attr.Factory(lambda: ["default"]))
+    pwms = attr.ib(default=attr.Factory(lambda: _ColumnarPwms([
+        PwmSettings()])))
+
+    @classmethod
+    def from_dicts(cls, pwm_names, file_dicts):
+        """Returns ColumnarPwmSettingsList from profile names and dicts
+
+        The dicts are checked as in PwmSettings.load_dict and stored without
+        creating PwmSettings instances. The first profile is current.
+        Without profiles, the list has a profile "default" as in
+        PwmSettingsList.
+
+        """
+
+        pwms = _ColumnarPwms()
+        for file_dict in file_dicts:
+            pwms.append_dict(file_dict)
+
+        pwm_names = list(pwm_names)
+        if not pwm_names:
+            return cls()
+
+        return cls(current=pwm_names[0], pwm_names=pwm_names, pwms=pwms)
+
+    @classmethod
+    def from_settings_list(cls, settings_list):
+        """Returns ColumnarPwmSettingsList with profiles of settings_list"""
+
+        return cls(current=settings_list.current,
+                   pwm_names=list(settings_list.pwm_names),
+                   pwms=_ColumnarPwms(settings_list.pwms))
+
+    def to_settings_list(self):
+        """Returns PwmSettingsList with the profiles, e.g. for saving"""
+
+        return PwmSettingsList(current=self.current,
+                               pwm_names=list(self.pwm_names),
+                               pwms=list(self.pwms))
+
+    def get_pwm_settings(self):
+        """Returns current PwmSettings"""
+
+        pwm_idx = self.pwm_names.index(self.current)
+        return self.pwms[pwm_idx]
+
+    def load(self, directory="."):
+        """Loads all PWM_setting files from directory
+
+        The files are parsed directly into the columns.
+
+        """
 
         filenames = [f for f in os.listdir(directory)
                      if f.endswith(".setting")]
-        pwm_names = [f[4:-8] for f in filenames]
+        filenames.sort()
+        if "pwm.default.setting" in filenames:
+            filenames.remove("pwm.default.setting")
+            filenames.insert(0, "pwm.default.setting")
+
+        def gen_file_dicts():
+            """Generator of dicts from the setting files"""
 
-        for pwm_name in pwm_names:
-            if pwm_name not in self.pwm_names:
-                os.remove("pwm."+pwm_name+".setting")
+            for filename in filenames:
+                yield _read_json(os.path.join(directory, filename))
+
+        settings_list = self.from_dicts([f[4:-8] for f in filenames],
+                                        gen_file_dicts())
+        self.pwm_names = settings_list.pwm_names
+        self.pwms = settings_list.pwms
+        self.current = settings_list.current
 
 
 # Main PasswordMaker functions
 
 
+# In LEET_ADDITIONAL_MAPPINGS_PER_LEVEL low level conversions are
+# maintained at higher levels unless they are overridden.
+# Conversions in the dicts always refer to the original character,
+# i. e. not to converted ones.
+
+LEET_ADDITIONAL_MAPPINGS_PER_LEVEL = [
+    {},
+    {"a": "4", "e": "3", "l": "1", "o": "0", "q": "9", "t": "7"},
+    {"i": "l", "s": "5", "z": "2"},
+    {"b": "8", "g": "6", "i": "'", "y": "'/"},
+    {"a": "@"},
+    {"b": "|3", "h": "#", "i": "!", "j": "7", "k": "|<", "p": "|>",
+     "r": "|2", "s": "$", "v": "\\/"},
+    {"d": "|)", "e": "&", "f": "|=", "j": ",|"},
+    {"c": "[", "m": "^^", "n": "^/", "p": "|*", "s": "5", "u": "(_)",
+     "w": "\\/\\/", "x": "><"},
+    {"b": "8", "c": "(", "h": "|-|", "j": "_|", "k": "|(", "m": "|\\/|",
+     "n": "|\\|", "o": "()", "p": "|>", "q": "(,)", "r": "|2", "s": "$",
+     "t": "|", "u": "|_|", "w": "\\^/", "x": ")(", "z": "\"/_"},
+    {"k": "|{", "l": "|_", "m": "/\\/\\"},
+]
+
+
+def _get_leet_tables():
+    """Returns list of cumulative leet translation tables for levels 0 to 9
+
+    The tables map ordinals to replacement strings as returned by
+    str.maketrans, so that leet conversion is a single str.translate call.
+
+    """
+
+    leet_tables = []
+    leet_mapping = {}
+    for additional_mappings in LEET_ADDITIONAL_MAPPINGS_PER_LEVEL:
+        leet_mapping.update(additional_mappings)
+        leet_tables.append(dict((ord(char), replacement)
+                                for char, replacement in leet_mapping.items()))
+    return leet_tables
+
+
+LEET_TABLES = _get_leet_tables()
+
+
 def get_leet_mapping(leet_level):
     """Returns a leet mappings for given leet level
 
@@ -474,33 +1846,11 @@ def get_leet_mapping(leet_level):
 
     """
 
-    # In leet_additional_mappings_per_level low level conversions are
-    # maintained at higher levels unless they are overridden.
-    # Conversions in the dicts always refer to the original character,
-    # i. e. not to converted ones.
-
-    leet_additional_mappings_per_level = [
-        {},
-        {"a": "4", "e": "3", "l": "1", "o": "0", "q": "9", "t": "7"},
-        {"i": "l", "s": "5", "z": "2"},
-        {"b": "8", "g": "6", "i": "'", "y": "'/"},
-        {"a": "@"},
-        {"b": "|3", "h": "#", "i": "!", "j": "7", "k": "|<", "p": "|>",
-         "r": "|2", "s": "$", "v": "\\/"},
-        {"d": "|)", "e": "&", "f": "|=", "j": ",|"},
-        {"c": "[", "m": "^^", "n": "^/", "p": "|*", "s": "5", "u": "(_)",
-         "w": "\\/\\/", "x": "><"},
-        {"b": "8", "c": "(", "h": "|-|", "j": "_|", "k": "|(", "m": "|\\/|",
-         "n": "|\\|", "o": "()", "p": "|>", "q": "(,)", "r": "|2", "s": "$",
-         "t": "|", "u": "|_|", "w": "\\^/", "x": ")(", "z": "\"/_"},
-        {"k": "|{", "l": "|_", "m": "/\\/\\"},
-    ]
-
-    leet_mapping = {}
-    for j in range(leet_level + 1):
-        leet_mapping.update(leet_additional_mappings_per_level[j])
+    if not 0 <= leet_level < len(LEET_TABLES):
+        return {}
 
-    return leet_mapping
+    leet_table = LEET_TABLES[leet_level]
+    return dict((chr(key), value) for key, value in leet_table.items())
 
 
 def leet(leet_level, message):
@@ -516,16 +1866,47 @@ def leet(leet_level, message):
 
     """
 
-    leet_mapping = get_leet_mapping(leet_level)
+    message = message.lower()
 
-    leet_message = ""
-    for char in message.lower():
-        try:
-            leet_message += leet_mapping[char]
-        except KeyError:
-            leet_message += char
+    if not 0 <= leet_level < len(LEET_TABLES):
+        return message
+
+    return message.translate(LEET_TABLES[leet_level])
+
+
+_LEET_ENCODINGS = {}
+
+
+def leet_encoding(leet_level, charset):
+    """Returns tuple of l33t-speak conversions of the characters in charset
+
+    The tuple may be used as encoding in PwmHashUtils, so that leet is
+    applied while remainders are mapped to characters. This is equivalent
+    to calling leet on the encoded string because leet converts each
+    character independently. None is returned for non-ASCII charsets, for
+    which lower-case conversion may depend on the context.
+
+    Results are memoized because charsets rarely change.
+
+    """
+
+    try:
+        return _LEET_ENCODINGS[leet_level, charset]
+    except KeyError:
+        pass
+
+    try:
+        charset.encode("ascii")
+    except UnicodeError:
+        encoding = None
+    else:
+        encoding = tuple(leet(leet_level, char) for char in charset)
+
+    if len(_LEET_ENCODINGS) >= 64:
+        _LEET_ENCODINGS.clear()
+    _LEET_ENCODINGS[leet_level, charset] = encoding
 
-    return leet_message
+    return encoding
 
 
 def generatepasswordfrom(settings):
@@ -581,53 +1962,320 @@ def generatepassword(hash_algorithm, key, data, password_length, charset,
 
     """
 
-    # If the charset's length < 2 the hash algorithms will run indefinitely.
+    hash_state = PwmHashState(hash_algorithm, key, charset, use_leet,
+                              leet_level)
+    return hash_state.generate(data, password_length, prefix, suffix)
 
-    if len(charset) < 2:
-        msg = "The charset {} contains less than 2 characters."
-        raise ValueError(msg.format(charset))
 
-    # apply the algorithm
-    hash_func_wrapper = PwmHashUtils(hash_algorithm, charset).hash_func_wrapper
-    hash_uses_hmac = hash_algorithm.count("hmac") > 0
+def generatepassword_batch(hash_algorithm, key, data_iterable,
+                           password_length, charset, prefix="", suffix="",
+                           use_leet="none", leet_level=0):
+    """Generator of PasswordMaker passwords for many data strings
 
-    # Apply l33t before the algorithm?
-    if use_leet in ("before", "both"):
-        key = leet(leet_level, key)
-        data = leet(leet_level, data)
+    The hash setup is done once for all elements of data_iterable.
+    Parameters are the same as for generatepassword except for
+    data_iterable, which yields the data strings.
 
-    # Ensure encoding to avoid Python3 issues
-    key = key.encode("utf-8")
-    data = data.encode("utf-8")
+    """
 
-    tkey = key  # Copy of the master password so we don't interfere with it
-    dat = data
+    hash_state = PwmHashState(hash_algorithm, key, charset, use_leet,
+                              leet_level)
+    for data in data_iterable:
+        yield hash_state.generate(data, password_length, prefix, suffix)
 
-    password = ''
 
-    for i in range(1000):
-        if i:
-            key = tkey + b"\n" + str(i).encode("utf-8")
+def generate_many(settings_iterable, max_hash_states=128):
+    """Generator of passwords, one for each PwmSettings in settings_iterable
 
-        # For non-hmac algorithms, the key is master pw and url
-        # concatenated
+    Results are identical to calling generatepasswordfrom for each settings
+    instance. The hash setup is shared between all settings that have the
+    same algorithm, master password, charset and leet options.
 
-        if hash_uses_hmac:
-            password += hash_func_wrapper(key, dat)
-        else:
-            dat = key + data
-            password += hash_func_wrapper(dat)
+    Parameters
+    ----------
 
-        if len(password) >= password_length:
-            break
+    * settings_iterable: Iterable of PwmSettings
+    \tSettings instances
+    * max_hash_states: Integer (default: 128)
+    \tMaximum number of hash setups that are kept, the least recently used
+    \tone is dropped first
+
+    """
+
+    hash_states = OrderedDict()
+
+    for settings in settings_iterable:
+        state_key = (settings.Algorithm, settings.MasterPass,
+                     settings.CharacterSet, settings.UseLeet,
+                     settings.LeetLvl)
+        try:
+            hash_state = hash_states.pop(state_key)
+        except KeyError:
+            if len(hash_states) >= max_hash_states:
+                hash_states.popitem(last=False)
+            hash_state = PwmHashState(*state_key)
+        hash_states[state_key] = hash_state
+
+        concat_url = settings.URL + settings.Username + settings.Modifier
+        yield hash_state.generate(concat_url, settings.Length,
+                                  settings.Prefix, settings.Suffix)
+
+
+def iter_chunks(iterable, chunk_size):
+    """Generator of lists with up to chunk_size elements from iterable"""
+
+    chunk = []
+    for element in iterable:
+        chunk.append(element)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate_chunk(settings_chunk):
+    """Returns list of passwords for a list of PwmSettings
+
+    This is the job of generate_many_parallel and of executors.
+
+    """
+
+    return list(generate_many(settings_chunk))
+
+
+def generate_many_parallel(settings_iterable, jobs=None, chunk_size=256):
+    """Generator of passwords that spreads work over a process pool
+
+    Results are yielded in the order of settings_iterable and are identical
+    to those of generate_many. Settings are sent to the workers in chunks so
+    that the hash setup is shared within each chunk. At most two chunks per
+    worker are in flight, so that settings_iterable is consumed no faster
+    than results are consumed.
+
+    Parameters
+    ----------
+
+    * settings_iterable: Iterable of PwmSettings
+    \tSettings instances
+    * jobs: Integer (default: None)
+    \tNumber of worker processes. None uses all CPUs, 1 runs in-process
+    * chunk_size: Integer (default: 256)
+    \tNumber of settings that are sent to a worker at once
+
+    """
+
+    # Imported here since multiprocessing is slow to import
+    import multiprocessing
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    if jobs < 1:
+        raise ValueError("The number of jobs {} is less than 1.".format(jobs))
+
+    if chunk_size < 1:
+        msg = "The chunk size {} is less than 1."
+        raise ValueError(msg.format(chunk_size))
+
+    if jobs == 1:
+        for password in generate_many(settings_iterable):
+            yield password
+        return
+
+    max_pending = 2 * jobs
+    pending = deque()
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for chunk in iter_chunks(settings_iterable, chunk_size):
+            pending.append(pool.apply_async(generate_chunk, (chunk,)))
+            if len(pending) >= max_pending:
+                for password in pending.popleft().get():
+                    yield password
+
+        while pending:
+            for password in pending.popleft().get():
+                yield password
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def settings_from_overrides(overrides_iterable, defaults=None):
+    """Generator of PwmSettings from dicts that override default settings
+
+    Keys are PwmSettings attribute names. Integer values may be given as
+    strings, e.g. from CSV rows. None values are ignored.
+
+    Parameters
+    ----------
+
+    * overrides_iterable: Iterable of dicts
+    \tSettings overrides, one dict per generated PwmSettings
+    * defaults: PwmSettings (default: None)
+    \tSettings that are used for all keys that are not overridden
 
-    # Apply l33t after the algorithm?
-    if use_leet in ("after", "both"):
-        password = leet(leet_level, password)
+    """
+
+    if defaults is None:
+        defaults = PwmSettings()
+
+    fields = dict((field.name, field) for field in attr.fields(PwmSettings))
+
+    for overrides in overrides_iterable:
+        changes = {}
+        for key, value in overrides.items():
+            if value is None:
+                continue
+            try:
+                field = fields[key]
+            except KeyError:
+                raise ValueError("Unknown setting: {}".format(key))
+            if field.type == "int":
+                value = int(value)
+            changes[key] = value
+
+        yield attr.evolve(defaults, **changes)
+
+
+@attr.s
+class PasswordCache(object):
+    """Bounded LRU cache of generated passwords with per-entry expiry
+
+    Entries are keyed by a salted digest of all PwmSettings attributes
+    including the master password. The salt is random per cache, so that
+    keys do not reveal master passwords.
+
+    Parameters
+    ----------
+
+    * max_entries: Integer (default: 1024)
+    \tMaximum number of cached passwords
+    * max_bytes: Integer (default: None)
+    \tMaximum total size of cached keys and passwords, None for no limit
+    * ttl: Float (default: 300.0)
+    \tSeconds until an entry expires, None for no expiry
+
+    """
+
+    max_entries = attr.ib(default=1024)
+    max_bytes = attr.ib(default=None)
+    ttl = attr.ib(default=300.0)
+    clock = attr.ib(default=_monotonic, repr=False)
+
+    def __attrs_post_init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._salt = os.urandom(32)
+        self._generation = 0  # Incremented by wipe
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        """Total size of cached keys and passwords"""
+
+        return self._bytes
 
-    if prefix:
-        password = prefix + password
-    if suffix:
-        password = password[:password_length-len(suffix)] + suffix
+    def get_key(self, settings):
+        """Returns cache key for settings"""
 
-    return password[:password_length]
+        return self._get_key(settings)[0]
+
+    def _get_key(self, settings):
+        """Returns tuple of cache key for settings and wipe generation"""
+
+        settings_json = json.dumps(attr.asdict(settings), sort_keys=True)
+        with self._lock:
+            salt = self._salt
+            generation = self._generation
+        key_hmac = hmac.new(salt, settings_json.encode("utf-8"),
+                            hashlib.sha256)
+        return key_hmac.digest(), generation
+
+    def get(self, settings):
+        """Returns password for settings, generates it on a cache miss"""
+
+        key, generation = self._get_key(settings)
+
+        with self._lock:
+            try:
+                password, expiry, _ = self._entries[key]
+            except KeyError:
+                pass
+            else:
+                if expiry is None or self.clock() < expiry:
+                    self._move_to_end(key)
+                    self.hits += 1
+                    return password
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+
+        password = generatepasswordfrom(settings)
+        self._put(key, password, generation)
+
+        return password
+
+    def wipe(self):
+        """Removes all cached passwords and renews the key salt"""
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._salt = os.urandom(32)
+            self._generation += 1
+
+    def _move_to_end(self, key):
+        """Marks entry for key as most recently used"""
+
+        try:
+            self._entries.move_to_end(key)
+        except AttributeError:  # Python 2.x
+            self._entries[key] = self._entries.pop(key)
+
+    def _remove(self, key):
+        """Removes entry for key"""
+
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _put(self, key, password, generation):
+        """Stores password for key and evicts entries beyond the bounds
+
+        Nothing is stored if the cache has been wiped after the key was
+        created with wipe generation generation.
+
+        """
+
+        size = len(key) + len(password.encode("utf-8"))
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        if self.ttl is None:
+            expiry = None
+        else:
+            expiry = self.clock() + self.ttl
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = password, expiry, size
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or \
+                    (self.max_bytes is not None and
+                     self._bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+
+PasswordMaker - Python profiling
+================================
+
+Create and manage passwords.
+
+
+Copyright (C):
+
+    2018      Martin Manns
+              <mmanns@gmx.net>
+
+    This file is part of PasswordMaker.
+
+    PasswordMaker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Runs a synthetic, seeded workload under cProfile and reports hot spots.
+
+Usage:
+
+    passwordmaker profile [--passwords 2000] [--profiles 100]
+                          [--algorithms md5:3,hmac-sha256] [--lengths 8,16:2]
+                          [--leet 0.25] [--seed 0] [--top 20]
+                          [--collapsed stacks.txt] [--pstats out.pstats]
+
+The workload creates setting files for a profile store, then loads all of
+them with PwmSettingsList and generates passwords for them, cycling over
+the profiles with distinct URLs. Only loading and generation are profiled.
+The same arguments yield the same workload, so reports are comparable.
+
+"""
+
+import argparse
+import bisect
+import cProfile
+import os
+import platform
+import pstats
+import random
+import shutil
+import tempfile
+import time
+
+try:
+    from io import StringIO
+except ImportError:  # Python 2.x
+    from StringIO import StringIO
+
+import attr
+
+from pwmhash import HASH_BACKEND_REGISTRY, get_hash_constructor
+from pwmlib import ALGORITHMS, LEET_OPTIONS, PwmSettings, PwmSettingsList
+from pwmlib import generate_many
+
+
+def parse_weights(text, value_type=str):
+    """Returns list of (value, weight) from a string like "md5:3,sha1"
+
+    Values without weight have weight 1.
+
+    """
+
+    weights = []
+    for item in text.split(","):
+        value, _, weight = item.strip().partition(":")
+        weight = float(weight) if weight else 1.0
+        if weight <= 0:
+            raise ValueError("Weight of {} is not positive".format(value))
+        weights.append((value_type(value), weight))
+
+    if not weights:
+        raise ValueError("No values in {!r}".format(text))
+
+    return weights
+
+
+def _weighted_choice(rng, weights):
+    """Returns a value from list of (value, weight), chosen by rng"""
+
+    cumulative = []
+    total = 0.0
+    for _, weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    idx = bisect.bisect_right(cumulative, rng.random() * total)
+    return weights[min(idx, len(weights) - 1)][0]
+
+
+@attr.s
+class Workload(object):
+    """Synthetic workload of profile loading and password generation
+
+    Parameters
+    ----------
+
+    * n_passwords: Integer (default: 2000)
+    \tNumber of generated passwords
+    * n_profiles: Integer (default: 100)
+    \tNumber of profiles in the store
+    * algorithms: List of (algorithm, weight) (default: all equally)
+    \tAlgorithm mix of the profiles
+    * lengths: List of (length, weight) (default: 8, 16 and 32 equally)
+    \tPassword length distribution of the profiles
+    * leet_fraction: Float (default: 0.25)
+    \tFraction of profiles that use leet with a random option and level
+    * seed: Integer (default: 0)
+    \tSeed of the random profile settings
+
+    """
+
+    n_passwords = attr.ib(default=2000)
+    n_profiles = attr.ib(default=100)
+    algorithms = attr.ib(default=attr.Factory(
+        lambda: [(algorithm, 1.0) for algorithm in ALGORITHMS]))
+    lengths = attr.ib(default=attr.Factory(
+        lambda: [(8, 1.0), (16, 1.0), (32, 1.0)]))
+    leet_fraction = attr.ib(default=0.25)
+    seed = attr.ib(default=0)
+
+    def __attrs_post_init__(self):
+        if self.n_profiles < 1:
+            raise ValueError("The number of profiles is less than 1.")
+
+        for algorithm, _ in self.algorithms:
+            if algorithm not in ALGORITHMS:
+                raise ValueError("Unknown algorithm: {}".format(algorithm))
+
+    def get_profiles(self):
+        """Returns list of the PwmSettings of the profile store"""
+
+        rng = random.Random(self.seed)
+        leet_options = [option for option in LEET_OPTIONS if option != "none"]
+
+        profiles = []
+        for i in range(self.n_profiles):
+            settings = PwmSettings(URL="site{}.example.org".format(i),
+                                   Algorithm=_weighted_choice(
+                                       rng, self.algorithms),
+                                   Length=_weighted_choice(rng, self.lengths))
+            if rng.random() < self.leet_fraction:
+                settings.UseLeet = rng.choice(leet_options)
+                settings.LeetLvl = rng.randint(1, 9)
+            profiles.append(settings)
+
+        return profiles
+
+    def create_store(self, directory):
+        """Saves the profiles as setting files in directory"""
+
+        for i, settings in enumerate(self.get_profiles()):
+            filename = "pwm.site{:06d}.setting".format(i)
+            settings.save(os.path.join(directory, filename))
+
+    def run(self, directory):
+        """Loads all profiles from directory and generates passwords
+
+        Returns the list of generated passwords.
+
+        """
+
+        settings_list = PwmSettingsList()
+        settings_list.load(directory)
+        pwms = list(settings_list.pwms)
+
+        def gen_settings():
+            """Generator of the settings of all passwords"""
+
+            for i in range(self.n_passwords):
+                pwm = pwms[i % len(pwms)]
+                yield attr.evolve(pwm, MasterPass="profile",
+                                  Username="user{}".format(i))
+
+        return list(generate_many(gen_settings()))
+
+
+def profile_workload(workload):
+    """Runs workload under cProfile
+
+    Returns tuple of pstats.Stats and wall time in seconds. Creating the
+    profile store and selecting the hash backends, which may benchmark
+    them once per process, are not profiled.
+
+    """
+
+    for algorithm, _ in workload.algorithms:
+        get_hash_constructor(algorithm.replace("hmac-", ""))
+
+    directory = tempfile.mkdtemp(prefix="pwmprofile")
+    try:
+        workload.create_store(directory)
+
+        profiler = cProfile.Profile()
+        start = time.time()
+        profiler.runcall(workload.run, directory)
+        wall_time = time.time() - start
+    finally:
+        shutil.rmtree(directory)
+
+    return pstats.Stats(profiler), wall_time
+
+
+def format_top(stats, sort_key, limit):
+    """Returns pstats table of the top limit functions sorted by sort_key"""
+
+    stream = StringIO()
+    stats.stream = stream
+    stats.sort_stats(sort_key).print_stats(limit)
+    return stream.getvalue()
+
+
+def _get_label(func):
+    """Returns flamegraph frame label of a pstats function key"""
+
+    filename, lineno, funcname = func
+    if filename == "~":
+        label = funcname  # Built-in function
+    else:
+        label = "{} ({}:{})".format(funcname, os.path.basename(filename),
+                                    lineno)
+
+    return label.replace(";", ",")
+
+
+def get_collapsed_stacks(stats, min_time=1e-6, max_depth=64):
+    """Returns dict of collapsed stacks and their self time in microseconds
+
+    cProfile records times per caller-callee pair, not per stack. Stacks
+    are reconstructed from the functions without callers by splitting the
+    time of each function among its callees as recorded for the pair and
+    scaling it by the share of the function's time on the current stack.
+    Stacks with less than min_time seconds and recursion are cut off.
+
+    """
+
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[2], edge[3]))
+
+    stacks = {}
+
+    def visit(func, path, labels, self_time, total_time):
+        """Adds self_time of func on stack labels, descends into callees"""
+
+        labels = labels + (_get_label(func),)
+        path = path | set([func])
+
+        stack = ";".join(labels)
+        stacks[stack] = stacks.get(stack, 0.0) + self_time
+
+        func_total_time = stats.stats[func][3]
+        if not func_total_time or len(labels) >= max_depth:
+            return
+
+        share = total_time / func_total_time
+        for callee, callee_self_time, callee_total_time in \
+                callees.get(func, ()):
+            if callee in path or callee_total_time * share < min_time:
+                continue
+            visit(callee, path, labels, callee_self_time * share,
+                  callee_total_time * share)
+
+    for func, (_, _, self_time, total_time, callers) in stats.stats.items():
+        if not callers:
+            visit(func, frozenset(), (), self_time, total_time)
+
+    return dict((stack, int(round(seconds * 1e6)))
+                for stack, seconds in stacks.items()
+                if round(seconds * 1e6) > 0)
+
+
+def save_collapsed_stacks(stacks, filepath):
+    """Saves stacks in the collapsed format of flamegraph.pl"""
+
+    with open(filepath, "w") as outfile:
+        for stack in sorted(stacks):
+            outfile.write("{} {}\n".format(stack, stacks[stack]))
+
+
+def get_parser():
+    """Returns command line argument parser"""
+
+    parser = argparse.ArgumentParser(
+        prog="passwordmaker profile",
+        description="Profile a synthetic workload with cProfile")
+    parser.add_argument("-n", "--passwords", dest="n_passwords", type=int,
+                        default=2000,
+                        help="Number of generated passwords (default 2000)")
+    parser.add_argument("--profiles", dest="n_profiles", type=int,
+                        default=100,
+                        help="Number of profiles in the store (default 100)")
+    parser.add_argument("--algorithms", dest="algorithms",
+                        default=",".join(ALGORITHMS),
+                        help="Algorithm mix, e.g. md5:3,hmac-sha256:1 "
+                             "(default: all algorithms equally)")
+    parser.add_argument("--lengths", dest="lengths", default="8,16,32",
+                        help="Password length distribution, e.g. 8:3,32:1 "
+                             "(default 8,16,32)")
+    parser.add_argument("--leet", dest="leet_fraction", type=float,
+                        default=0.25,
+                        help="Fraction of profiles that use leet "
+                             "(default 0.25)")
+    parser.add_argument("--seed", dest="seed", type=int, default=0,
+                        help="Seed of the profile settings (default 0)")
+    parser.add_argument("--top", dest="top", type=int, default=20,
+                        help="Number of functions per table (default 20)")
+    parser.add_argument("--collapsed", dest="collapsed", default=None,
+                        metavar="FILE",
+                        help="Write collapsed stacks for flamegraph.pl")
+    parser.add_argument("--pstats", dest="pstats", default=None,
+                        metavar="FILE",
+                        help="Write the raw profile for pstats or snakeviz")
+    return parser
+
+
+def main(argv=None):
+    """Command line entry point"""
+
+    parser = get_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        workload = Workload(
+            n_passwords=args.n_passwords,
+            n_profiles=args.n_profiles,
+            algorithms=parse_weights(args.algorithms),
+            lengths=parse_weights(args.lengths, int),
+            leet_fraction=args.leet_fraction,
+            seed=args.seed)
+    except ValueError as err:
+        parser.error(str(err))
+
+    stats, wall_time = profile_workload(workload)
+
+    print("PasswordMaker profile")
+    print("Python {} on {}".format(platform.python_version(),
+                                   platform.platform()))
+    backends = HASH_BACKEND_REGISTRY.selected_backends
+    print("Hash backends: {}".format(", ".join(
+        "{}={}".format(name, backends[name]) for name in sorted(backends))))
+    print("Workload: --passwords {} --profiles {} --algorithms {} "
+          "--lengths {} --leet {} --seed {}".format(
+              args.n_passwords, args.n_profiles, args.algorithms,
+              args.lengths, args.leet_fraction, args.seed))
+    print("{} passwords for {} profiles in {:.3f} s (under cProfile)".format(
+        workload.n_passwords, workload.n_profiles, wall_time))
+    print("")
+
+    stats.strip_dirs()
+    print("Top functions by cumulative time")
+    print(format_top(stats, "cumulative", args.top))
+    print("Top functions by self time")
+    print(format_top(stats, "tottime", args.top))
+
+    if args.pstats is not None:
+        stats.dump_stats(args.pstats)
+
+    if args.collapsed is not None:
+        save_collapsed_stacks(get_collapsed_stacks(stats), args.collapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+
+PasswordMaker - Python generation daemon
+========================================
+
+Create and manage passwords.
+
+
+Copyright (C):
+
+    2018      Martin Manns
+              <mmanns@gmx.net>
+
+    This file is part of PasswordMaker.
+
+    PasswordMaker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Local password generation daemon and client over a Unix domain socket.
+
+The daemon loads all profiles and holds the master password in memory.
+Requests and responses are JSON objects, one per line:
+
+    {"profile": "default", "url": "example.org", "username": "joe"}
+    {"password": "..."}
+
+"profile", "username" and "modifier" are optional. Username and modifier
+default to the values of the profile. If "cli_url" is true then username and
+modifier are appended to the URL before hashing, as the passwordmaker
+command line does, so that clients get the same passwords as the command
+line. Other settings of the profile are overridden by an optional
+"settings" object with PwmSettings attribute names as keys, e.g.
+{"Length": 30, "Algorithm": "sha256"}. The master password cannot be
+overridden. The profile for a URL is requested as
+
+    {"for_url": "https://mail.example.org/"}
+    {"profile": "example"}
+
+where the profile is null if no profile matches. Errors are answered as
+{"error": "..."}. A connection may carry many requests.
+
+"""
+
+import errno
+import json
+import os
+import signal
+import socket
+import stat
+import sys
+import tempfile
+import threading
+
+try:
+    import socketserver
+except ImportError:  # Python 2.x
+    import SocketServer as socketserver
+
+import attr
+
+from pwmindex import UrlIndex
+from pwmlib import PwmSettingsList, settings_from_overrides
+
+
+def _get_private_dir():
+    """Returns private directory for the socket in the temp directory
+
+    The directory is created with mode 0700. An existing directory must be
+    owned by the current user and not be accessible by others.
+
+    """
+
+    uid = os.getuid()
+    private_dir = os.path.join(tempfile.gettempdir(),
+                               "passwordmaker-{}".format(uid))
+    try:
+        os.mkdir(private_dir, 0o700)
+    except OSError as err:
+        if err.errno != errno.EEXIST:
+            raise
+
+    dir_stat = os.lstat(private_dir)
+    if not stat.S_ISDIR(dir_stat.st_mode) or dir_stat.st_uid != uid or \
+       dir_stat.st_mode & 0o077:
+        msg = "{} is no private directory of the current user"
+        raise IOError(msg.format(private_dir))
+
+    return private_dir
+
+
+def get_default_socket_path():
+    """Returns default socket path in the user's runtime directory
+
+    If XDG_RUNTIME_DIR is unset then a private directory in the temp
+    directory is used.
+
+    """
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or _get_private_dir()
+    filename = "passwordmaker-{}.sock".format(os.getuid())
+    return os.path.join(runtime_dir, filename)
+
+
+def check_socket_path(socket_path):
+    """Raises IOError if socket_path exists and is no socket of the user"""
+
+    try:
+        path_stat = os.lstat(socket_path)
+    except OSError as err:
+        if err.errno == errno.ENOENT:
+            return
+        raise
+
+    if not stat.S_ISSOCK(path_stat.st_mode):
+        raise IOError("{} is no socket".format(socket_path))
+
+    if path_stat.st_uid != os.getuid():
+        msg = "Socket {} is owned by another user"
+        raise IOError(msg.format(socket_path))
+
+
+def _remove_stale_socket(socket_path):
+    """Removes socket_path if no server accepts connections on it
+
+    Raises IOError if a server is running or if socket_path is no socket
+    of the current user.
+
+    """
+
+    check_socket_path(socket_path)
+    if not os.path.exists(socket_path):
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except socket.error as err:
+        if err.errno != errno.ECONNREFUSED:
+            raise
+        os.remove(socket_path)
+    else:
+        msg = "A server is already running on {}".format(socket_path)
+        raise IOError(msg)
+    finally:
+        probe.close()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handles JSON line requests of one connection"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            response = self.server.pwm_server.handle_request(line)
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _ThreadingUnixStreamServer(socketserver.ThreadingMixIn,
+                                 socketserver.UnixStreamServer):
+    """Unix stream server that handles each connection in a thread"""
+
+    daemon_threads = True
+
+
+@attr.s
+class PwmServer(object):
+    """Password generation daemon
+
+    Parameters
+    ----------
+
+    * settings_list: PwmSettingsList
+    \tLoaded profiles
+    * master_password: String
+    \tMaster password that is used for all profiles
+    * socket_path: String (default: None)
+    \tPath of the Unix domain socket, None for get_default_socket_path()
+
+    """
+
+    settings_list = attr.ib()
+    master_password = attr.ib(repr=False)
+    socket_path = attr.ib(default=None)
+
+    def __attrs_post_init__(self):
+        if self.socket_path is None:
+            self.socket_path = get_default_socket_path()
+
+        self._generators = {}
+        self._generators_lock = threading.Lock()
+        self._url_index = None
+        self._url_index_lock = threading.Lock()
+        self._server = None
+
+        # Held while settings_list is read or reloaded
+        self.settings_lock = threading.Lock()
+
+    def get_generator(self, profile):
+        """Returns PasswordGenerator for profile name, compiled once"""
+
+        # on_settings_change may drop entries at any time, so that cached
+        # values are only read once and returned from local variables.
+
+        generator = self._generators.get(profile)
+        if generator is not None:
+            return generator
+
+        with self._generators_lock:
+            generator = self._generators.get(profile)
+            if generator is None:
+                with self.settings_lock:
+                    try:
+                        pwm_idx = self.settings_list.pwm_names.index(profile)
+                    except ValueError:
+                        raise ValueError("Unknown profile: {}".format(profile))
+
+                    settings = attr.evolve(self.settings_list.pwms[pwm_idx],
+                                           MasterPass=self.master_password)
+                    generator = settings.compile()
+                    self._generators[profile] = generator
+
+            return generator
+
+    def get_url_index(self):
+        """Returns UrlIndex of all profiles, built on first use"""
+
+        with self._url_index_lock:
+            url_index = self._url_index
+            if url_index is None:
+                with self.settings_lock:
+                    url_index = UrlIndex.from_settings_list(self.settings_list)
+                    self._url_index = url_index
+
+            return url_index
+
+    def on_settings_change(self, added, changed, removed):
+        """Drops cached generators of changed profiles and the URL index
+
+        Must be called with settings_lock held, e.g. as on_change of a
+        PwmSettingsWatcher whose lock is settings_lock. The generator and
+        URL index locks are not taken, because they are acquired before
+        settings_lock in get_generator and get_url_index.
+
+        """
+
+        for profile in changed + removed:
+            self._generators.pop(profile, None)
+        self._url_index = None
+
+    def handle_request(self, line):
+        """Returns response dict for a JSON request line"""
+
+        try:
+            request = json.loads(line.decode("utf-8"))
+            if not isinstance(request, dict):
+                raise ValueError("Request is no JSON object")
+
+            if "for_url" in request:
+                url = request["for_url"]
+                if not isinstance(url, type(u"")):
+                    raise TypeError("for_url is no string")
+                return {"profile": self.get_url_index().lookup(url)}
+
+            profile = request.get("profile", "default")
+            generator = self.get_generator(profile)
+            settings = generator.settings
+
+            overrides = request.get("settings")
+            if overrides:
+                if not isinstance(overrides, dict):
+                    raise TypeError("settings is no JSON object")
+                if "MasterPass" in overrides:
+                    raise ValueError("MasterPass cannot be overridden")
+                settings = next(settings_from_overrides([overrides],
+                                                        settings))
+                generator = settings.compile()
+
+            url = request.get("url", settings.URL)
+            username = request.get("username", settings.Username)
+            modifier = request.get("modifier", settings.Modifier)
+            if request.get("cli_url"):
+                url = url + username + modifier
+
+            return {"password": generator(url, username, modifier)}
+
+        # IOError if a profile file has been removed since the last load
+        except (ValueError, TypeError, IOError, OSError) as err:
+            return {"error": str(err)}
+
+    def serve_forever(self):
+        """Serves requests until shutdown is called
+
+        A stale socket of the current user is replaced. IOError is raised
+        if another server is running on socket_path or if socket_path is
+        no socket of the current user. The socket is only accessible by the
+        current user and removed on exit.
+
+        """
+
+        _remove_stale_socket(self.socket_path)
+
+        old_umask = os.umask(0o177)
+        try:
+            self._server = _ThreadingUnixStreamServer(self.socket_path,
+                                                      _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+        self._server.pwm_server = self
+
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        """Stops serve_forever, must be called from another thread"""
+
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def serve(master_password, socket_path=None, directory=".", watch=False):
+    """Loads profiles from directory and serves them until interrupted
+
+    If watch is True then changed setting files are reloaded while serving.
+
+    """
+
+    settings_list = PwmSettingsList()
+    settings_list.load(directory)
+
+    # Leave serve_forever cleanly on SIGTERM so that the socket is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    server = PwmServer(settings_list, master_password, socket_path)
+
+    watcher = None
+    if watch:
+        from pwmwatch import PwmSettingsWatcher
+
+        watcher = PwmSettingsWatcher(settings_list, directory,
+                                     on_change=server.on_settings_change,
+                                     lock=server.settings_lock)
+        watcher.start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.stop()
+
+
+@attr.s
+class PwmClient(object):
+    """Client of a PwmServer
+
+    Parameters
+    ----------
+
+    * socket_path: String (default: None)
+    \tPath of the Unix domain socket, None for get_default_socket_path()
+
+    """
+
+    socket_path = attr.ib(default=None)
+
+    def __attrs_post_init__(self):
+        if self.socket_path is None:
+            self.socket_path = get_default_socket_path()
+
+        # Never send requests to a socket of another user
+        check_socket_path(self.socket_path)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(self.socket_path)
+        self._rfile = self._socket.makefile("rb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Closes the connection"""
+
+        self._rfile.close()
+        self._socket.close()
+
+    def _request(self, request):
+        """Returns response of the server to request dict"""
+
+        self._socket.sendall(json.dumps(request).encode("utf-8") + b"\n")
+
+        line = self._rfile.readline()
+        if not line:
+            raise IOError("Connection closed by server")
+
+        response = json.loads(line.decode("utf-8"))
+        if "error" in response:
+            raise ValueError(response["error"])
+
+        return response
+
+    def for_url(self, url):
+        """Returns name of the profile for url, None if there is none"""
+
+        return self._request({"for_url": url})["profile"]
+
+    def generate(self, url, profile="default", username=None, modifier=None,
+                 cli_url=False, settings=None):
+        """Returns password from server
+
+        Username and modifier default to the values of the profile. If
+        cli_url is True then they are appended to url as on the command
+        line. settings is a dict of PwmSettings attribute names and values
+        that override the other settings of the profile.
+
+        """
+
+        request = {"profile": profile, "url": url}
+        if cli_url:
+            request["cli_url"] = True
+        if settings:
+            request["settings"] = settings
+        if username is not None:
+            request["username"] = username
+        if modifier is not None:
+            request["modifier"] = modifier
+
+        return self._request(request)["password"]
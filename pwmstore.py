@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+
+PasswordMaker - Python profile store
+====================================
+
+Create and manage passwords.
+
+
+Copyright (C):
+
+    2018      Martin Manns
+              <mmanns@gmx.net>
+
+    This file is part of PasswordMaker.
+
+    PasswordMaker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Stores profiles in a single SQLite database file.
+
+This is an alternative to one pwm.<name>.setting file per profile. Profiles
+are stored as the same JSON documents in a table whose primary key is the
+profile name, so that one profile can be read without touching the others.
+Master passwords are never stored.
+
+The store is a library backend. The command line, the GUI and the daemon
+use setting files, to which profiles can be exported.
+
+Profile names must be non-empty and must not contain path separators or
+control characters, so that exported setting files stay in their
+directory.
+
+"""
+
+import json
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+
+import attr
+
+from pwmlib import PwmSettings, PwmSettingsList
+
+SETTING_PREFIX = "pwm."
+SETTING_SUFFIX = ".setting"
+
+_CREATE_TABLE = "CREATE TABLE IF NOT EXISTS profiles " \
+                "(name TEXT PRIMARY KEY NOT NULL, settings TEXT NOT NULL)"
+
+_SAFE_NAME_RE = re.compile(r"^[^/\\\x00-\x1f\x7f]+$")
+
+
+def check_name(name):
+    """Raises ValueError if profile name is not safe as part of a file name"""
+
+    if _SAFE_NAME_RE.match(name) is None:
+        raise ValueError("Unsafe profile name: {!r}".format(name))
+
+
+def _get_setting_filename(name):
+    """Returns setting file name for profile name"""
+
+    check_name(name)
+    return SETTING_PREFIX + name + SETTING_SUFFIX
+
+
+@attr.s
+class PwmSettingsStore(object):
+    """Profile store in one SQLite database
+
+    Parameters
+    ----------
+
+    * filepath: String (default: "pwm.sqlite")
+    \tDatabase file, ":memory:" for a temporary in-memory database
+
+    """
+
+    filepath = attr.ib(default="pwm.sqlite")
+
+    def __attrs_post_init__(self):
+        self._connection = sqlite3.connect(self.filepath)
+        self._transaction_depth = 0
+
+        with self._connection:
+            self._connection.execute(_CREATE_TABLE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        query = "SELECT COUNT(*) FROM profiles"
+        return self._connection.execute(query).fetchone()[0]
+
+    def __contains__(self, name):
+        query = "SELECT 1 FROM profiles WHERE name = ?"
+        return self._connection.execute(query, (name,)).fetchone() is not None
+
+    def close(self):
+        """Closes the database"""
+
+        self._connection.close()
+
+    @contextmanager
+    def transaction(self):
+        """Context manager that commits all changes within it at once
+
+        If an exception is raised then all changes are rolled back.
+        Transactions may be nested, only the outermost one commits.
+
+        """
+
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if not self._transaction_depth:
+                self._connection.rollback()
+            raise
+
+        self._transaction_depth -= 1
+        if not self._transaction_depth:
+            self._connection.commit()
+
+    def _execute(self, sql, *args):
+        """Executes a modifying statement within a transaction"""
+
+        with self.transaction():
+            self._connection.execute(sql, *args)
+
+    def names(self):
+        """Returns sorted list of profile names"""
+
+        query = "SELECT name FROM profiles ORDER BY name"
+        return [row[0] for row in self._connection.execute(query)]
+
+    def get(self, name):
+        """Returns PwmSettings of profile name, raises KeyError if missing"""
+
+        query = "SELECT settings FROM profiles WHERE name = ?"
+        row = self._connection.execute(query, (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+
+        settings = PwmSettings()
+        settings.load_dict(json.loads(row[0]))
+        return settings
+
+    def put(self, name, settings):
+        """Adds or replaces profile name"""
+
+        self.put_many([(name, settings)])
+
+    def put_many(self, items):
+        """Adds or replaces profiles from an iterable of (name, settings)
+
+        Raises ValueError and adds no profile if a name is unsafe.
+
+        """
+
+        sql = "INSERT OR REPLACE INTO profiles (name, settings) VALUES (?, ?)"
+        rows = []
+        for name, settings in items:
+            check_name(name)
+            rows.append((name, json.dumps(settings.get_dict(),
+                                          sort_keys=True)))
+
+        with self.transaction():
+            self._connection.executemany(sql, rows)
+
+    def delete(self, name):
+        """Deletes profile name, raises KeyError if missing"""
+
+        with self.transaction():
+            if name not in self:
+                raise KeyError(name)
+            self._execute("DELETE FROM profiles WHERE name = ?", (name,))
+
+    def clear(self):
+        """Deletes all profiles"""
+
+        self._execute("DELETE FROM profiles")
+
+    def import_directory(self, directory="."):
+        """Imports all setting files from directory in one transaction
+
+        Existing profiles with the same names are replaced. Returns the
+        number of imported profiles.
+
+        """
+
+        filenames = sorted(f for f in os.listdir(directory)
+                           if f.endswith(SETTING_SUFFIX))
+
+        items = []
+        for filename in filenames:
+            settings = PwmSettings()
+            settings.load(os.path.join(directory, filename))
+            name = filename[len(SETTING_PREFIX):-len(SETTING_SUFFIX)]
+            items.append((name, settings))
+
+        self.put_many(items)
+
+        return len(items)
+
+    def export_directory(self, directory="."):
+        """Exports all profiles as setting files into directory
+
+        Raises ValueError before writing any file if a stored profile name
+        is unsafe. Returns the number of exported profiles.
+
+        """
+
+        query = "SELECT name, settings FROM profiles ORDER BY name"
+
+        rows = self._connection.execute(query).fetchall()
+        for name, _ in rows:
+            check_name(name)
+
+        n_profiles = 0
+        for name, settings_json in rows:
+            filepath = os.path.join(directory, _get_setting_filename(name))
+            settings = PwmSettings()
+            settings.load_dict(json.loads(settings_json))
+            settings.save(filepath)
+            n_profiles += 1
+
+        return n_profiles
+
+    def load_settings_list(self):
+        """Returns PwmSettingsList with all profiles
+
+        As in PwmSettingsList.load, the profile "default" comes first and is
+        current. An empty store yields a list with a default profile.
+
+        """
+
+        query = "SELECT name, settings FROM profiles ORDER BY name"
+
+        rows = self._connection.execute(query).fetchall()
+        names = [row[0] for row in rows]
+        pwms = PwmSettings.from_dicts(json.loads(row[1]) for row in rows)
+
+        settings_list = PwmSettingsList(pwm_names=[], pwms=[])
+        for name, settings in zip(names, pwms):
+            if name == "default":
+                settings_list.pwm_names.insert(0, name)
+                settings_list.pwms.insert(0, settings)
+            else:
+                settings_list.pwm_names.append(name)
+                settings_list.pwms.append(settings)
+
+        if not settings_list.pwm_names:
+            settings_list.pwm_names.append("default")
+            settings_list.pwms.append(PwmSettings())
+
+        settings_list.current = settings_list.pwm_names[0]
+
+        return settings_list
+
+    def save_settings_list(self, settings_list):
+        """Replaces all profiles by those of settings_list atomically"""
+
+        with self.transaction():
+            self.clear()
+            self.put_many(zip(settings_list.pwm_names, settings_list.pwms))
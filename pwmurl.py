@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+
+PasswordMaker - Python URL normalization
+========================================
+
+Create and manage passwords.
+
+
+Copyright (C):
+
+    2018      Martin Manns
+              <mmanns@gmx.net>
+
+    This file is part of PasswordMaker.
+
+    PasswordMaker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Reduces URLs to their registrable domain, e.g.
+
+    https://user@mail.example.co.uk:8443/login?next=/ -> example.co.uk
+
+The stages are host extraction (scheme, user, port and path are removed),
+conversion of internationalized host names to punycode and the rules of
+the public suffix list <https://publicsuffix.org/>, including its private
+domains. IP addresses and hosts that are public suffixes are kept as they
+are.
+
+The public suffix list is compiled into PUBLIC_SUFFIX_FILE by
+
+    python pwmurl.py /path/to/public_suffix_list.dat
+
+It is loaded on first use. Results are memoized for recently seen URLs.
+
+"""
+
+import argparse
+import os
+import re
+import threading
+
+try:
+    from functools import lru_cache
+except ImportError:  # Python 2.x
+    def lru_cache(maxsize):
+        """No memoization if functools.lru_cache is unavailable"""
+
+        return lambda func: func
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:  # Python 2.x
+    from urlparse import urlsplit
+
+SUFFIX_FORMAT_VERSION = 1
+
+PUBLIC_SUFFIX_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "public_suffixes.v{}.txt".format(SUFFIX_FORMAT_VERSION))
+
+# Number of URLs whose normalization is memoized
+MEMO_SIZE = 4096
+
+_IPV4_RE = re.compile(r"^\d+\.\d+\.\d+\.\d+$")
+
+_suffix_table = None
+_suffix_table_lock = threading.Lock()
+
+
+def _to_ascii(host):
+    """Returns punycode of host, host itself if it cannot be converted"""
+
+    try:
+        host.encode("ascii")
+        return host
+    except UnicodeError:
+        pass
+
+    try:
+        return host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return host
+
+
+def is_ip_address(host):
+    """Returns True if host is an IPv4 or IPv6 address"""
+
+    return ":" in host or _IPV4_RE.match(host) is not None
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def get_host(url):
+    """Returns lower case ASCII host of url without port, "" if none"""
+
+    url = url.strip()
+    if "//" not in url:
+        url = "//" + url
+
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return ""
+
+    return _to_ascii((host or "").rstrip("."))
+
+
+def compile_suffix_list(lines):
+    """Returns list of compiled rules from lines of public_suffix_list.dat
+
+    Comments and blank lines are removed, rules are converted to lower
+    case punycode and sorted.
+
+    """
+
+    rules = set()
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("//"):
+            continue
+
+        rule = line.split()[0].lower()
+        prefix = ""
+        if rule.startswith("!"):
+            prefix, rule = "!", rule[1:]
+        if rule.startswith("*."):
+            prefix, rule = "*.", rule[2:]
+
+        labels = [_to_ascii(label) for label in rule.split(".")]
+        rules.add(prefix + ".".join(labels))
+
+    return sorted(rules)
+
+
+def save_suffix_list(rules, filepath=PUBLIC_SUFFIX_FILE):
+    """Saves compiled rules to filepath"""
+
+    lines = [
+        "#pwm-public-suffixes\t{}".format(SUFFIX_FORMAT_VERSION),
+        "# Compiled from the public suffix list <https://publicsuffix.org/>",
+        "# This Source Code Form is subject to the terms of the Mozilla "
+        "Public License, v. 2.0.",
+        "# If a copy of the MPL was not distributed with this file, You can "
+        "obtain one at https://mozilla.org/MPL/2.0/.",
+    ]
+    lines.extend(rules)
+
+    with open(filepath, "wb") as outfile:
+        outfile.write("\n".join(lines).encode("utf-8") + b"\n")
+
+
+def load_suffix_table(filepath=PUBLIC_SUFFIX_FILE):
+    """Returns tuple of rule, wildcard and exception sets from filepath
+
+    Wildcard rules "*.<suffix>" are stored as <suffix> and exception rules
+    "!<domain>" as <domain>.
+
+    """
+
+    with open(filepath, "rb") as infile:
+        lines = infile.read().decode("utf-8").split("\n")
+
+    header = lines[0].split("\t")
+    if header[0] != "#pwm-public-suffixes" or \
+       int(header[1]) != SUFFIX_FORMAT_VERSION:
+        msg = "Unsupported public suffix file header {!r}"
+        raise ValueError(msg.format(lines[0]))
+
+    rules = set()
+    wildcards = set()
+    exceptions = set()
+    for line in lines:
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("!"):
+            exceptions.add(line[1:])
+        elif line.startswith("*."):
+            wildcards.add(line[2:])
+        else:
+            rules.add(line)
+
+    return frozenset(rules), frozenset(wildcards), frozenset(exceptions)
+
+
+def get_suffix_table():
+    """Returns suffix table from PUBLIC_SUFFIX_FILE, loaded on first call"""
+
+    global _suffix_table
+
+    if _suffix_table is None:
+        with _suffix_table_lock:
+            if _suffix_table is None:
+                _suffix_table = load_suffix_table()
+
+    return _suffix_table
+
+
+def get_registrable_domain(host):
+    """Returns registrable domain of a lower case ASCII host
+
+    This is the public suffix of host and one more label. If host is a
+    public suffix or an IP address then host is returned.
+
+    """
+
+    if not host or is_ip_address(host):
+        return host
+
+    rules, wildcards, exceptions = get_suffix_table()
+
+    labels = host.split(".")
+    n_labels = len(labels)
+
+    # Without matching rule, the last label is the public suffix
+    suffix_start = n_labels - 1
+
+    # The first match from the left is the longest matching rule
+    for i in range(n_labels):
+        candidate = ".".join(labels[i:])
+        if candidate in exceptions:
+            suffix_start = i + 1
+            break
+        if candidate in rules or \
+           (i + 1 < n_labels and ".".join(labels[i + 1:]) in wildcards):
+            suffix_start = i
+            break
+
+    if suffix_start == 0:
+        return host
+
+    return ".".join(labels[suffix_start - 1:])
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def normalize_url(url):
+    """Returns registrable domain of url, "" if url has no host"""
+
+    return get_registrable_domain(get_host(url))
+
+
+def main():
+    """Command line entry point for compiling the public suffix list"""
+
+    parser = argparse.ArgumentParser(
+        description="Compile public_suffix_list.dat")
+    parser.add_argument("source", help="Path of public_suffix_list.dat")
+    parser.add_argument("-o", "--output", dest="output",
+                        default=PUBLIC_SUFFIX_FILE,
+                        help="Output file (default {})".format(
+                            os.path.basename(PUBLIC_SUFFIX_FILE)))
+    args = parser.parse_args()
+
+    with open(args.source, "rb") as infile:
+        lines = infile.read().decode("utf-8").splitlines()
+
+    save_suffix_list(compile_suffix_list(lines), args.output)
+
+
+if __name__ == "__main__":
+    main()
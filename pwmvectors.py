@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+
+PasswordMaker - Python golden test vectors
+==========================================
+
+Create and manage passwords.
+
+
+Copyright (C):
+
+    2018      Martin Manns
+              <mmanns@gmx.net>
+
+    This file is part of PasswordMaker.
+
+    PasswordMaker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Generates and loads golden test vectors for generatepassword.
+
+The vector file is a UTF-8 text file with tab separated fields:
+
+    #pwm-golden-vectors<TAB><version>
+    #charset<TAB><charset id><TAB><characters>
+    ...
+    <algorithm><TAB><key><TAB><data><TAB><length><TAB><charset id><TAB>
+    <prefix><TAB><suffix><TAB><use_leet><TAB><leet_level><TAB><password>
+    ...
+
+Vectors are generated once from a trusted version of pwmlib:
+
+    python pwmvectors.py --count 2000 --output golden_vectors.v1.tsv
+
+The file has two sections. The first one covers BASE_ALGORITHMS. The second
+one covers EXTRA_ALGORITHMS, which were not available on all platforms when
+the first section was generated. It is appended with its own seed, so that
+the first section stays unchanged.
+
+"""
+
+import argparse
+import mmap
+import random
+
+from pwmlib import FULL_CHARSET, LEET_OPTIONS, generatepassword
+
+VECTOR_FORMAT_VERSION = 1
+
+GOLDEN_VECTOR_FILE = "golden_vectors.v{}.tsv".format(VECTOR_FORMAT_VERSION)
+
+VECTOR_FIELDS = ("algorithm", "key", "data", "length", "charset", "prefix",
+                 "suffix", "use_leet", "leet_level", "password")
+
+BASE_ALGORITHMS = ("md5", "hmac-md5", "sha1", "hmac-sha1", "sha256",
+                   "hmac-sha256")
+
+EXTRA_ALGORITHMS = ("md4", "hmac-md4", "rmd160", "hmac-rmd160")
+
+# Number of random vectors and seed of the EXTRA_ALGORITHMS section
+EXTRA_COUNT = 400
+EXTRA_SEED = 1
+
+CHARSETS = (
+    FULL_CHARSET,
+    FULL_CHARSET[:62],
+    "0123456789abcdef",
+    "0123456789",
+)
+
+KEYS = ("asdf", "sdfmnklk3", "21289,.3", "M4st3r P4ss", u"pässwörd")
+
+DATA = ("passwordmaker.org", "abcdefghijklmnopqrstuvwxyz.com",
+        "example.comjoe", "mail.example.org" + "alice@example.org" + "1")
+
+LENGTHS = (1, 8, 19, 32, 64, 127, 128)
+
+PREFIXES = ("", "", "pre")
+
+SUFFIXES = ("", "", "X1!")
+
+
+def gen_base_vectors(algorithms=BASE_ALGORITHMS):
+    """Generator of the full factorial base vectors without extras"""
+
+    for algorithm in algorithms:
+        for key in KEYS[:3]:
+            for data in DATA[:2]:
+                for length in (1, 19, 64, 127):
+                    yield (algorithm, key, data, length, 0, "", "", "none", 0)
+
+
+def gen_random_vectors(count, seed=0, algorithms=BASE_ALGORITHMS):
+    """Generator of count pseudo random vectors without passwords"""
+
+    rand = random.Random(seed)
+
+    for _ in range(count):
+        yield (rand.choice(algorithms), rand.choice(KEYS),
+               rand.choice(DATA), rand.choice(LENGTHS),
+               rand.randrange(len(CHARSETS)), rand.choice(PREFIXES),
+               rand.choice(SUFFIXES), rand.choice(LEET_OPTIONS),
+               rand.randint(0, 9))
+
+
+def gen_vector_params(count, seed=0, extra_count=EXTRA_COUNT):
+    """Generator of the parameters of both sections of the vector file"""
+
+    for params in gen_base_vectors():
+        yield params
+    for params in gen_random_vectors(count, seed):
+        yield params
+
+    for params in gen_base_vectors(EXTRA_ALGORITHMS):
+        yield params
+    for params in gen_random_vectors(extra_count, EXTRA_SEED,
+                                     EXTRA_ALGORITHMS):
+        yield params
+
+
+def generate_vectors(count, seed=0, extra_count=EXTRA_COUNT):
+    """Returns list of golden vectors as tuples in order of VECTOR_FIELDS"""
+
+    vectors = []
+    for params in gen_vector_params(count, seed, extra_count):
+        algorithm, key, data, length, charset_id, prefix, suffix, \
+            use_leet, leet_level = params
+        password = generatepassword(algorithm, key, data, length,
+                                    CHARSETS[charset_id], prefix, suffix,
+                                    use_leet, leet_level)
+        vectors.append(params + (password,))
+
+    return vectors
+
+
+def save_vectors(vectors, filepath=GOLDEN_VECTOR_FILE):
+    """Saves vectors to filepath"""
+
+    lines = ["#pwm-golden-vectors\t{}".format(VECTOR_FORMAT_VERSION)]
+    for charset_id, charset in enumerate(CHARSETS):
+        lines.append("#charset\t{}\t{}".format(charset_id, charset))
+
+    for vector in vectors:
+        fields = [str(field) for field in vector]
+        for field in fields:
+            if "\t" in field or "\n" in field:
+                msg = "Vector field {!r} contains tab or newline"
+                raise ValueError(msg.format(field))
+        lines.append("\t".join(fields))
+
+    with open(filepath, "wb") as outfile:
+        outfile.write("\n".join(lines).encode("utf-8") + b"\n")
+
+
+def load_vectors(filepath=GOLDEN_VECTOR_FILE):
+    """Generator of golden vectors from filepath as dicts
+
+    The file is memory mapped and parsed line by line. Charset ids are
+    replaced by the charsets from the file header.
+
+    """
+
+    with open(filepath, "rb") as infile:
+        vector_map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        header = vector_map.readline().decode("utf-8").rstrip("\n")
+        magic, version = header.split("\t")
+        if magic != "#pwm-golden-vectors" or \
+           int(version) != VECTOR_FORMAT_VERSION:
+            msg = "Unsupported golden vector file header {!r}"
+            raise ValueError(msg.format(header))
+
+        charsets = {}
+        for line in iter(vector_map.readline, b""):
+            line = line.decode("utf-8").rstrip("\n")
+            if not line:
+                continue
+
+            fields = line.split("\t")
+            if fields[0] == "#charset":
+                charsets[fields[1]] = fields[2]
+                continue
+
+            vector = dict(zip(VECTOR_FIELDS, fields))
+            vector["length"] = int(vector["length"])
+            vector["leet_level"] = int(vector["leet_level"])
+            vector["charset"] = charsets[vector["charset"]]
+            yield vector
+
+    finally:
+        vector_map.close()
+
+
+def main():
+    """Command line entry point for generating golden vectors"""
+
+    parser = argparse.ArgumentParser(description="Generate golden vectors")
+    parser.add_argument("-c", "--count", dest="count", type=int,
+                        default=2000,
+                        help="Number of random vectors (default 2000)")
+    parser.add_argument("-s", "--seed", dest="seed", type=int, default=0,
+                        help="Random seed (default 0)")
+    parser.add_argument("-e", "--extra-count", dest="extra_count", type=int,
+                        default=EXTRA_COUNT,
+                        help="Number of random vectors of md4 and rmd160 "
+                             "(default {})".format(EXTRA_COUNT))
+    parser.add_argument("-o", "--output", dest="output",
+                        default=GOLDEN_VECTOR_FILE,
+                        help="Output file (default {})".format(
+                            GOLDEN_VECTOR_FILE))
+    args = parser.parse_args()
+
+    save_vectors(generate_vectors(args.count, args.seed, args.extra_count),
+                 args.output)
+
+
+if __name__ == "__main__":
+    main()
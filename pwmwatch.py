@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+
+PasswordMaker - Python profile watcher
+======================================
+
+Create and manage passwords.
+
+
+Copyright (C):
+
+    2018      Martin Manns
+              <mmanns@gmx.net>
+
+    This file is part of PasswordMaker.
+
+    PasswordMaker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Keeps a PwmSettingsList current while setting files change on disk.
+
+A background thread calls PwmSettingsList.reload, which only parses files
+that have been added or changed. On Linux, the thread sleeps until inotify
+reports a change of a setting file. Elsewhere, or if inotify is unavailable,
+the directory is polled.
+
+Errors of a reload or of on_change are logged by the "pwmwatch" logger and
+do not stop the watcher.
+
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+
+import attr
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+IN_SETTING_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_CREATE | IN_DELETE
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+logger = logging.getLogger("pwmwatch")
+
+
+def _inotify_watch(directory):
+    """Returns inotify file descriptor that watches directory
+
+    Returns None if inotify is unavailable.
+
+    """
+
+    if not sys.platform.startswith("linux"):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        inotify_init1 = libc.inotify_init1
+        inotify_add_watch = libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        return None
+
+    path = os.path.abspath(directory).encode(sys.getfilesystemencoding())
+    if inotify_add_watch(fd, path, IN_SETTING_MASK) < 0:
+        os.close(fd)
+        return None
+
+    return fd
+
+
+def _read_setting_events(fd):
+    """Returns True if pending inotify events concern setting files"""
+
+    data = b""
+    while True:
+        try:
+            chunk = os.read(fd, 65536)
+        except OSError as err:
+            if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                break
+            raise
+        if not chunk:
+            break
+        data += chunk
+
+    found = False
+    offset = 0
+    while offset < len(data):
+        _, _, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+        offset += _EVENT_HEADER.size
+        name = data[offset:offset + name_length].rstrip(b"\0")
+        offset += name_length
+        if name.endswith(b".setting"):
+            found = True
+
+    return found
+
+
+@attr.s
+class PwmSettingsWatcher(object):
+    """Background thread that reloads a PwmSettingsList on changes
+
+    Parameters
+    ----------
+
+    * settings_list: PwmSettingsList
+    \tProfiles that are reloaded
+    * directory: String (default: ".")
+    \tDirectory with pwm.<name>.setting files
+    * interval: Float (default: 1.0)
+    \tSeconds between polls if inotify is unavailable
+    * on_change: Function (default: None)
+    \tCalled with the lists of added, changed and removed profile names
+    \tafter a reload that changed profiles
+    * use_inotify: Bool (default: None)
+    \tNone for inotify if available, False for polling
+    * lock: Lock (default: new threading.Lock)
+    \tHeld during each reload and on_change call. Hold it while
+    \taccessing settings_list from other threads.
+
+    """
+
+    settings_list = attr.ib()
+    directory = attr.ib(default=".")
+    interval = attr.ib(default=1.0)
+    on_change = attr.ib(default=None)
+    use_inotify = attr.ib(default=None)
+    lock = attr.ib(default=attr.Factory(threading.Lock))
+
+    def __attrs_post_init__(self):
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._stop_pipe = None
+        self._inotify_fd = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def uses_inotify(self):
+        """True if the running watcher uses inotify instead of polling"""
+
+        return self._inotify_fd is not None
+
+    def reload(self):
+        """Reloads the profiles, returns True if any profile changed"""
+
+        with self.lock:
+            added, changed, removed = \
+                self.settings_list.reload(self.directory)
+            if not (added or changed or removed):
+                return False
+
+            if self.on_change is not None:
+                self.on_change(added, changed, removed)
+
+        return True
+
+    def start(self):
+        """Reloads the profiles once and starts watching"""
+
+        if self._thread is not None:
+            raise RuntimeError("Watcher is already running")
+
+        if self.use_inotify is not False:
+            self._inotify_fd = _inotify_watch(self.directory)
+            if self._inotify_fd is not None:
+                self._stop_pipe = os.pipe()
+
+        # Changes before the watch has been added are caught here
+        self.reload()
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="PwmSettingsWatcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops watching and waits for the thread to end"""
+
+        if self._thread is None:
+            return
+
+        self._stop_event.set()
+        if self._stop_pipe is not None:
+            os.write(self._stop_pipe[1], b"\0")
+
+        self._thread.join()
+        self._thread = None
+
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+        if self._stop_pipe is not None:
+            for fd in self._stop_pipe:
+                os.close(fd)
+            self._stop_pipe = None
+
+    def _watch_once(self):
+        """Waits for changes and reloads, returns False if stopped"""
+
+        if self._inotify_fd is None:
+            if self._stop_event.wait(self.interval):
+                return False
+            self.reload()
+            return True
+
+        readable = select.select([self._inotify_fd, self._stop_pipe[0]],
+                                 [], [])[0]
+        if self._stop_event.is_set():
+            return False
+        if self._inotify_fd in readable and \
+           _read_setting_events(self._inotify_fd):
+            self.reload()
+        return True
+
+    def _run(self):
+        """Thread target, keeps watching after errors"""
+
+        while True:
+            try:
+                if not self._watch_once():
+                    return
+            except Exception:
+                logger.exception("Reloading %s failed", self.directory)
+                # Avoid a busy loop if the error persists
+                if self._stop_event.wait(self.interval):
+                    return
@@ -70,6 +70,39 @@ class PyTest(Command):
         raise SystemExit(errno)
 
 
+class Bench(Command):
+    """Class for running the micro-benchmarks via setup.py"""
+
+    user_options = []
+
+    def initialize_options(self):
+        pass
+
+    def finalize_options(self):
+        pass
+
+    def run(self):
+        errno = subprocess.call([sys.executable, 'pwmbench.py'])
+        raise SystemExit(errno)
+
+
+class PublicSuffixes(Command):
+    """Class for compiling the public suffix list via setup.py"""
+
+    description = 'compile public_suffix_list.dat into public_suffixes.v1.txt'
+    user_options = [('source=', 's', 'path of public_suffix_list.dat')]
+
+    def initialize_options(self):
+        self.source = '/usr/share/publicsuffix/public_suffix_list.dat'
+
+    def finalize_options(self):
+        pass
+
+    def run(self):
+        errno = subprocess.call([sys.executable, 'pwmurl.py', self.source])
+        raise SystemExit(errno)
+
+
 setup(
     name='PasswordMaker - Python',
     version='0.0.1',
@@ -84,13 +117,15 @@ setup(
     requires=['attrs (>=17.0)'],
     packages=['.'],
     scripts=['passwordmaker.py'],
-    cmdclass={'test': PyTest},
+    cmdclass={'test': PyTest, 'bench': Bench, 'suffixes': PublicSuffixes},
     package_data={
         'passwordmaker': [
             '*.py',
             'COPYING',
             'COPYING.LESSER',
             'README.md',
+            'golden_vectors.v1.tsv',
+            'public_suffixes.v1.txt',
             'todo.txt',
         ],
     },
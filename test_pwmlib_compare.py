@@ -35,12 +35,74 @@ It can be used both on the command-line and with a GUI based on TKinter.
 
 """
 
+import os
+import shutil
 import unittest
 import subprocess
 
 from pwmlib import generatepassword, ALGORITHMS, FULL_CHARSET
-
-
+from pwmlib import generate_many_parallel, PwmSettings
+from pwmvectors import load_vectors, GOLDEN_VECTOR_FILE
+
+GOLDEN_VECTOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  GOLDEN_VECTOR_FILE)
+
+# Number of worker processes for the golden vector test
+GOLDEN_VECTOR_JOBS = int(os.environ.get("PWM_GOLDEN_VECTOR_JOBS", "1"))
+
+
+class TestGoldenVectors(unittest.TestCase):
+    """Unit test class for generatepassword against golden vectors
+
+    Vectors of algorithms that are unavailable on this platform are
+    skipped. Set the environment variable PWM_GOLDEN_VECTOR_JOBS for
+    verifying the vectors in parallel.
+
+    """
+
+    def _gen_vectors(self):
+        """Generator of golden vectors for available algorithms"""
+
+        for vector in load_vectors(GOLDEN_VECTOR_PATH):
+            if vector["algorithm"] in ALGORITHMS:
+                yield vector
+
+    def test_golden_vectors(self):
+        vectors = list(self._gen_vectors())
+        self.assertTrue(vectors)
+
+        # MasterPass is the key, URL is the data since the other settings
+        # that are concatenated with the URL are empty.
+        settings_list = [PwmSettings(URL=vector["data"],
+                                     MasterPass=vector["key"],
+                                     Algorithm=vector["algorithm"],
+                                     Length=vector["length"],
+                                     CharacterSet=vector["charset"],
+                                     Prefix=vector["prefix"],
+                                     Suffix=vector["suffix"],
+                                     UseLeet=vector["use_leet"],
+                                     LeetLvl=vector["leet_level"])
+                         for vector in vectors]
+
+        passwords = generate_many_parallel(settings_list,
+                                           jobs=GOLDEN_VECTOR_JOBS)
+        for vector, password in zip(vectors, passwords):
+            with self.subTest(vector=vector):
+                self.assertEqual(password, vector["password"])
+
+    def test_golden_vectors_generatepassword(self):
+        for vector in list(self._gen_vectors())[:200]:
+            with self.subTest(vector=vector):
+                res = generatepassword(vector["algorithm"], vector["key"],
+                                       vector["data"], vector["length"],
+                                       vector["charset"], vector["prefix"],
+                                       vector["suffix"], vector["use_leet"],
+                                       vector["leet_level"])
+                self.assertEqual(res, vector["password"])
+
+
+@unittest.skipIf(shutil.which("passwordmaker") is None,
+                 "The passwordmaker command line tool is missing.")
 class TestGeneratepassword(unittest.TestCase):
     """Unit test class for generatepassword"""
 
@@ -49,7 +49,50 @@ It can be used both on the command-line and with a GUI based on TKinter.
 """
 
 from pwmlib import generatepassword, leet, ALGORITHMS, FULL_CHARSET
+from pwmlib import LEET_OPTIONS, get_leet_mapping, leet_encoding
+from pwmlib import generatepassword_batch, generate_many
+from pwmlib import generate_many_parallel, settings_from_overrides
+from pwmlib import generatepasswordfrom, PwmSettings, PwmHashUtils
+from pwmlib import PasswordCache, PwmSettingsList, ColumnarPwmSettingsList
+from pwmlib import PwmHashState, PwmStats, enable_stats, disable_stats
+from pwmlib import get_stats
+import asyncio
+import hashlib
+import hmac
+import io
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import attr
+
+from passwordmaker import load_profile, normalize_rows, stream
+import pwmlib
+from pwmasync import agenerate, agenerate_many, _submit
+from pwmhash import HashBackendRegistry, HASH_TEST_VECTORS, MD4, RIPEMD160
+from pwmhash import check_constructor
+import pwmhash
+from pwmindex import UrlIndex, get_labels
+from pwmprofile import Workload, parse_weights, profile_workload
+from pwmprofile import get_collapsed_stacks, save_collapsed_stacks
+from pwmserver import PwmServer, PwmClient, get_default_socket_path
+from pwmstore import PwmSettingsStore
+from pwmurl import compile_suffix_list, save_suffix_list, load_suffix_table
+from pwmurl import get_host, normalize_url
+from pwmwatch import PwmSettingsWatcher
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class TestGeneratepassword(unittest.TestCase):
@@ -112,6 +155,17 @@ class TestGeneratepassword(unittest.TestCase):
         r = '~A6{!<Y4UGo$%7x;alX'
         self.assertEqual(res, r)
 
+    def test_hmac_sha256_uses_sha256(self):
+        # Without pycrypto, hmac-sha256 used to be HMAC-SHA1 (see README)
+        res = self._generatepassword(hashAlgorithm="hmac-sha256")
+        self.assertNotEqual(res, self._generatepassword(
+            hashAlgorithm="hmac-sha1"))
+
+        hash_utils = PwmHashUtils("hmac-sha256", FULL_CHARSET)
+        digest = hmac.new(b"asdf", b"passwordmaker.org",
+                          hashlib.sha256).digest()
+        self.assertEqual(res, hash_utils.rstr2any(digest)[:19])
+
     def test_generatepassword_sha1(self):
         alg = "sha1"
         if alg not in ALGORITHMS:
@@ -256,6 +310,25 @@ class TestLeet(unittest.TestCase):
             '||-|& 1@"/_\'/ |)()6'
         self.assertEqual(res, r)
 
+    def test_leet_out_of_range(self):
+        message = "The quick, brown fox"
+        r = "the quick, brown fox"
+        self.assertEqual(leet(-1, message), r)
+        self.assertEqual(leet(10, message), r)
+
+    def test_get_leet_mapping(self):
+        self.assertEqual(get_leet_mapping(0), {})
+        self.assertEqual(get_leet_mapping(4)["a"], "@")
+        self.assertEqual(get_leet_mapping(9)["i"], "!")
+
+    def test_leet_encoding(self):
+        for leet_level in range(10):
+            res = "".join(leet_encoding(leet_level, FULL_CHARSET))
+            self.assertEqual(res, leet(leet_level, FULL_CHARSET))
+
+    def test_leet_encoding_non_ascii(self):
+        self.assertTrue(leet_encoding(1, u"ab\u03a3") is None)
+
     def test_leet_9(self):
         message = "The quick, brown fox jumps over the lazy dog"
         leet_level = 9
@@ -265,5 +338,1587 @@ class TestLeet(unittest.TestCase):
         self.assertEqual(res, r)
 
 
+class TestGenerateMany(unittest.TestCase):
+    """Unit test class for generate_many and generatepassword_batch"""
+
+    def _get_settings_list(self):
+        settings_list = []
+        for alg in ALGORITHMS:
+            for mpw in ("asdf", "sdfmnklk3"):
+                for url in ("passwordmaker.org", "abcdefghijklmnopqrstuvwxyz"):
+                    for use_leet in ("none", "both"):
+                        settings_list.append(
+                            PwmSettings(URL=url, MasterPass=mpw,
+                                        Algorithm=alg, Username="user",
+                                        Length=33, Prefix="pre",
+                                        Suffix="suf", UseLeet=use_leet,
+                                        LeetLvl=5))
+        return settings_list
+
+    def test_generate_many(self):
+        settings_list = self._get_settings_list()
+        res = list(generate_many(settings_list))
+        r = [generatepasswordfrom(settings) for settings in settings_list]
+        self.assertEqual(res, r)
+
+    def test_generate_many_max_hash_states(self):
+        # Alternating master passwords drop and recreate the hash setups
+        settings_list = [PwmSettings(URL="passwordmaker.org", MasterPass=pwd)
+                         for pwd in ("asdf", "qwer", "asdf", "zxcv")]
+        res = list(generate_many(settings_list, max_hash_states=1))
+        r = [generatepasswordfrom(settings) for settings in settings_list]
+        self.assertEqual(res, r)
+
+    def test_generate_many_lazy(self):
+        settings_iter = iter(self._get_settings_list())
+        res = generate_many(settings_iter)
+        next(res)
+        self.assertTrue(next(settings_iter, None) is not None)
+
+    def test_generate_many_parallel(self):
+        settings_list = self._get_settings_list()
+        res = list(generate_many_parallel(settings_list, jobs=2,
+                                          chunk_size=5))
+        r = list(generate_many(settings_list))
+        self.assertEqual(res, r)
+
+    def test_generate_many_parallel_no_jobs(self):
+        with self.assertRaises(ValueError):
+            list(generate_many_parallel([PwmSettings()], jobs=0))
+
+    def test_settings_from_overrides(self):
+        defaults = PwmSettings(MasterPass="asdf", Length=19)
+        overrides = [{"URL": "passwordmaker.org"},
+                     {"URL": "passwordmaker.org", "Length": "2",
+                      "Username": None}]
+        res = list(settings_from_overrides(overrides, defaults))
+        self.assertEqual(res[0], PwmSettings(URL="passwordmaker.org",
+                                             MasterPass="asdf", Length=19))
+        self.assertEqual(list(generate_many(res)), ['FRRHm)k+UyQiY~%Dj;h',
+                                                    'FR'])
+
+    def test_settings_from_overrides_unknown(self):
+        with self.assertRaises(ValueError):
+            list(settings_from_overrides([{"Foo": "bar"}]))
+
+    def test_generatepassword_batch(self):
+        data = ['passwordmaker.org', 'abcdefghijklmnopqrstuvwxyz.com']
+        res = list(generatepassword_batch("md5", "asdf", data, 19,
+                                          FULL_CHARSET))
+        r = ['FRRHm)k+UyQiY~%Dj;h',
+             generatepassword("md5", "asdf", data[1], 19, FULL_CHARSET)]
+        self.assertEqual(res, r)
+
+    def test_generatepassword_batch_short_charset(self):
+        with self.assertRaises(ValueError):
+            list(generatepassword_batch("md5", "asdf", ["a"], 19, "a"))
+
+
+class TestRstr2any(unittest.TestCase):
+    """Unit test class for PwmHashUtils.rstr2any"""
+
+    charsets = [FULL_CHARSET, "01", "0123456789abcdef",
+                "ABCDEFGHIJKLMNOPQRSTUVWXYZ"]
+
+    def _get_inputs(self):
+        inputs = [b"", b"\x00\x00", b"\x00\x01", b"\xff\xff" * 16]
+        for i in range(50):
+            data = str(i).encode("utf-8")
+            inputs.append(hashlib.md5(data).digest())
+            inputs.append(hashlib.sha256(data).digest())
+        return inputs
+
+    def test_rstr2any_trim(self):
+        for charset in self.charsets:
+            hash_utils = PwmHashUtils("md5", charset)
+            for inp in self._get_inputs():
+                with self.subTest(charset=charset, inp=inp):
+                    res = hash_utils.rstr2any(inp)
+                    r = hash_utils.rstr2any_longdivision(inp)
+                    self.assertEqual(res, r)
+
+    def test_rstr2any_no_trim(self):
+        for charset in self.charsets:
+            hash_utils = PwmHashUtils("md5", charset)
+            for inp in self._get_inputs():
+                with self.subTest(charset=charset, inp=inp):
+                    res = hash_utils.rstr2any(inp, trim=False)
+                    r = hash_utils.rstr2any_longdivision(inp, trim=False)
+                    self.assertEqual(res, r)
+                    trimmed = hash_utils.rstr2any(inp)
+                    if inp:
+                        self.assertTrue(res.endswith(trimmed))
+                        self.assertEqual(res.lstrip(charset[0]),
+                                         trimmed.lstrip(charset[0]))
+
+    def test_rstr2any_no_trim_length(self):
+        hash_utils = PwmHashUtils("md5", "01")
+        res = hash_utils.rstr2any(b"\x00\x01", trim=False)
+        self.assertEqual(res, "0000000000000001")
+
+    def test_rstr2any_many(self):
+        inputs = [inp for inp in self._get_inputs() if len(inp) == 16]
+        for charset in self.charsets:
+            hash_utils = PwmHashUtils("md5", charset)
+            for trim in (True, False):
+                res = hash_utils.rstr2any_many(inputs, trim)
+                r = [hash_utils.rstr2any(inp, trim) for inp in inputs]
+                self.assertEqual(res, r)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed.")
+    def test_rstr2any_many_numpy(self):
+        inputs = [inp for inp in self._get_inputs() if len(inp) == 32]
+        digests = numpy.frombuffer(b"".join(inputs), dtype=numpy.uint8)
+        digests = digests.reshape(len(inputs), 32)
+        for charset in self.charsets + [leet_encoding(9, FULL_CHARSET)]:
+            hash_utils = PwmHashUtils("md5", charset, verify=True)
+            for trim in (True, False):
+                res = hash_utils.rstr2any_many(digests, trim)
+                r = [hash_utils.rstr2any(inp, trim) for inp in inputs]
+                self.assertEqual(res, r)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed.")
+    def test_rstr2any_many_unequal_length(self):
+        hash_utils = PwmHashUtils("md5", FULL_CHARSET)
+        with self.assertRaises(ValueError):
+            hash_utils.rstr2any_many([b"\x00\x01", b"\x00"])
+
+    def test_rstr2any_verify(self):
+        hash_utils = PwmHashUtils("md5", FULL_CHARSET, verify=True)
+        for inp in self._get_inputs():
+            hash_utils.rstr2any(inp)
+            hash_utils.rstr2any(inp, trim=False)
+
+
+class TestHmacDigest(unittest.TestCase):
+    """Unit test class for PwmHashUtils.hmac_digest"""
+
+    def test_hmac_digest(self):
+        import hmac
+
+        hash_utils = PwmHashUtils("hmac-md5", FULL_CHARSET)
+        for key in (b"asdf", b"asdf\n1", b"asdf"):
+            for inp in (b"passwordmaker.org", b"", b"passwordmaker.org"):
+                res = hash_utils.hmac_digest(key, inp, hashlib.md5)
+                r = hmac.new(key, inp, hashlib.md5).digest()
+                self.assertEqual(res, r)
+
+    def test_hmac_digest_bounded(self):
+        hash_utils = PwmHashUtils("hmac-md5", FULL_CHARSET)
+        for i in range(hash_utils.max_hmac_states + 10):
+            key = str(i).encode("utf-8")
+            hash_utils.hmac_digest(key, b"data", hashlib.md5)
+        self.assertTrue(len(hash_utils._hmac_states) <=
+                        hash_utils.max_hmac_states)
+
+    def test_hmac_digest_lru(self):
+        hash_utils = PwmHashUtils("hmac-md5", FULL_CHARSET)
+        hash_utils.max_hmac_states = 4
+
+        # Round keys of a password with more rounds than cached states
+        keys = [b"asdf"] + [b"asdf\n" + str(i).encode("utf-8")
+                            for i in range(1, 10)]
+        for key in keys:
+            hash_utils.hmac_digest(key, b"data", hashlib.md5)
+        self.assertEqual(list(hash_utils._hmac_states), keys[-4:])
+
+        # Recently used states are kept, the least recently used is dropped
+        hash_utils.hmac_digest(keys[6], b"data", hashlib.md5)
+        hash_utils.hmac_digest(b"qwer", b"data", hashlib.md5)
+        self.assertEqual(list(hash_utils._hmac_states),
+                         [keys[8], keys[9], keys[6], b"qwer"])
+
+        for key in keys:
+            self.assertEqual(hash_utils.hmac_digest(key, b"data",
+                                                    hashlib.md5),
+                             hmac.new(key, b"data", hashlib.md5).digest())
+
+
+class TestPasswordGenerator(unittest.TestCase):
+    """Unit test class for PasswordGenerator"""
+
+    def test_compile(self):
+        for alg in ALGORITHMS:
+            for use_leet in LEET_OPTIONS:
+                settings = PwmSettings(MasterPass="asdf", Algorithm=alg,
+                                       Length=40, Prefix="a", Suffix="z",
+                                       UseLeet=use_leet, LeetLvl=3)
+                generator = settings.compile()
+                for url in ("passwordmaker.org", "example.com"):
+                    with self.subTest(alg=alg, use_leet=use_leet, url=url):
+                        settings.URL = url
+                        settings.Username = "user"
+                        settings.Modifier = "mod"
+                        res = generator(url, "user", "mod")
+                        r = generatepasswordfrom(settings)
+                        self.assertEqual(res, r)
+
+    def test_compile_snapshot(self):
+        settings = PwmSettings(MasterPass="asdf", Length=19)
+        generator = settings.compile()
+        settings.Length = 2
+        self.assertEqual(generator("passwordmaker.org"),
+                         'FRRHm)k+UyQiY~%Dj;h')
+
+
+class TestPasswordCache(unittest.TestCase):
+    """Unit test class for PasswordCache"""
+
+    def setUp(self):
+        self.now = 0.0
+        self.settings = [PwmSettings(URL="site{}.org".format(i),
+                                     MasterPass="asdf") for i in range(5)]
+
+    def clock(self):
+        return self.now
+
+    def test_get(self):
+        cache = PasswordCache(clock=self.clock)
+        for settings in self.settings + self.settings:
+            self.assertEqual(cache.get(settings),
+                             generatepasswordfrom(settings))
+        self.assertEqual((cache.hits, cache.misses), (5, 5))
+
+    def test_master_password_in_key(self):
+        cache = PasswordCache(clock=self.clock)
+        settings = PwmSettings(URL="site.org", MasterPass="asdf")
+        cache.get(settings)
+        settings.MasterPass = "qwer"
+        self.assertEqual(cache.get(settings), generatepasswordfrom(settings))
+        self.assertEqual(cache.misses, 2)
+
+    def test_max_entries(self):
+        cache = PasswordCache(max_entries=3, clock=self.clock)
+        for settings in self.settings:
+            cache.get(settings)
+        self.assertEqual((len(cache), cache.evictions), (3, 2))
+        cache.get(self.settings[-1])
+        cache.get(self.settings[0])
+        self.assertEqual((cache.hits, cache.misses), (1, 6))
+
+    def test_max_bytes(self):
+        cache = PasswordCache(max_bytes=100, clock=self.clock)
+        for settings in self.settings:
+            cache.get(settings)
+        self.assertTrue(cache.size_bytes <= 100)
+        self.assertEqual(len(cache), 2)
+
+    def test_ttl(self):
+        cache = PasswordCache(ttl=10, clock=self.clock)
+        cache.get(self.settings[0])
+        self.now = 5.0
+        cache.get(self.settings[0])
+        self.now = 11.0
+        cache.get(self.settings[0])
+        self.assertEqual((cache.hits, cache.misses, cache.expirations),
+                         (1, 2, 1))
+
+    def test_wipe(self):
+        cache = PasswordCache(clock=self.clock)
+        cache.get(self.settings[0])
+        cache.wipe()
+        self.assertEqual((len(cache), cache.size_bytes), (0, 0))
+        cache.get(self.settings[0])
+        self.assertEqual(cache.misses, 2)
+
+    def test_wipe_during_get(self):
+        cache = PasswordCache(clock=self.clock)
+        key, generation = cache._get_key(self.settings[0])
+        password = generatepasswordfrom(self.settings[0])
+        cache.wipe()
+        cache._put(key, password, generation)
+        self.assertEqual(len(cache), 0)
+        self.assertNotEqual(cache.get_key(self.settings[0]), key)
+
+
+class TestAsync(unittest.TestCase):
+    """Unit test class for agenerate and agenerate_many"""
+
+    def setUp(self):
+        self.settings_list = [PwmSettings(URL="site{}.org".format(i),
+                                          MasterPass="asdf", Length=19)
+                              for i in range(50)]
+        self.settings_list[0].URL = "passwordmaker.org"
+
+    def test_agenerate(self):
+        res = asyncio.run(agenerate(self.settings_list[0]))
+        self.assertEqual(res, 'FRRHm)k+UyQiY~%Dj;h')
+
+    def test_agenerate_semaphore(self):
+        async def run():
+            semaphore = asyncio.Semaphore(2)
+            tasks = [agenerate(settings, semaphore=semaphore)
+                     for settings in self.settings_list]
+            return await asyncio.gather(*tasks)
+
+        res = asyncio.run(run())
+        self.assertEqual(res, list(generate_many(self.settings_list)))
+
+    def test_agenerate_many(self):
+        async def run(executor):
+            semaphore = asyncio.Semaphore(1)
+            return [password async for password in
+                    agenerate_many(self.settings_list, executor=executor,
+                                   semaphore=semaphore, chunk_size=7)]
+
+        with ThreadPoolExecutor(2) as executor:
+            res = asyncio.run(run(executor))
+        self.assertEqual(res, list(generate_many(self.settings_list)))
+
+    def test_agenerate_many_close(self):
+        async def run():
+            semaphore = asyncio.Semaphore(1)
+            passwords = agenerate_many(self.settings_list,
+                                       semaphore=semaphore, chunk_size=5)
+            first = await passwords.__anext__()
+            await passwords.aclose()
+            # All chunks are released after closing
+            await asyncio.wait_for(semaphore.acquire(), 1)
+            return first
+
+        self.assertEqual(asyncio.run(run()), 'FRRHm)k+UyQiY~%Dj;h')
+
+    def check_cancel_running(self, executor):
+        """Checks that a cancelled job holds the semaphore until it ends"""
+
+        started = threading.Event()
+        finish = threading.Event()
+
+        def job():
+            started.set()
+            finish.wait(5)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            semaphore = asyncio.Semaphore(1)
+            future = await _submit(loop, executor, semaphore, job)
+            self.assertTrue(started.wait(5))
+            future.cancel()
+            await asyncio.sleep(0.01)
+            self.assertTrue(semaphore.locked())
+
+            finish.set()
+            await asyncio.wait_for(semaphore.acquire(), 5)
+
+        asyncio.run(run())
+
+    def test_cancel_running_default_executor(self):
+        self.check_cancel_running(None)
+
+    def test_cancel_running(self):
+        with ThreadPoolExecutor(1) as executor:
+            self.check_cancel_running(executor)
+
+    def test_cancel_queued(self):
+        finish = threading.Event()
+        calls = []
+
+        async def run(executor):
+            loop = asyncio.get_running_loop()
+            semaphore = asyncio.Semaphore(2)
+            await _submit(loop, executor, semaphore, finish.wait, 5)
+            future = await _submit(loop, executor, semaphore,
+                                   calls.append, 1)
+            future.cancel()
+            await asyncio.wait_for(semaphore.acquire(), 5)
+            finish.set()
+
+        with ThreadPoolExecutor(1) as executor:
+            asyncio.run(run(executor))
+        self.assertEqual(calls, [])
+
+
+class TestPwmServer(unittest.TestCase):
+    """Unit test class for PwmServer and PwmClient"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        socket_path = os.path.join(self.directory, "pwm.sock")
+
+        settings_list = PwmSettingsList(
+            pwm_names=["default", "long"],
+            pwms=[PwmSettings(Length=19),
+                  PwmSettings(URL="example.org", Length=32,
+                              Username="joe")])
+        self.server = PwmServer(settings_list, "asdf", socket_path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+        while not os.path.exists(socket_path):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def test_generate(self):
+        with PwmClient(self.server.socket_path) as client:
+            res = client.generate("passwordmaker.org")
+            self.assertEqual(res, 'FRRHm)k+UyQiY~%Dj;h')
+
+            res = client.generate("passwordmaker.org", profile="long")
+            r = generatepasswordfrom(PwmSettings(URL="passwordmaker.org",
+                                                 MasterPass="asdf",
+                                                 Length=32, Username="joe"))
+            self.assertEqual(res, r)
+
+    def test_for_url(self):
+        with PwmClient(self.server.socket_path) as client:
+            self.assertEqual(client.for_url("https://mail.example.org/"),
+                             "long")
+            self.assertIsNone(client.for_url("example.net"))
+            with self.assertRaises(ValueError):
+                client._request({"for_url": 1})
+
+    def test_unknown_profile(self):
+        with PwmClient(self.server.socket_path) as client:
+            with self.assertRaises(ValueError):
+                client.generate("passwordmaker.org", profile="unknown")
+            # The connection remains usable after an error
+            res = client.generate("passwordmaker.org")
+            self.assertEqual(res, 'FRRHm)k+UyQiY~%Dj;h')
+
+    def test_concurrent_clients(self):
+        results = []
+
+        def request():
+            with PwmClient(self.server.socket_path) as client:
+                results.append(client.generate("passwordmaker.org"))
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['FRRHm)k+UyQiY~%Dj;h'] * 8)
+
+    def test_cli_client_compatible(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "passwordmaker.py")
+        options = ["-r", "example.com", "-u", "joe", "-d", "mod"]
+
+        cli = subprocess.check_output(
+            [sys.executable, script, "-m", "asdf", "-g", "19"] + options)
+        client = subprocess.check_output(
+            [sys.executable, script, "--client", "--socket",
+             self.server.socket_path] + options)
+
+        self.assertEqual(client, cli)
+        self.assertEqual(cli.decode("utf-8").strip(), generatepasswordfrom(
+            PwmSettings(URL="example.comjoemod", Username="joe",
+                        Modifier="mod", MasterPass="asdf", Length=19)))
+
+    def test_cli_client_overrides(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "passwordmaker.py")
+        options = ["-r", "example.com", "-g", "30", "-a", "sha256",
+                   "-c", "abcdef0123", "-p", "pre", "-s", "X1",
+                   "-l", "after", "-L", "3"]
+
+        cli = subprocess.check_output(
+            [sys.executable, script, "-m", "asdf"] + options)
+        client = subprocess.check_output(
+            [sys.executable, script, "--client", "--socket",
+             self.server.socket_path] + options)
+
+        self.assertEqual(client, cli)
+        self.assertEqual(len(cli.decode("utf-8").strip()), 30)
+
+        # The daemon's master password is used
+        with open(os.devnull, "w") as devnull:
+            self.assertRaises(
+                subprocess.CalledProcessError, subprocess.check_output,
+                [sys.executable, script, "--client", "--socket",
+                 self.server.socket_path, "-m", "qwer"] + options,
+                stderr=devnull)
+
+    def test_settings_overrides(self):
+        response = self.server.handle_request(
+            b'{"url": "passwordmaker.org", "settings": {"Length": "8"}}')
+        self.assertEqual(response, {"password": 'FRRHm)k+'})
+
+        for request in (b'{"settings": {"MasterPass": "qwer"}}',
+                        b'{"settings": {"Length": "x"}}',
+                        b'{"settings": {"Algorithm": "md2"}}',
+                        b'{"settings": {"Unknown": 1}}',
+                        b'{"settings": [1]}'):
+            self.assertIn("error", self.server.handle_request(request))
+
+    def test_removed_profile_file(self):
+        settings_list = PwmSettingsList(pwm_names=["default", "site"],
+                                        pwms=[PwmSettings(), PwmSettings()])
+        settings_list.save(self.directory)
+        settings_list = PwmSettingsList()
+        settings_list.load(self.directory)
+        os.remove(os.path.join(self.directory, "pwm.site.setting"))
+
+        server = PwmServer(settings_list, "asdf", self.server.socket_path)
+        self.assertIn("error", server.handle_request(b'{"profile": "site"}'))
+        self.assertIn("password", server.handle_request(b'{}'))
+
+    def test_second_server(self):
+        server = PwmServer(self.server.settings_list, "asdf",
+                           self.server.socket_path)
+        self.assertRaises(IOError, server.serve_forever)
+
+        # The running server is unaffected
+        with PwmClient(self.server.socket_path) as client:
+            self.assertEqual(client.generate("passwordmaker.org"),
+                             'FRRHm)k+UyQiY~%Dj;h')
+
+    def test_stale_socket(self):
+        socket_path = os.path.join(self.directory, "stale.sock")
+        stale_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale_socket.bind(socket_path)
+        stale_socket.close()
+
+        server = PwmServer(self.server.settings_list, "asdf", socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            while server._server is None:
+                time.sleep(0.01)
+            with PwmClient(socket_path) as client:
+                self.assertEqual(client.generate("passwordmaker.org"),
+                                 'FRRHm)k+UyQiY~%Dj;h')
+        finally:
+            server.shutdown()
+            thread.join()
+
+    def test_no_socket(self):
+        filepath = os.path.join(self.directory, "file.sock")
+        with open(filepath, "w") as outfile:
+            outfile.write("")
+
+        server = PwmServer(self.server.settings_list, "asdf", filepath)
+        self.assertRaises(IOError, server.serve_forever)
+        self.assertRaises(IOError, PwmClient, filepath)
+        self.assertTrue(os.path.exists(filepath))
+
+    def test_default_socket_path(self):
+        old_environ = dict(os.environ)
+        old_tempdir = tempfile.tempdir
+        os.environ.pop("XDG_RUNTIME_DIR", None)
+        tempfile.tempdir = self.directory
+        try:
+            socket_path = get_default_socket_path()
+            private_dir = os.path.dirname(socket_path)
+            self.assertEqual(os.path.dirname(private_dir), self.directory)
+            self.assertEqual(os.stat(private_dir).st_mode & 0o777, 0o700)
+
+            os.chmod(private_dir, 0o755)
+            self.assertRaises(IOError, get_default_socket_path)
+        finally:
+            tempfile.tempdir = old_tempdir
+            os.environ.clear()
+            os.environ.update(old_environ)
+
+    def test_on_settings_change(self):
+        with PwmClient(self.server.socket_path) as client:
+            self.assertEqual(client.for_url("example.org"), "long")
+            client.generate("passwordmaker.org", profile="long")
+
+            with self.server.settings_lock:
+                settings_list = self.server.settings_list
+                settings_list.pwms[1] = PwmSettings(URL="example.net",
+                                                    Length=5)
+                self.server.on_settings_change([], ["long"], [])
+
+            self.assertEqual(client.for_url("example.net"), "long")
+            res = client.generate("passwordmaker.org", profile="long")
+            self.assertEqual(len(res), 5)
+
+    def test_on_settings_change_concurrent(self):
+        errors = []
+        stop_event = threading.Event()
+
+        def read():
+            try:
+                while not stop_event.is_set():
+                    self.assertIsNotNone(self.server.get_url_index())
+                    self.assertIsNotNone(self.server.get_generator("long"))
+            except Exception as err:
+                errors.append(err)
+                raise
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for _ in range(500):
+            with self.server.settings_lock:
+                self.server.on_settings_change([], ["long"], [])
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+
+class TestHashBackends(unittest.TestCase):
+    """Unit tests for the hash backend registry"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.directory, "backends.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_pure_python_vectors(self):
+        for hash_name, constructor in (("md4", MD4), ("rmd160", RIPEMD160)):
+            for message, hexdigest in HASH_TEST_VECTORS[hash_name]:
+                self.assertEqual(constructor(message).hexdigest(), hexdigest)
+            self.assertTrue(check_constructor(hash_name, constructor))
+
+    def test_pure_python_rmd160_against_hashlib(self):
+        try:
+            hashlib.new("ripemd160")
+        except ValueError:
+            self.skipTest("OpenSSL provides no ripemd160")
+
+        for length in range(0, 200, 7):
+            message = os.urandom(length)
+            self.assertEqual(RIPEMD160(message).digest(),
+                             hashlib.new("ripemd160", message).digest())
+
+    def test_pure_python_hmac(self):
+        if "ripemd160" not in hashlib.algorithms_available:
+            self.skipTest("OpenSSL provides no ripemd160")
+
+        key, message = b"key", b"The quick brown fox"
+        self.assertEqual(hmac.new(key, message, RIPEMD160).digest(),
+                         hmac.new(key, message, "ripemd160").digest())
+
+    def test_all_hashes_available(self):
+        registry = HashBackendRegistry(cache_path=None)
+        for hash_name in HASH_TEST_VECTORS:
+            constructor = registry.get_constructor(hash_name)
+            self.assertTrue(check_constructor(hash_name, constructor))
+        self.assertEqual(sorted(registry.selected_backends),
+                         sorted(HASH_TEST_VECTORS))
+
+    def test_unknown_hash(self):
+        registry = HashBackendRegistry(cache_path=None)
+        self.assertRaises(ValueError, registry.get_constructor, "sha3")
+
+    def test_broken_backend_rejected(self):
+        backends = (("broken", lambda hash_name: hashlib.md5),
+                    ("python", lambda hash_name: MD4))
+        registry = HashBackendRegistry(cache_path=None, backends=backends)
+        self.assertIs(registry.get_constructor("md4"), MD4)
+        self.assertEqual(registry.selected_backends, {"md4": "python"})
+
+    def test_no_backend(self):
+        def unavailable(hash_name):
+            raise ImportError(hash_name)
+
+        registry = HashBackendRegistry(cache_path=None,
+                                       backends=(("none", unavailable),))
+        self.assertRaises(ValueError, registry.get_constructor, "md4")
+
+    def test_cache_file(self):
+        loads = []
+
+        def load(hash_name):
+            loads.append(hash_name)
+            return MD4
+
+        backends = (("python", load),
+                    ("python2", lambda hash_name: MD4))
+
+        registry = HashBackendRegistry(cache_path=self.cache_path,
+                                       backends=backends)
+        registry.get_constructor("md4")
+        backend_name = registry.selected_backends["md4"]
+        self.assertTrue(os.path.isfile(self.cache_path))
+        # The cache is written via a temporary file that is renamed
+        self.assertEqual(os.listdir(self.directory), ["backends.json"])
+
+        # A new registry only loads the cached backend
+        del loads[:]
+        backends = ((backend_name, load),
+                    ("unused", lambda hash_name: self.fail("Benchmarked")))
+        registry = HashBackendRegistry(cache_path=self.cache_path,
+                                       backends=backends)
+        self.assertIs(registry.get_constructor("md4"), MD4)
+        self.assertEqual(loads, ["md4"])
+
+
+class TestPwmSettingsStore(unittest.TestCase):
+    """Unit tests for the SQLite profile store"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = PwmSettingsStore(os.path.join(self.directory,
+                                                   "pwm.sqlite"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+        settings = PwmSettings(URL="example.org", Length=12,
+                               MasterPass="secret")
+        self.store.put("example", settings)
+
+        self.assertIn("example", self.store)
+        self.assertNotIn("other", self.store)
+        self.assertEqual(len(self.store), 1)
+        self.assertEqual(self.store.get("example"),
+                         attr.evolve(settings, MasterPass=""))
+        self.assertRaises(KeyError, self.store.get, "other")
+
+    def test_delete(self):
+        self.store.put("example", PwmSettings())
+        self.store.delete("example")
+        self.assertEqual(self.store.names(), [])
+        self.assertRaises(KeyError, self.store.delete, "example")
+
+    def test_transaction_rollback(self):
+        self.store.put("a", PwmSettings())
+
+        try:
+            with self.store.transaction():
+                self.store.put("b", PwmSettings())
+                self.store.delete("a")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertEqual(self.store.names(), ["a"])
+
+    def test_persistence(self):
+        items = [("site{}".format(i), PwmSettings(URL="site{}.org".format(i)))
+                 for i in range(100)]
+        self.store.put_many(items)
+        self.store.close()
+
+        self.store = PwmSettingsStore(os.path.join(self.directory,
+                                                   "pwm.sqlite"))
+        self.assertEqual(len(self.store), 100)
+        self.assertEqual(self.store.get("site42").URL, "site42.org")
+
+    def test_import_export(self):
+        for name in ("default", "example"):
+            PwmSettings(URL=name + ".org").save(
+                os.path.join(self.directory, "pwm.{}.setting".format(name)))
+
+        self.assertEqual(self.store.import_directory(self.directory), 2)
+        self.assertEqual(self.store.get("example").URL, "example.org")
+
+        export_directory = os.path.join(self.directory, "export")
+        os.mkdir(export_directory)
+        self.assertEqual(self.store.export_directory(export_directory), 2)
+
+        for name in ("default", "example"):
+            filename = "pwm.{}.setting".format(name)
+            with open(os.path.join(self.directory, filename)) as infile:
+                original = infile.read()
+            with open(os.path.join(export_directory, filename)) as infile:
+                self.assertEqual(infile.read(), original)
+
+    def test_settings_list(self):
+        settings_list = self.store.load_settings_list()
+        self.assertEqual(settings_list.pwm_names, ["default"])
+
+        self.store.put_many([("b", PwmSettings(URL="b")),
+                             ("default", PwmSettings(URL="d"))])
+        settings_list = self.store.load_settings_list()
+        self.assertEqual(settings_list.pwm_names, ["default", "b"])
+        self.assertEqual(settings_list.current, "default")
+        self.assertEqual(settings_list.get_pwm_settings().URL, "d")
+
+        settings_list.pwm_names.pop()
+        settings_list.pwms.pop()
+        self.store.save_settings_list(settings_list)
+        self.assertEqual(self.store.names(), ["default"])
+
+    def test_unsafe_names(self):
+        for name in ("../x", "a/b", "a\\b", "", "a\nb"):
+            with self.assertRaises(ValueError):
+                self.store.put_many([("ok", PwmSettings()),
+                                     (name, PwmSettings())])
+        self.assertEqual(len(self.store), 0)
+
+        # Names stored by earlier versions are checked on export
+        with self.store._connection:
+            self.store._connection.execute(
+                "INSERT INTO profiles VALUES (?, ?)", ("../x", "{}"))
+        export_directory = os.path.join(self.directory, "export")
+        os.mkdir(export_directory)
+        with self.assertRaises(ValueError):
+            self.store.export_directory(export_directory)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ["export", "pwm.sqlite"])
+        self.assertEqual(os.listdir(export_directory), [])
+
+
+class TestPwmSettingsList(unittest.TestCase):
+    """Unit tests for loading and saving PwmSettingsList"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name in ("default", "a", "b"):
+            PwmSettings(URL=name).save(self.get_filepath(name))
+
+        self.settings_list = PwmSettingsList()
+        self.settings_list.load(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_filepath(self, name):
+        """Returns path of the setting file of profile name"""
+
+        return os.path.join(self.directory, "pwm.{}.setting".format(name))
+
+    def get_inodes(self):
+        """Returns dict of file names and inodes in self.directory"""
+
+        return dict((filename, os.stat(os.path.join(self.directory,
+                                                    filename)).st_ino)
+                    for filename in os.listdir(self.directory))
+
+    def test_load(self):
+        self.assertEqual(self.settings_list.pwm_names, ["default", "a", "b"])
+        self.assertEqual(self.settings_list.get_pwm_settings().URL, "default")
+        self.assertEqual(self.settings_list.get_changes(), ([], []))
+
+    def test_save_changed_only(self):
+        self.settings_list.pwms[1].Length = 12
+        self.settings_list.pwms[2].MasterPass = "not saved"
+        self.assertEqual(self.settings_list.get_changes(), (["a"], []))
+
+        inodes = self.get_inodes()
+        self.settings_list.save(self.directory)
+        new_inodes = self.get_inodes()
+
+        self.assertEqual(sorted(new_inodes), sorted(inodes))
+        self.assertNotEqual(new_inodes["pwm.a.setting"],
+                            inodes["pwm.a.setting"])
+        self.assertEqual(new_inodes["pwm.b.setting"], inodes["pwm.b.setting"])
+        self.assertEqual(self.settings_list.get_changes(), ([], []))
+
+        pwm = PwmSettings()
+        pwm.load(self.get_filepath("a"))
+        self.assertEqual(pwm.Length, 12)
+
+    def test_save_added_deleted(self):
+        self.settings_list.pwm_names.append("c")
+        self.settings_list.pwms.append(PwmSettings())
+        del self.settings_list.pwm_names[1]
+        del self.settings_list.pwms[1]
+        self.assertEqual(self.settings_list.get_changes(), (["c"], ["a"]))
+
+        self.settings_list.save(self.directory)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ["pwm.b.setting", "pwm.c.setting",
+                          "pwm.default.setting"])
+
+    def test_save_other_directory(self):
+        other_directory = os.path.join(self.directory, "other")
+        os.mkdir(other_directory)
+        stale_filepath = os.path.join(other_directory, "pwm.stale.setting")
+        PwmSettings().save(stale_filepath)
+
+        self.settings_list.save(other_directory)
+        self.assertEqual(sorted(os.listdir(other_directory)),
+                         ["pwm.a.setting", "pwm.b.setting",
+                          "pwm.default.setting"])
+
+    def test_lazy_load(self):
+        with open(self.get_filepath("broken"), "w") as outfile:
+            outfile.write("{")
+
+        settings_list = PwmSettingsList()
+        settings_list.load(self.directory)
+        self.assertEqual(settings_list.pwm_names,
+                         ["default", "a", "b", "broken"])
+
+        self.assertEqual(settings_list.get_pwm_settings().URL, "default")
+        self.assertEqual([settings_list.pwms.is_loaded(i) for i in range(4)],
+                         [True, False, False, False])
+
+        self.assertEqual(settings_list.pwms[2].URL, "b")
+        self.assertRaises(ValueError, settings_list.pwms.__getitem__, 3)
+
+    def test_lazy_save(self):
+        inodes = self.get_inodes()
+        self.settings_list.pwms[2].Length = 12
+        self.settings_list.save(self.directory)
+        new_inodes = self.get_inodes()
+
+        self.assertFalse(self.settings_list.pwms.is_loaded(1))
+        self.assertEqual(new_inodes["pwm.a.setting"], inodes["pwm.a.setting"])
+        self.assertNotEqual(new_inodes["pwm.b.setting"],
+                            inodes["pwm.b.setting"])
+
+    def test_load_names(self):
+        settings_list = PwmSettingsList()
+        settings_list.load(self.directory, names=["b", "missing"])
+        self.assertEqual(settings_list.pwm_names, ["b"])
+        self.assertEqual(settings_list.get_pwm_settings().URL, "b")
+
+    def test_load_profile(self):
+        self.assertEqual(load_profile("a", self.directory).URL, "a")
+        self.assertRaises(ValueError, load_profile, "missing",
+                          self.directory)
+
+    def test_independent_instances(self):
+        settings_list = PwmSettingsList()
+        settings_list.pwm_names.append("new")
+        self.assertEqual(PwmSettingsList().pwm_names, ["default"])
+
+    def test_reload_unchanged(self):
+        pwms = list(self.settings_list.pwms[:2])
+        self.assertEqual(self.settings_list.reload(), ([], [], []))
+        self.assertIs(self.settings_list.pwms[0], pwms[0])
+        self.assertIs(self.settings_list.pwms[1], pwms[1])
+        self.assertFalse(self.settings_list.pwms.is_loaded(2))
+
+    def test_reload_changed_files(self):
+        pwms = list(self.settings_list.pwms[1:])
+        self.settings_list.current = "b"
+
+        PwmSettings(URL="new a").save(self.get_filepath("a"))
+        PwmSettings(URL="c").save(self.get_filepath("c"))
+        os.remove(self.get_filepath("default"))
+
+        self.assertEqual(self.settings_list.reload(),
+                         (["c"], ["a"], ["default"]))
+        self.assertEqual(self.settings_list.pwm_names, ["a", "b", "c"])
+        self.assertEqual(self.settings_list.pwms[0].URL, "new a")
+        self.assertIsNot(self.settings_list.pwms[0], pwms[0])
+        self.assertIs(self.settings_list.pwms[1], pwms[1])
+        self.assertEqual(self.settings_list.current, "b")
+        self.assertEqual(self.settings_list.get_changes(), ([], []))
+
+    def test_reload_unloaded(self):
+        PwmSettings(URL="new b").save(self.get_filepath("b"))
+
+        # Unloaded profiles are parsed from the new file on first access
+        self.assertEqual(self.settings_list.reload(), ([], [], []))
+        self.assertEqual(self.settings_list.pwms[2].URL, "new b")
+
+    def test_reload_keeps_local_changes(self):
+        self.settings_list.pwms[1].Length = 12
+        self.settings_list.pwm_names.append("local")
+        self.settings_list.pwms.append(PwmSettings())
+        self.settings_list.pwm_names.pop(2)
+        self.settings_list.pwms.pop(2)
+        PwmSettings(URL="new a").save(self.get_filepath("a"))
+        PwmSettings(URL="c").save(self.get_filepath("c"))
+
+        self.assertEqual(self.settings_list.reload(), (["c"], [], []))
+        self.assertEqual(self.settings_list.pwm_names,
+                         ["default", "a", "c", "local"])
+        self.assertEqual(self.settings_list.pwms[1].Length, 12)
+        self.assertEqual(self.settings_list.pwms[1].URL, "a")
+        self.assertEqual(self.settings_list.get_changes(),
+                         (["a", "local"], ["b"]))
+
+    def test_get_local_changes(self):
+        # Nothing has been edited in a new list, e.g. when the GUI starts
+        self.assertEqual(PwmSettingsList().get_local_changes(), ([], []))
+
+        for name in ("default", "a", "b"):
+            os.remove(self.get_filepath(name))
+        self.settings_list.load(self.directory)
+        self.assertEqual(self.settings_list.get_changes(), (["default"], []))
+        self.assertEqual(self.settings_list.get_local_changes(), ([], []))
+
+        self.settings_list.pwms[0].Length = 12
+        self.assertEqual(self.settings_list.get_local_changes(),
+                         (["default"], []))
+
+    def test_reload_discards_local_changes(self):
+        self.settings_list.pwms[1].Length = 12
+        self.settings_list.pwm_names.append("local")
+        self.settings_list.pwms.append(PwmSettings())
+
+        self.assertEqual(self.settings_list.reload(keep_changes=False),
+                         ([], ["a"], ["local"]))
+        self.assertEqual(self.settings_list.pwms[1].Length, 8)
+        self.assertEqual(self.settings_list.pwm_names, ["default", "a", "b"])
+
+    def test_reload_replaces_placeholder(self):
+        for name in ("default", "a", "b"):
+            os.remove(self.get_filepath(name))
+        self.settings_list.load(self.directory)
+        PwmSettings(URL="new default").save(self.get_filepath("default"))
+
+        self.assertEqual(self.settings_list.reload(), ([], ["default"], []))
+        self.assertEqual(self.settings_list.pwms[0].URL, "new default")
+
+    def test_reload_after_save(self):
+        self.settings_list.pwms[1].Length = 12
+        self.settings_list.save(self.directory)
+        pwm_a = self.settings_list.pwms[1]
+
+        self.assertEqual(self.settings_list.reload(), ([], [], []))
+        self.assertIs(self.settings_list.pwms[1], pwm_a)
+
+    def test_reload_empty_directory(self):
+        for name in ("default", "a", "b"):
+            os.remove(self.get_filepath(name))
+
+        self.assertEqual(self.settings_list.reload(),
+                         ([], [], ["a", "b"]))
+        self.assertEqual(self.settings_list.pwm_names, ["default"])
+        self.assertEqual(self.settings_list.current, "default")
+
+
+class TestPwmSettingsLoad(unittest.TestCase):
+    """Unit tests for loading PwmSettings from dicts"""
+
+    def test_load_dict(self):
+        settings = PwmSettings()
+        settings.load_dict({"URL": "example.org", "Algorithm": "sha256",
+                            "Length": 12, "UseLeet": "both",
+                            "MasterPass": "ignored", "Unknown": 1})
+
+        self.assertEqual(settings, PwmSettings(URL="example.org",
+                                               Algorithm="sha256", Length=12,
+                                               UseLeet="both"))
+
+    def test_load_dict_rollback(self):
+        invalid_dicts = [
+            ({"URL": "example.org", "Length": "12"}, TypeError),
+            ({"URL": "example.org", "Prefix": ["x"]}, TypeError),
+            ({"URL": "example.org", "Algorithm": "md6"}, ValueError),
+            ({"URL": "example.org", "UseLeet": "always"}, ValueError),
+        ]
+
+        for file_dict, error in invalid_dicts:
+            settings = PwmSettings(Length=10)
+            self.assertRaises(error, settings.load_dict, file_dict)
+            self.assertEqual(settings, PwmSettings(Length=10))
+
+    def test_compact(self):
+        charset = "".join(["0123456789", "abcdef"])
+        pwms = PwmSettings.from_dicts([{"CharacterSet": charset},
+                                       {"CharacterSet": charset[:]}])
+
+        self.assertFalse(hasattr(pwms[0], "__dict__"))
+        self.assertIs(pwms[0].CharacterSet, pwms[1].CharacterSet)
+
+    def test_from_dicts(self):
+        pwms = PwmSettings.from_dicts([{}, {"URL": "a"}, {"Length": 20}])
+        self.assertEqual(pwms, [PwmSettings(), PwmSettings(URL="a"),
+                                PwmSettings(Length=20)])
+        self.assertIsNot(pwms[0], pwms[1])
+
+        self.assertRaises(ValueError, PwmSettings.from_dicts,
+                          [{}, {"Algorithm": "md6"}])
+
+
+class TestColumnarPwmSettingsList(unittest.TestCase):
+    """Unit tests for ColumnarPwmSettingsList"""
+
+    def setUp(self):
+        self.pwms = [PwmSettings(),
+                     PwmSettings(URL="a", Algorithm="hmac-sha256", Length=20,
+                                 CharacterSet="0123456789", UseLeet="both",
+                                 LeetLvl=5),
+                     PwmSettings(URL="b", CharacterSet="0123456789")]
+        self.settings_list = PwmSettingsList(pwm_names=["default", "a", "b"],
+                                             pwms=self.pwms)
+
+    def test_round_trip(self):
+        columnar = ColumnarPwmSettingsList.from_settings_list(
+            self.settings_list)
+
+        self.assertEqual(len(columnar.pwms), 3)
+        self.assertEqual(list(columnar.pwms), self.pwms)
+        self.assertEqual(columnar.get_pwm_settings(), self.pwms[0])
+        self.assertEqual(columnar.to_settings_list(), self.settings_list)
+
+    def test_modify(self):
+        columnar = ColumnarPwmSettingsList.from_settings_list(
+            self.settings_list)
+
+        columnar.pwms[1] = PwmSettings(URL="c", Algorithm="rmd160")
+        self.assertEqual(columnar.pwms[1].Algorithm, "rmd160")
+
+        del columnar.pwms[0]
+        columnar.pwms.insert(2, PwmSettings(URL="d"))
+        self.assertEqual([pwm.URL for pwm in columnar.pwms], ["c", "b", "d"])
+
+    def test_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            self.settings_list.save(directory)
+
+            settings_list = PwmSettingsList()
+            settings_list.load(directory)
+            columnar = ColumnarPwmSettingsList()
+            columnar.load(directory)
+
+            self.assertEqual(columnar.pwm_names, settings_list.pwm_names)
+            self.assertEqual(list(columnar.pwms), list(settings_list.pwms))
+            self.assertEqual(columnar.current, "default")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_from_dicts(self):
+        columnar = ColumnarPwmSettingsList.from_dicts(
+            ["x", "y"], [{"URL": "x"}, {"URL": "y", "Length": 3}])
+        self.assertEqual(list(columnar.pwms), [PwmSettings(URL="x"),
+                                               PwmSettings(URL="y",
+                                                           Length=3)])
+
+        self.assertRaises(ValueError, ColumnarPwmSettingsList.from_dicts,
+                          ["x"], [{"UseLeet": "always"}])
+
+    def test_from_dicts_empty(self):
+        columnar = ColumnarPwmSettingsList.from_dicts([], [])
+        self.assertEqual(columnar.pwm_names, ["default"])
+        self.assertEqual(columnar.current, "default")
+        self.assertEqual(list(columnar.pwms), [PwmSettings()])
+
+    def test_shared_schema(self):
+        schema = pwmlib._SETTINGS_SCHEMA
+        pwmlib._SETTINGS_SCHEMA = tuple(
+            (name, value_type, options,
+             shared or name in ("URL", "Length"))
+            for name, value_type, options, shared in schema)
+        try:
+            columnar = ColumnarPwmSettingsList.from_settings_list(
+                self.settings_list)
+            self.assertEqual(list(columnar.pwms), self.pwms)
+
+            columnar.pwms.append(PwmSettings(URL="a", Length=20))
+            tables = dict(zip([field[0] for field in schema],
+                              columnar.pwms._tables))
+            self.assertEqual(tables["URL"][0], ["", "a", "b"])
+            self.assertEqual(tables["Length"][0], [8, 20])
+            self.assertEqual(columnar.pwms[3].Length, 20)
+        finally:
+            pwmlib._SETTINGS_SCHEMA = schema
+
+    def test_server(self):
+        columnar = ColumnarPwmSettingsList.from_settings_list(
+            self.settings_list)
+        server = PwmServer(columnar, "asdf", socket_path="unused")
+        response = server.handle_request(b'{"profile": "a", "url": "x"}')
+
+        settings = attr.evolve(self.pwms[1], URL="x", MasterPass="asdf")
+        self.assertEqual(response["password"],
+                         generatepasswordfrom(settings))
+
+
+class TestUrlIndex(unittest.TestCase):
+    """Unit tests for UrlIndex"""
+
+    def setUp(self):
+        self.url_index = UrlIndex()
+        for pattern, name in [("example.org", "example"),
+                              ("*.example.org", "wildcard"),
+                              ("https://mail.example.org:8443/in", "mail"),
+                              ("mail.example.org", "mail2"),
+                              ("192.168.1.1", "router")]:
+            self.url_index.add(pattern, name)
+
+    def test_get_labels(self):
+        self.assertEqual(get_labels("https://Mail.Example.org.:80/a?b"),
+                         ["org", "example", "mail"])
+        self.assertEqual(get_labels("10.0.0.1"), ["10.0.0.1"])
+        self.assertEqual(get_labels(""), [])
+
+    def test_lookup(self):
+        lookup = self.url_index.lookup
+        self.assertEqual(lookup("example.org"), "example")
+        self.assertEqual(lookup("http://www.example.org/"), "wildcard")
+        self.assertEqual(lookup("mail.example.org"), "mail")
+        self.assertEqual(lookup("a.b.mail.example.org"), "mail")
+        self.assertEqual(lookup("http://192.168.1.1/"), "router")
+        self.assertIsNone(lookup("1.1"))
+        self.assertIsNone(lookup("example.com"))
+        self.assertIsNone(lookup(""))
+
+    def test_lookup_all(self):
+        self.assertEqual(self.url_index.lookup_all("mail.example.org"),
+                         ["mail", "mail2", "wildcard", "example"])
+
+    def test_remove(self):
+        self.url_index.remove("mail.example.org", "mail")
+        self.url_index.remove("mail.example.org", "mail2")
+        self.assertEqual(len(self.url_index), 3)
+        self.assertEqual(self.url_index.lookup("mail.example.org"),
+                         "wildcard")
+        self.assertRaises(KeyError, self.url_index.remove,
+                          "mail.example.org", "mail")
+
+    def test_from_settings_list(self):
+        settings_list = PwmSettingsList(
+            pwm_names=["default", "a", "b"],
+            pwms=[PwmSettings(), PwmSettings(URL="a.org"),
+                  PwmSettings(URL="b.a.org")])
+        url_index = UrlIndex.from_settings_list(settings_list)
+
+        self.assertEqual(len(url_index), 2)
+        self.assertEqual(url_index.lookup("x.b.a.org"), "b")
+        self.assertEqual(url_index.lookup("x.a.org"), "a")
+
+
+class TestStream(unittest.TestCase):
+    """Unit tests for passwordmaker.stream"""
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.directory)
+
+    def test_cli_compatible(self):
+        infile = io.StringIO(u'{"URL": "example.com", "Username": "joe"}\n'
+                             u'{"URL": "example.com"}\n')
+        outfile = io.StringIO()
+        stream("jsonl", "asdf", infile=infile, outfile=outfile)
+
+        # Same passwords as passwordmaker -m asdf -r example.com [-u joe]
+        self.assertEqual(outfile.getvalue(),
+                         '{"password": "Ka$?M-+~"}\n'
+                         '{"password": "' +
+                         generatepassword("md5", "asdf", "example.com", 8,
+                                          FULL_CHARSET) + '"}\n')
+
+    def test_csv(self):
+        infile = io.StringIO(u'URL,Username,Length\n'
+                             u'example.com,joe,\n'
+                             u'example.com,,x\n'
+                             u'example.com,joe,8\n')
+        outfile = io.StringIO()
+        n_errors = stream("csv", "asdf", infile=infile, outfile=outfile)
+
+        # Empty cells keep the defaults, invalid rows do not stop the stream
+        lines = outfile.getvalue().splitlines()
+        self.assertEqual(n_errors, 1)
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0], "Ka$?M-+~")
+        self.assertTrue(lines[1].startswith(",Row 2: "))
+        self.assertEqual(lines[2], "Ka$?M-+~")
+
+    def test_invalid_rows(self):
+        infile = io.StringIO(u'{"URL": 5}\n'
+                             u'[]\n'
+                             u'{\n'
+                             u'{"URL": "example.com", "Username": "joe"}\n'
+                             u'{"CharacterSet": "a"}\n')
+        outfile = io.StringIO()
+        n_errors = stream("jsonl", "asdf", infile=infile, outfile=outfile,
+                          normalize_urls=True)
+
+        results = [json.loads(line)
+                   for line in outfile.getvalue().splitlines()]
+        self.assertEqual(n_errors, 4)
+        self.assertEqual(len(results), 5)
+        for row_no in (1, 2, 3, 5):
+            self.assertTrue(results[row_no - 1]["error"].startswith(
+                "Row {}: ".format(row_no)))
+        self.assertEqual(results[3], {"password": "Ka$?M-+~"})
+
+
+class TestCliProfile(unittest.TestCase):
+    """Unit tests for the --profile option of passwordmaker.py"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.script = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "passwordmaker.py")
+        settings_list = PwmSettingsList(
+            pwm_names=["default", "site"],
+            pwms=[PwmSettings(),
+                  PwmSettings(URL="example.com", Length=12, UseLeet="after",
+                              LeetLvl=2, Prefix="pre")])
+        settings_list.save(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_cli(self, *options):
+        """Returns output of passwordmaker.py in the profile directory"""
+
+        return subprocess.check_output(
+            [sys.executable, self.script, "-m", "asdf"] + list(options),
+            cwd=self.directory)
+
+    def test_profile_values(self):
+        self.assertEqual(
+            self.run_cli("--profile", "site"),
+            self.run_cli("-r", "example.com", "-g", "12", "-l", "after",
+                         "-L", "3", "-p", "pre"))
+
+    def test_explicit_options(self):
+        self.assertEqual(
+            self.run_cli("--profile", "site", "-g", "20", "-L", "1",
+                         "-r", "example.org"),
+            self.run_cli("-r", "example.org", "-g", "20", "-l", "after",
+                         "-L", "1", "-p", "pre"))
+
+
+class TestUrlNormalization(unittest.TestCase):
+    """Unit tests for URL normalization"""
+
+    def test_get_host(self):
+        self.assertEqual(get_host("https://u@Mail.Example.org.:80/a?b"),
+                         "mail.example.org")
+        self.assertEqual(get_host(u"http://b\xfccher.de/"),
+                         "xn--bcher-kva.de")
+        self.assertEqual(get_host("[::1]:8080"), "::1")
+        self.assertEqual(get_host(""), "")
+
+    def test_compile_suffix_list(self):
+        lines = [u"// comment", u"", u"uk", u"co.uk", u"*.ck", u"!www.ck",
+                 u"\u516c\u53f8.cn  // rest"]
+        rules = compile_suffix_list(lines)
+        self.assertEqual(rules, ["!www.ck", "*.ck", "co.uk", "uk",
+                                 "xn--55qx5d.cn"])
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            filepath = os.path.join(tempdir, "suffixes.txt")
+            save_suffix_list(rules, filepath)
+            self.assertEqual(load_suffix_table(filepath),
+                             ({"co.uk", "uk", "xn--55qx5d.cn"}, {"ck"},
+                              {"www.ck"}))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_normalize_url(self):
+        for url, domain in [
+                ("https://user@mail.example.co.uk:8443/login?n=/",
+                 "example.co.uk"),
+                ("www.example.org", "example.org"),
+                ("example.org", "example.org"),
+                ("co.uk", "co.uk"),
+                ("a.b.c.ck", "b.c.ck"),
+                ("a.www.ck", "www.ck"),
+                ("foo.blogspot.com", "foo.blogspot.com"),
+                ("a.foo.blogspot.com", "foo.blogspot.com"),
+                ("host.unknowntld", "host.unknowntld"),
+                ("localhost", "localhost"),
+                ("http://192.168.1.1:80/", "192.168.1.1"),
+                (u"https://www.b\xfccher.de", "xn--bcher-kva.de"),
+                ("", "")]:
+            self.assertEqual(normalize_url(url), domain)
+
+    def test_normalize_rows(self):
+        rows = [{"URL": "https://mail.example.org/", "Length": "8"},
+                {"Length": "9"}]
+        self.assertEqual(list(normalize_rows(rows)),
+                         [{"URL": "example.org", "Length": "8"},
+                          {"Length": "9"}])
+
+
+class TestPwmSettingsWatcher(unittest.TestCase):
+    """Unit tests for PwmSettingsWatcher"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        PwmSettings(URL="a").save(os.path.join(self.directory,
+                                               "pwm.a.setting"))
+
+        self.settings_list = PwmSettingsList()
+        self.settings_list.load(self.directory)
+
+        self.changes = []
+        self.changed = threading.Event()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def on_change(self, added, changed, removed):
+        """Records changes"""
+
+        self.changes.append((added, changed, removed))
+        self.changed.set()
+
+    def check_watcher(self, use_inotify):
+        """Checks that a new and a changed profile are reloaded"""
+
+        watcher = PwmSettingsWatcher(self.settings_list, self.directory,
+                                     interval=0.01, on_change=self.on_change,
+                                     use_inotify=use_inotify)
+        with watcher:
+            if use_inotify is None and not watcher.uses_inotify:
+                self.skipTest("inotify is unavailable")
+
+            PwmSettings(URL="b").save(os.path.join(self.directory,
+                                                   "pwm.b.setting"))
+            self.assertTrue(self.changed.wait(5))
+
+        self.assertEqual(self.changes, [(["b"], [], [])])
+        self.assertEqual(self.settings_list.pwm_names, ["a", "b"])
+        self.assertEqual(self.settings_list.pwms[1].URL, "b")
+
+    def test_polling(self):
+        self.check_watcher(False)
+
+    def test_inotify(self):
+        self.check_watcher(None)
+
+    def test_error_keeps_watching(self):
+        def on_change(added, changed, removed):
+            if not self.changes:
+                self.changes.append(None)
+                raise RuntimeError("on_change failed")
+            self.on_change(added, changed, removed)
+
+        watcher = PwmSettingsWatcher(self.settings_list, self.directory,
+                                     interval=0.01, on_change=on_change,
+                                     use_inotify=False)
+        with self.assertLogs("pwmwatch", "ERROR"):
+            with watcher:
+                PwmSettings(URL="b").save(os.path.join(self.directory,
+                                                       "pwm.b.setting"))
+                while not self.changes:
+                    time.sleep(0.01)
+
+                PwmSettings(URL="c").save(os.path.join(self.directory,
+                                                       "pwm.c.setting"))
+                self.assertTrue(self.changed.wait(5))
+
+        self.assertEqual(self.changes, [None, (["c"], [], [])])
+        self.assertEqual(self.settings_list.pwm_names, ["a", "b", "c"])
+
+
+class TestPwmStats(unittest.TestCase):
+    """Unit tests for the instrumentation with PwmStats"""
+
+    def setUp(self):
+        self.hook_calls = []
+        self.stats = enable_stats(PwmStats(hooks=[self.on_record]))
+
+    def tearDown(self):
+        disable_stats()
+
+    def on_record(self, stage, nanoseconds):
+        """Hook that records stages"""
+
+        self.hook_calls.append(stage)
+
+    def test_generatepassword(self):
+        r = generatepassword("md5", "asdf", "passwordmaker.org", 40,
+                             FULL_CHARSET, use_leet="before", leet_level=2)
+        disable_stats()
+        self.assertEqual(r, generatepassword("md5", "asdf",
+                                             "passwordmaker.org", 40,
+                                             FULL_CHARSET, use_leet="before",
+                                             leet_level=2))
+
+        stats_dict = self.stats.get_dict()
+        calls = dict((stage, stage_dict["calls"])
+                     for stage, stage_dict in stats_dict["stages"].items())
+        self.assertEqual(calls, {"setup": 1, "leet": 2, "generate": 1,
+                                 "hash": 3, "rstr2any": 3})
+        self.assertEqual(stats_dict["rounds"], {3: 1})
+        self.assertTrue(all(stage_dict["nanoseconds"] >= 0
+                            for stage_dict in stats_dict["stages"].values()))
+        self.assertEqual(len(self.hook_calls), 10)
+        self.assertIn("hash rounds per password: mean 3.00 (3: 1)",
+                      self.stats.format())
+
+    def test_profile_io(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            filepath = os.path.join(tempdir, "pwm.default.setting")
+            PwmSettings().save(filepath)
+            PwmSettings().load(filepath)
+        finally:
+            shutil.rmtree(tempdir)
+
+        self.assertEqual(self.stats.calls, {"profile-write": 1,
+                                            "profile-read": 1})
+
+    def test_disabled(self):
+        disable_stats()
+        self.assertIsNone(get_stats())
+
+        hash_state = PwmHashState("md5", "asdf", FULL_CHARSET)
+        self.assertNotIn("generate", vars(hash_state))
+        hash_state.generate("passwordmaker.org", 8)
+        self.assertEqual(self.stats.calls, {})
+
+    def test_reset(self):
+        generatepassword("md5", "asdf", "passwordmaker.org", 8, FULL_CHARSET)
+        self.stats.reset()
+        self.assertEqual(self.stats.get_dict(), {"stages": {}, "rounds": {}})
+
+
+class TestPwmProfile(unittest.TestCase):
+    """Unit tests for the profiling workload"""
+
+    def setUp(self):
+        self.workload = Workload(n_passwords=30, n_profiles=5,
+                                 algorithms=parse_weights("md5:2,hmac-sha1"),
+                                 lengths=parse_weights("8,40", int),
+                                 leet_fraction=0.5, seed=1)
+
+    def test_parse_weights(self):
+        self.assertEqual(parse_weights("md5:3, sha1"),
+                         [("md5", 3.0), ("sha1", 1.0)])
+        self.assertEqual(parse_weights("8,16:0.5", int),
+                         [(8, 1.0), (16, 0.5)])
+        self.assertRaises(ValueError, parse_weights, "md5:0")
+        self.assertRaises(ValueError, Workload,
+                          algorithms=parse_weights("md6"))
+
+    def test_get_profiles(self):
+        profiles = self.workload.get_profiles()
+        self.assertEqual(profiles, self.workload.get_profiles())
+        self.assertEqual(len(profiles), 5)
+        for pwm in profiles:
+            self.assertIn(pwm.Algorithm, ("md5", "hmac-sha1"))
+            self.assertIn(pwm.Length, (8, 40))
+
+    def test_profile_workload_backend_selection(self):
+        # A fresh registry benchmarks the backends before the profiled run
+        registry = pwmhash.HASH_BACKEND_REGISTRY
+        pwmhash.HASH_BACKEND_REGISTRY = HashBackendRegistry(cache_path=None)
+        try:
+            stats, _ = profile_workload(self.workload)
+        finally:
+            pwmhash.HASH_BACKEND_REGISTRY = registry
+
+        funcnames = set(func[2] for func in stats.stats)
+        self.assertIn("generate", funcnames)
+        self.assertNotIn("_select", funcnames)
+
+    def test_profile_workload(self):
+        stats, wall_time = profile_workload(self.workload)
+        self.assertGreater(wall_time, 0)
+
+        funcnames = set(func[2] for func in stats.stats)
+        self.assertTrue(set(["generate", "rstr2any", "load"]) <= funcnames)
+
+        stacks = get_collapsed_stacks(stats)
+        rstr2any_stacks = [stack for stack in stacks
+                           if "rstr2any (pwmlib.py:" in stack]
+        self.assertTrue(rstr2any_stacks)
+        self.assertTrue(all(stack.startswith("run (pwmprofile.py:")
+                            for stack in rstr2any_stacks))
+        self.assertAlmostEqual(sum(stacks.values()) / 1e6, stats.total_tt,
+                               delta=0.01 * stats.total_tt + 1e-4)
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            filepath = os.path.join(tempdir, "stacks.txt")
+            save_collapsed_stacks(stacks, filepath)
+            with open(filepath) as infile:
+                lines = infile.read().splitlines()
+        finally:
+            shutil.rmtree(tempdir)
+
+        self.assertEqual(len(lines), len(stacks))
+        stack, value = lines[0].rsplit(" ", 1)
+        self.assertEqual(stacks[stack], int(value))
+
+
 if __name__ == '__main__':
     unittest.main()